@@ -0,0 +1,37 @@
+"""ingredient name trigram index
+
+Revision ID: 9f3c6a1d7e52
+Revises: 4b8e1f2a9c3d
+Create Date: 2026-01-16 21:40:09.774310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f3c6a1d7e52'
+down_revision: Union[str, Sequence[str], None] = '4b8e1f2a9c3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Indeks dla backendu wyszukiwania "pg_trgm" (similarity, %, ILIKE '%...%')
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_ingredients_name_trgm',
+        'ingredients',
+        ['name'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ingredients_name_trgm', table_name='ingredients')
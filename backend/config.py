@@ -20,6 +20,29 @@ class Settings(BaseSettings):
     database_echo: bool = False
 
     
+    # Wyszukiwanie składników: "memory" (indeks w procesie) lub "pg_trgm"
+    ingredient_search_backend: str = "memory"
+
+    # Binarny snapshot katalogu składników (mmap w workerach), None = wyłączony
+    catalog_snapshot_path: str | None = None
+
+    # Przeliczanie szablonów/posiłków po zmianie składnika:
+    # "sync" (w tej samej transakcji) lub "background" (kolejka + worker)
+    nutrition_invalidation_mode: str = "sync"
+    nutrition_invalidation_batch_size: int = 500
+
+    # Przeliczanie planów po nowych danych fizycznych (kolejka w tle)
+    recalculation_workers: int = 2
+    recalculation_batch_days: int = 50  # dni na transakcję
+
+    # Cache wyników planera (klucz: skwantowane cele, sloty, wersja katalogu, seed)
+    plan_cache_enabled: bool = True
+    plan_cache_max_mb: int = 64
+
+    # Cache profili makro (BMR, TDEE, makro, podział na posiłki) per user
+    macro_profile_cache_size: int = 100_000  # profili w pamięci
+    macro_profile_persist: bool = True  # tabela user_macro_profiles
+
     # CORS
     cors_origins: list[str] = ["http://localhost:3000"]
 
@@ -1,3 +1,3 @@
-from cruds import user
+from cruds import user, diet
 
-__all__ = ["user"]
\ No newline at end of file
+__all__ = ["user", "diet"]
\ No newline at end of file
@@ -0,0 +1,64 @@
+from datetime import date
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+from models.diet import DietPlan, DailyPlan
+from models.meal import Meal, MealIngredient
+
+
+# Profile ładowania grafu DietPlan -> DailyPlan -> Meal -> MealIngredient -> Ingredient.
+# Ilości bazowe są zapisane w wierszach (quantity_base), więc Ingredient.units nie jest potrzebne.
+DIET_PLAN_PROFILES = {
+    # Plan + lista dni (bez posiłków)
+    "summary": (
+        selectinload(DietPlan.daily_plans),
+    ),
+    # Cały plan z posiłkami i składnikami
+    "full_plan": (
+        selectinload(DietPlan.daily_plans)
+        .selectinload(DailyPlan.meals)
+        .selectinload(Meal.meal_ingredients)
+        .joinedload(MealIngredient.ingredient),
+    ),
+}
+
+DAILY_PLAN_PROFILES = {
+    # Jeden dzień z posiłkami i składnikami
+    "full_day": (
+        selectinload(DailyPlan.meals)
+        .selectinload(Meal.meal_ingredients)
+        .joinedload(MealIngredient.ingredient),
+    ),
+}
+
+def get_diet_plan(db: Session, plan_id: int, profile: str = "summary") -> DietPlan | None:
+    """Pobierz plan diety z danym profilem ładowania."""
+    stmt = select(DietPlan).where(DietPlan.id == plan_id).options(*DIET_PLAN_PROFILES[profile])
+    return db.execute(stmt).scalar_one_or_none()
+
+
+def get_diet_plan_owner(db: Session, plan_id: int) -> int | None:
+    """Id właściciela planu (jedno zapytanie, bez ładowania planu)."""
+    return db.execute(select(DietPlan.user_id).where(DietPlan.id == plan_id)).scalar_one_or_none()
+
+
+def get_diet_plans(db: Session, user_id: int) -> list[DietPlan]:
+    """Pobierz plany użytkownika (profil summary)."""
+    stmt = (
+        select(DietPlan)
+        .where(DietPlan.user_id == user_id)
+        .order_by(DietPlan.created_at.desc())
+        .options(*DIET_PLAN_PROFILES["summary"])
+    )
+    return list(db.execute(stmt).scalars().all())
+
+
+def get_daily_plan(db: Session, plan_id: int, day: date, profile: str = "full_day") -> DailyPlan | None:
+    """Pobierz dzień planu po dacie."""
+    stmt = (
+        select(DailyPlan)
+        .where(DailyPlan.diet_plan_id == plan_id, DailyPlan.date == day)
+        .options(*DAILY_PLAN_PROFILES[profile])
+    )
+    return db.execute(stmt).scalar_one_or_none()
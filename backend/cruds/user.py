@@ -1,8 +1,8 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
-from models.user import User
-from schemas.user import UserCreate, UserUpdate
+from models.user import PhysicalData, User
+from schemas.user import PhysicalDataCreate, UserCreate, UserUpdate
 
 
 def get_user(db: Session, user_id: int) -> User | None:
@@ -59,4 +59,13 @@ def update_user(db: Session, db_user: User, user_update: UserUpdate) -> User:
 def delete_user(db: Session, db_user: User) -> None:
     """Usuń usera."""
     db.delete(db_user)
-    db.commit()
\ No newline at end of file
+    db.commit()
+
+
+def create_physical_data(db: Session, user_id: int, data: PhysicalDataCreate) -> PhysicalData:
+    """Zapisz nowy pomiar (commit kolejkuje przeliczenie planów - services.recalculation)."""
+    db_data = PhysicalData(user_id=user_id, **data.model_dump())
+    db.add(db_data)
+    db.commit()
+    db.refresh(db_data)
+    return db_data
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 from config import settings
@@ -25,5 +27,35 @@ def get_db():
         yield db
     finally:
         db.close()
-        
-        
+
+
+class QueryCounter:
+    """Zbiera zapytania SQL wykonane na silniku (do testów profili ładowania)."""
+
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(bind=engine):
+    """
+    Policz zapytania wykonane w bloku.
+
+    with count_queries() as counter:
+        ...
+    assert counter.count == 3
+    """
+    counter = QueryCounter()
+    event.listen(bind, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(bind, "before_cursor_execute", counter)
+
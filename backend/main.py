@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from config import settings
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
@@ -5,14 +7,39 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from models import *
 
-from routers import user_router
+from routers import user_router, ingredient_router, diet_router
 from auth import auth_router 
+from database import SessionLocal
+from services.catalog_snapshot import get_catalog_snapshot
+from services.ingredient_search import get_search_backend
+from services.nutrition_invalidation import dirty_queue
+from services.plan_generation import shutdown_pool
+from services.recalculation import recalculation_queue
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Katalog z mapowanego snapshotu przy starcie workera, nie przy pierwszym wyszukiwaniu
+    get_catalog_snapshot()
+    with SessionLocal() as session:
+        get_search_backend(session)
+
+    # Wątki w tle startują z aplikacją, nie przy imporcie modułu (testy, narzędzia CLI)
+    stops = [recalculation_queue.start_workers(settings.recalculation_workers)]
+    if settings.nutrition_invalidation_mode == "background":
+        stops.append(dirty_queue.start_worker(settings.nutrition_invalidation_batch_size))
+    yield
+    for stop in stops:
+        stop.set()
+    shutdown_pool()
+
 
 app = FastAPI(
     title=settings.app_name,
     description="API do zarządzania dietą",
     debug=settings.debug,
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.include_router(user_router)
@@ -30,6 +57,8 @@ app.add_middleware(
 # Rejestracja routerów
 app.include_router(auth_router)
 app.include_router(user_router)
+app.include_router(ingredient_router)
+app.include_router(diet_router)
 
 
 @app.get("/")
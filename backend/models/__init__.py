@@ -1,5 +1,5 @@
 # Import wszystkich modeli - ważne dla Alembic i relacji
-from models.user import User, PhysicalData
+from models.user import User, PhysicalData, UserMacroProfile
 from models.diet import DietPlan, DailyPlan, DietGoal
 from models.meal import Meal, MealIngredient, MealTemplate, MealTemplateIngredient
 from models.ingredient import Ingredient, IngredientCategory, IngredientUnit
@@ -7,6 +7,7 @@ from models.ingredient import Ingredient, IngredientCategory, IngredientUnit
 __all__ = [
     "User",
     "PhysicalData",
+    "UserMacroProfile",
     "DietPlan",
     "DailyPlan",
     "DietGoal",
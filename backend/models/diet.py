@@ -1,8 +1,9 @@
+import math
 from datetime import date, datetime
 from typing import Optional, TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, String, func
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import ForeignKey, String, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, Session, mapped_column, relationship
 import enum
 
 from database import Base
@@ -10,6 +11,7 @@ from database import Base
 if TYPE_CHECKING:
     from models.user import User
     from models.meal import Meal
+    from services.ingredient_matrix import IngredientMatrix
 
 class DietGoal(str, enum.Enum):
     WEIGHT_LOSS = "weight_loss"
@@ -69,6 +71,9 @@ class DietPlan(Base):
 
 class DailyPlan(Base):
     __tablename__ = "daily_plans"
+    __table_args__ = (
+        UniqueConstraint('diet_plan_id', 'date', name='uq_daily_plan_date'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     diet_plan_id: Mapped[int] = mapped_column(ForeignKey("diet_plans.id"))
@@ -81,7 +86,8 @@ class DailyPlan(Base):
     target_fats: Mapped[float]
 
     # Rzeczywiste wartości (sum z meals)
-    actual_calories: Mapped[int] = mapped_column(default=0)
+    actual_calories: Mapped[int] = mapped_column(default=0)  # round_calories(actual_calories_exact)
+    actual_calories_exact: Mapped[float] = mapped_column(default=0.0)  # dokładna suma kalorii posiłków
     actual_protein: Mapped[float] = mapped_column(default=0.0)
     actual_carbs: Mapped[float] = mapped_column(default=0.0)
     actual_fats: Mapped[float] = mapped_column(default=0.0)
@@ -113,9 +119,66 @@ class DailyPlan(Base):
         """Procent zrealizowanych kalorii"""
         return (self.actual_calories / self.target_calories * 100) if self.target_calories > 0 else 0
 
-    def calculate_totals(self) -> None:
-        """Przelicz sumę z meals"""
-        self.actual_calories = int(sum(m.calories for m in self.meals))
+    def calculate_totals(self, matrix: Optional["IngredientMatrix"] = None) -> None:
+        """
+        Przelicz sumę z meals.
+
+        Z `matrix` przelicza też posiłki (jednym iloczynem macierz-wektor)
+        i wypełnia mikroskładniki: fiber, sodium, cholesterol.
+        """
+        if matrix is not None:
+            matrix.apply_to_daily_plans([self])
+            return
+
+        self.set_calories(sum(m.calories for m in self.meals))
         self.actual_protein = sum(m.protein for m in self.meals)
         self.actual_carbs = sum(m.carbs for m in self.meals)
-        self.actual_fats = sum(m.fats for m in self.meals)
\ No newline at end of file
+        self.actual_fats = sum(m.fats for m in self.meals)
+        self.actual_fiber = sum(m.fiber for m in self.meals)
+
+    # ---------------- Zmiany przyrostowe ----------------
+    def set_calories(self, calories: float) -> None:
+        """Dokładna suma kalorii i jej jedno zaokrąglenie do actual_calories"""
+        self.actual_calories_exact = calories
+        self.actual_calories = round_calories(calories)
+
+    def apply_nutrition_delta(self, delta: dict[str, float]) -> None:
+        """
+        Dodaj różnicę z posiłku (kolumny cache Meal) do actual_*.
+
+        Kalorie sumowane są w actual_calories_exact, a actual_calories
+        zaokrąglane raz z tej sumy - błędy zaokrągleń się nie kumulują.
+        """
+        self.set_calories((self.actual_calories_exact or 0.0) + delta.get("calories", 0.0))
+        self.actual_protein = (self.actual_protein or 0.0) + delta.get("protein", 0.0)
+        self.actual_carbs = (self.actual_carbs or 0.0) + delta.get("carbs", 0.0)
+        self.actual_fats = (self.actual_fats or 0.0) + delta.get("fats", 0.0)
+        self.actual_fiber = (self.actual_fiber or 0.0) + delta.get("fiber", 0.0)
+
+    def add_meal(self, meal: "Meal") -> None:
+        """Dodaj posiłek i dolicz tylko jego wartości"""
+        meal.daily_plan = self  # backref nie ładuje całej kolekcji meals
+        session = Session.object_session(self)
+        if session is not None:
+            session.add(meal)  # bez backref cascade
+        self.apply_nutrition_delta(_meal_values(meal))
+
+    def remove_meal(self, meal: "Meal") -> None:
+        """Usuń posiłek i odejmij tylko jego wartości"""
+        self.apply_nutrition_delta({key: -value for key, value in _meal_values(meal).items()})
+        meal.daily_plan = None  # delete-orphan usunie wiersz przy flush
+
+
+def round_calories(calories: float) -> int:
+    """actual_calories z dokładnej sumy: połówki w górę (jak floor(x + 0.5) w services.nutrition_recompute)"""
+    return math.floor(calories + 0.5)
+
+
+def _meal_values(meal: "Meal") -> dict[str, float]:
+    return {
+        "calories": meal.calories or 0.0,
+        "protein": meal.protein or 0.0,
+        "carbs": meal.carbs or 0.0,
+        "fats": meal.fats or 0.0,
+        "fiber": meal.fiber or 0.0,
+    }
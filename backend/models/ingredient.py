@@ -38,6 +38,9 @@ class Ingredient(Base):
     sodium: Mapped[float] = mapped_column(default=0.0)
     cholesterol: Mapped[float] = mapped_column(default=0.0)
 
+    # Hash treści wiersza źródłowego (CIQUAL) - do importu przyrostowego
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+
     # Relacje
     category: Mapped["IngredientCategory"] = relationship(back_populates="ingredients")
     user: Mapped[Optional["User"]] = relationship(back_populates="custom_ingredients")
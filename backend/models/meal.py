@@ -1,15 +1,32 @@
 from datetime import time, datetime
 from typing import Optional, TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, String, UniqueConstraint, func
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import (
+    ForeignKey, String, UniqueConstraint, and_, case, event, false, func, inspect, select, update,
+)
+from sqlalchemy.orm import Mapped, Session, mapped_column, relationship, validates
 
 from database import Base
+from models.ingredient import Ingredient, IngredientUnit
 
 if TYPE_CHECKING:
     from models.diet import DailyPlan
-    from models.ingredient import Ingredient
     from models.user import User
+    from services.ingredient_matrix import IngredientMatrix
+
+
+def resolve_base_quantity(ingredient: "Ingredient", quantity: float, unit: str) -> float:
+    """Przelicz ilość na jednostkę bazową składnika (liniowe szukanie w ingredient.units)"""
+    if unit == ingredient.base_unit:
+        return quantity
+
+    # Szukaj konwersji
+    for alt_unit in ingredient.units:
+        if alt_unit.unit_name == unit:
+            if ingredient.base_unit == "g":
+                return quantity * alt_unit.gram_equivalent
+
+    return quantity
 
 
 class MealTemplate(Base):
@@ -57,8 +74,12 @@ class MealTemplate(Base):
         """Czy szablon jest globalny (systemowy)"""
         return self.user_id is None
 
-    def calculate_nutrition(self) -> None:
-        """Przelicz wartości odżywcze z template_ingredients"""
+    def calculate_nutrition(self, matrix: Optional["IngredientMatrix"] = None) -> None:
+        """Przelicz wartości odżywcze z template_ingredients (wektorowo, jeśli podano matrix)"""
+        if matrix is not None:
+            matrix.apply_to_templates([self])
+            return
+
         self.calories = sum(ti.total_calories for ti in self.template_ingredients)
         self.protein = sum(ti.total_protein for ti in self.template_ingredients)
         self.carbs = sum(ti.total_carbs for ti in self.template_ingredients)
@@ -72,32 +93,39 @@ class MealTemplateIngredient(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     template_id: Mapped[int] = mapped_column(ForeignKey("meal_templates.id"))
-    ingredient_id: Mapped[int] = mapped_column(ForeignKey("ingredients.id"))
+    ingredient_id: Mapped[int] = mapped_column(ForeignKey("ingredients.id"), index=True)
 
     quantity: Mapped[float]
     unit: Mapped[str] = mapped_column(String(20), default="g")
 
+    # Wyliczane przy zapisie (zob. _store_base_quantity, recompute_base_quantities) - odczyt bez ładowania units
+    quantity_base: Mapped[Optional[float]] = mapped_column(nullable=True)
+    base_multiplier: Mapped[Optional[float]] = mapped_column(nullable=True)
+
     # Relacje
     template: Mapped["MealTemplate"] = relationship(back_populates="template_ingredients")
     ingredient: Mapped["Ingredient"] = relationship()
 
+    @validates("quantity", "unit", "ingredient_id", "ingredient")
+    def _reset_base_quantity(self, key, value):
+        """Zmiana ilości/jednostki/składnika unieważnia zapisane wartości do następnego flush"""
+        self.quantity_base = None
+        self.base_multiplier = None
+        return value
+
     # Properties - identyczne jak w MealIngredient
     @property
     def quantity_in_base_units(self) -> float:
-        """Przelicz na jednostkę bazową składnika"""
-        if self.unit == self.ingredient.base_unit:
-            return self.quantity
-
-        for alt_unit in self.ingredient.units:
-            if alt_unit.unit_name == self.unit:
-                if self.ingredient.base_unit == "g":
-                    return self.quantity * alt_unit.gram_equivalent
-
-        return self.quantity
+        """Ilość w jednostce bazowej składnika"""
+        if self.quantity_base is not None:
+            return self.quantity_base
+        return resolve_base_quantity(self.ingredient, self.quantity, self.unit)
 
     @property
     def multiplier(self) -> float:
         """Mnożnik względem base_amount"""
+        if self.base_multiplier is not None:
+            return self.base_multiplier
         base_qty = self.quantity_in_base_units
         return base_qty / self.ingredient.base_amount
 
@@ -138,6 +166,8 @@ class Meal(Base):
     name: Mapped[str] = mapped_column(String(100))
     meal_order: Mapped[int]
     planned_time: Mapped[Optional[time]] = mapped_column(nullable=True)
+    # Skala porcji względem szablonu (ilości składników = ilości szablonu * scale_factor)
+    scale_factor: Mapped[float] = mapped_column(default=1.0)
 
     # Makro (suma z ingredients)
     calories: Mapped[float] = mapped_column(default=0.0)
@@ -145,6 +175,9 @@ class Meal(Base):
     carbs: Mapped[float] = mapped_column(default=0.0)
     fats: Mapped[float] = mapped_column(default=0.0)
     fiber: Mapped[float] = mapped_column(default=0.0)
+    # Makro wpisane bezpośrednio, bez składników (plany DietManagera z
+    # services.plan_unit_of_work) - nie przeliczane z meal_ingredients
+    macros_only: Mapped[bool] = mapped_column(default=False, server_default=false())
 
     # Status
     is_eaten: Mapped[bool] = mapped_column(default=False)
@@ -158,47 +191,95 @@ class Meal(Base):
         cascade="all, delete-orphan"
     )
 
-    def calculate_nutrition(self) -> None:
-        """Przelicz wartości odżywcze z ingredients"""
+    def calculate_nutrition(self, matrix: Optional["IngredientMatrix"] = None) -> None:
+        """Przelicz wartości odżywcze z ingredients (wektorowo, jeśli podano matrix)"""
+        if matrix is not None:
+            matrix.apply_to_meals([self])
+            return
+
         self.calories = sum(mi.total_calories for mi in self.meal_ingredients)
         self.protein = sum(mi.total_protein for mi in self.meal_ingredients)
         self.carbs = sum(mi.total_carbs for mi in self.meal_ingredients)
         self.fats = sum(mi.total_fat for mi in self.meal_ingredients)
         self.fiber = sum(mi.total_fiber for mi in self.meal_ingredients)
 
+    # ---------------- Zmiany przyrostowe ----------------
+    def apply_nutrition_delta(self, delta: dict[str, float]) -> None:
+        """Dodaj różnicę do cache posiłku i jego dnia - O(1) zamiast przeliczania całości"""
+        for column, value in delta.items():
+            setattr(self, column, (getattr(self, column) or 0.0) + value)
+        if self.daily_plan is not None:
+            self.daily_plan.apply_nutrition_delta(delta)
+
+    def add_ingredient(self, item: "MealIngredient") -> None:
+        """Dodaj składnik i dolicz tylko jego wkład"""
+        session = Session.object_session(self)
+        if item.ingredient is None and session is not None:
+            item.ingredient = session.get(Ingredient, item.ingredient_id)
+        item.meal = self  # backref nie ładuje całej kolekcji meal_ingredients
+        if session is not None:
+            session.add(item)  # bez backref cascade
+        self.apply_nutrition_delta(item.nutrition())
+
+    def remove_ingredient(self, item: "MealIngredient") -> None:
+        """Usuń składnik i odejmij tylko jego wkład"""
+        self.apply_nutrition_delta({key: -value for key, value in item.nutrition().items()})
+        item.meal = None  # delete-orphan usunie wiersz przy flush
+
+    def update_ingredient(
+        self,
+        item: "MealIngredient",
+        quantity: Optional[float] = None,
+        unit: Optional[str] = None,
+    ) -> None:
+        """Zmień ilość/jednostkę składnika i zastosuj różnicę wartości"""
+        before = item.nutrition()
+        if quantity is not None:
+            item.quantity = quantity
+        if unit is not None:
+            item.unit = unit
+        after = item.nutrition()
+        self.apply_nutrition_delta({column: after[column] - before[column] for column in after})
+
 
 class MealIngredient(Base):
     __tablename__ = "meal_ingredients"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     meal_id: Mapped[int] = mapped_column(ForeignKey("meals.id"))
-    ingredient_id: Mapped[int] = mapped_column(ForeignKey("ingredients.id"))
+    ingredient_id: Mapped[int] = mapped_column(ForeignKey("ingredients.id"), index=True)
 
     quantity: Mapped[float]
     unit: Mapped[str] = mapped_column(String(20), default="g")
 
+    # Wyliczane przy zapisie (zob. _store_base_quantity, recompute_base_quantities) - odczyt bez ładowania units
+    quantity_base: Mapped[Optional[float]] = mapped_column(nullable=True)
+    base_multiplier: Mapped[Optional[float]] = mapped_column(nullable=True)
+
     # Relacje
     meal: Mapped["Meal"] = relationship(back_populates="meal_ingredients")
     ingredient: Mapped["Ingredient"] = relationship()
 
+    @validates("quantity", "unit", "ingredient_id", "ingredient")
+    def _reset_base_quantity(self, key, value):
+        """Zmiana ilości/jednostki/składnika unieważnia zapisane wartości do następnego flush"""
+        self.quantity_base = None
+        self.base_multiplier = None
+        return value
+
     # Properties
     @property
     def quantity_in_base_units(self) -> float:
-        """Przelicz na jednostkę bazową składnika"""
-        if self.unit == self.ingredient.base_unit:
-            return self.quantity
-
-        # Szukaj konwersji
-        for alt_unit in self.ingredient.units:
-            if alt_unit.unit_name == self.unit:
-                if self.ingredient.base_unit == "g":
-                    return self.quantity * alt_unit.gram_equivalent
-
-        return self.quantity
+        """Ilość w jednostce bazowej składnika"""
+        if self.quantity_base is not None:
+            return self.quantity_base
+        return resolve_base_quantity(self.ingredient, self.quantity, self.unit)
 
     @property
     def multiplier(self) -> float:
         """Mnożnik względem base_amount"""
+        if self.base_multiplier is not None:
+            return self.base_multiplier
         base_qty = self.quantity_in_base_units
         return base_qty / self.ingredient.base_amount
 
@@ -220,4 +301,127 @@ class MealIngredient(Base):
 
     @property
     def total_fiber(self) -> float:
-        return self.ingredient.fiber * self.multiplier
\ No newline at end of file
+        return self.ingredient.fiber * self.multiplier
+
+    def nutrition(self) -> dict[str, float]:
+        """Wkład składnika w kolumny cache posiłku"""
+        multiplier = self.multiplier
+        return {
+            "calories": self.ingredient.calories * multiplier,
+            "protein": self.ingredient.protein * multiplier,
+            "carbs": self.ingredient.carbs * multiplier,
+            "fats": self.ingredient.fat * multiplier,
+            "fiber": self.ingredient.fiber * multiplier,
+        }
+
+
+# ---------------- Jednostki bazowe liczone przy zapisie ----------------
+
+QUANTITY_ITEM_CLASSES = (MealIngredient, MealTemplateIngredient)
+
+
+@event.listens_for(MealIngredient, "before_insert")
+@event.listens_for(MealIngredient, "before_update")
+@event.listens_for(MealTemplateIngredient, "before_insert")
+@event.listens_for(MealTemplateIngredient, "before_update")
+def _store_base_quantity(mapper, connection, target) -> None:
+    """Uzupełnij quantity_base / base_multiplier przy zapisie wiersza"""
+    if target.quantity_base is not None and target.base_multiplier is not None:
+        return
+
+    ingredient = target.ingredient
+    if ingredient is None or (target.ingredient_id is not None and ingredient.id != target.ingredient_id):
+        # Zmienione samo ingredient_id - załadowana relacja wskazuje jeszcze stary składnik
+        ingredient = Session.object_session(target).get(Ingredient, target.ingredient_id)
+
+    target.quantity_base = resolve_base_quantity(ingredient, target.quantity, target.unit)
+    target.base_multiplier = target.quantity_base / ingredient.base_amount
+
+
+def _base_quantity_expressions(item_cls):
+    """SQL odpowiednik resolve_base_quantity() dla UPDATE zbiorczego"""
+    base_unit = select(Ingredient.base_unit).where(Ingredient.id == item_cls.ingredient_id).scalar_subquery()
+    base_amount = select(Ingredient.base_amount).where(Ingredient.id == item_cls.ingredient_id).scalar_subquery()
+    gram_equivalent = (
+        select(IngredientUnit.gram_equivalent)
+        .where(
+            IngredientUnit.ingredient_id == item_cls.ingredient_id,
+            IngredientUnit.unit_name == item_cls.unit,
+        )
+        .order_by(IngredientUnit.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    quantity_base = case(
+        (item_cls.unit == base_unit, item_cls.quantity),
+        (and_(base_unit == "g", gram_equivalent.is_not(None)), item_cls.quantity * gram_equivalent),
+        else_=item_cls.quantity,
+    )
+    return quantity_base, quantity_base / base_amount
+
+
+def recompute_base_quantities(session: Session, ingredient_ids) -> None:
+    """
+    Przelicz zbiorczo quantity_base / base_multiplier wszystkich wierszy
+    (posiłki i szablony) używających podanych składników.
+    """
+    ingredient_ids = list(ingredient_ids)
+    if not ingredient_ids:
+        return
+
+    for item_cls in QUANTITY_ITEM_CLASSES:
+        quantity_base, base_multiplier = _base_quantity_expressions(item_cls)
+        session.execute(
+            update(item_cls)
+            .where(item_cls.ingredient_id.in_(ingredient_ids))
+            .values(quantity_base=quantity_base, base_multiplier=base_multiplier)
+            .execution_options(synchronize_session=False)
+        )
+
+    # Obiekty już załadowane w sesji mają nieaktualne wartości
+    ids = set(ingredient_ids)
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, QUANTITY_ITEM_CLASSES) and obj.ingredient_id in ids:
+            session.expire(obj, ["quantity_base", "base_multiplier"])
+
+
+def _changed(obj, *keys) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[key].history.has_changes() for key in keys)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_unit_changes(session, flush_context, instances) -> None:
+    """Zapamiętaj obiekty, których zmiana wpływa na przeliczniki jednostek"""
+    changed = session.info.setdefault("base_quantity_changes", [])
+
+    for obj in session.new | session.deleted:
+        if isinstance(obj, IngredientUnit):
+            changed.append(obj)
+
+    for obj in session.dirty:
+        if isinstance(obj, IngredientUnit) and _changed(obj, "gram_equivalent", "unit_name", "ingredient_id"):
+            changed.append(obj)
+        elif isinstance(obj, Ingredient) and _changed(obj, "base_amount", "base_unit"):
+            changed.append(obj)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _recompute_unit_changes(session, flush_context) -> None:
+    """Po zapisie (id są już znane) przelicz zbiorczo dotknięte wiersze"""
+    changed = session.info.pop("base_quantity_changes", None)
+    if not changed:
+        return
+
+    ingredient_ids = {
+        obj.ingredient_id if isinstance(obj, IngredientUnit) else obj.id
+        for obj in changed
+    }
+    ingredient_ids.discard(None)
+    recompute_base_quantities(session, ingredient_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_unit_changes(session) -> None:
+    """Nieudany flush nie przenosi zebranych zmian do następnego"""
+    session.info.pop("base_quantity_changes", None)
@@ -1,7 +1,7 @@
 from datetime import datetime, date
 from typing import Optional, TYPE_CHECKING
 
-from sqlalchemy import String, ForeignKey, func
+from sqlalchemy import JSON, String, ForeignKey, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from database import Base
@@ -58,6 +58,10 @@ class User(Base):
         cascade="all, delete-orphan"
     )
 
+    macro_profile: Mapped[Optional["UserMacroProfile"]] = relationship(
+        cascade="all, delete-orphan"
+    )
+
     # Properties
     @property
     def age(self) -> int:
@@ -100,4 +104,29 @@ class PhysicalData(Base):
     notes: Mapped[Optional[str]] = mapped_column(nullable=True)
 
     # Relacje
-    user: Mapped["User"] = relationship(back_populates="physical_data")
\ No newline at end of file
+    user: Mapped["User"] = relationship(back_populates="physical_data")
+
+
+class UserMacroProfile(Base):
+    """Zapisany profil makro (services.macro_profiles) - przeżywa restart."""
+    __tablename__ = "user_macro_profiles"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    physical_data_id: Mapped[int]  # pomiar, z którego liczono
+
+    # Cel i podział na posiłki (z aktywnego planu)
+    goal: Mapped[str] = mapped_column(String(20))  # maintain, lose, gain
+    meals_per_day: Mapped[int]
+
+    # Wyniki
+    bmr: Mapped[float]
+    tdee: Mapped[float]
+    calories: Mapped[float]
+    protein_g: Mapped[float]
+    fat_g: Mapped[float]
+    carbs_g: Mapped[float]
+    per_meal: Mapped[list] = mapped_column(JSON)  # [{calories, protein_g, fat_g, carbs_g}, ...]
+    valid_until: Mapped[date]  # następne urodziny - od tego dnia wiek (i BMR) jest inny
+
+    # Meta
+    computed_at: Mapped[datetime] = mapped_column(server_default=func.now())
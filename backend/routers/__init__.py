@@ -1,3 +1,5 @@
 from routers.user import router as user_router
+from routers.ingredient import router as ingredient_router
+from routers.diet import router as diet_router
 
-__all__ = ["user_router"]
\ No newline at end of file
+__all__ = ["user_router", "ingredient_router", "diet_router"]
\ No newline at end of file
@@ -0,0 +1,156 @@
+import json
+from datetime import date
+from typing import Any, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, get_db
+from schemas.diet import DietPlanSummary, DietPlanResponse, DailyPlanResponse, GeneratePlanRequest
+from cruds import diet as diet_crud
+from auth import get_current_user
+from models.diet import DietPlan
+from models.user import User
+from services.meal_distribution import default_slots, ratio_matrix
+from services.plan_generation import stream_daily_plans
+
+
+router = APIRouter(prefix="/diet-plans", tags=["diet-plans"])
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def _get_own_plan(db: Session, plan_id: int, user: User, profile: str) -> DietPlan:
+    plan = diet_crud.get_diet_plan(db, plan_id, profile=profile)
+    if not plan or plan.user_id != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Diet plan not found"
+        )
+    return plan
+
+
+def _check_own_plan(db: Session, plan_id: int, user: User) -> None:
+    if diet_crud.get_diet_plan_owner(db, plan_id) != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Diet plan not found"
+        )
+
+
+def _encode_event(event: dict[str, Any], format: str) -> str:
+    data = json.dumps(event, ensure_ascii=False)
+    if format == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@router.get("/", response_model=list[DietPlanSummary])
+def get_diet_plans(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Plany zalogowanego użytkownika (z listą dni)."""
+    return diet_crud.get_diet_plans(db, current_user.id)
+
+
+@router.get("/{plan_id}", response_model=DietPlanResponse | DietPlanSummary)
+def get_diet_plan(
+    plan_id: int,
+    profile: Literal["summary", "full_plan"] = "summary",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Pobierz plan diety.
+
+    profile=summary   - plan + dni (2 zapytania)
+    profile=full_plan - plan + dni + posiłki + składniki (4 zapytania)
+    """
+    plan = _get_own_plan(db, plan_id, current_user, profile)
+    if profile == "full_plan":
+        return DietPlanResponse.model_validate(plan)
+    return DietPlanSummary.model_validate(plan)
+
+
+@router.get("/{plan_id}/days/{day}", response_model=DailyPlanResponse)
+def get_daily_plan(
+    plan_id: int,
+    day: date,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Pobierz jeden dzień planu z posiłkami (profil full_day)."""
+    _check_own_plan(db, plan_id, current_user)
+    daily_plan = diet_crud.get_daily_plan(db, plan_id, day)
+    if not daily_plan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Day not found in diet plan"
+        )
+    return daily_plan
+
+
+@router.post("/{plan_id}/generate")
+def generate_diet_plan(
+    plan_id: int,
+    request: GeneratePlanRequest,
+    format: Literal["ndjson", "sse"] = "ndjson",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Generuj brakujące dni planu strumieniowo (NDJSON lub SSE).
+
+    Zdarzenia: start, day (od razu po wyliczeniu dnia), saved (po zapisie
+    paczki dni), done. Przerwanie połączenia zachowuje zapisane paczki -
+    ponowne wywołanie kontynuuje od następnego dnia.
+    """
+    _check_own_plan(db, plan_id, current_user)
+    plan = db.get(DietPlan, plan_id)
+
+    shares = request.shares
+    try:
+        # Sloty sprawdzone przed startem strumienia - błąd to 400, nie przerwany strumień
+        categories = request.categories or default_slots(plan.meals_per_day)
+        if shares is None and request.distribution:
+            # Macierz udziałów (posiłek x makro) ze strategii podziału
+            shares = ratio_matrix(request.distribution, len(categories))
+        elif shares is not None:
+            if len(shares) != len(categories):
+                raise ValueError(f"Expected {len(categories)} shares (one per meal), got {len(shares)}")
+            if any(share < 0 for share in shares) or not sum(shares) > 0:
+                raise ValueError("Shares must be non-negative and not all zero")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    def events():
+        # Własna sesja - żyje tak długo jak strumień
+        with SessionLocal() as session:
+            plan = session.get(DietPlan, plan_id)
+            for event in stream_daily_plans(
+                session,
+                plan,
+                request.target_protein,
+                request.target_carbs,
+                request.target_fats,
+                categories=categories,
+                shares=shares,
+                seed=request.seed,
+                candidate_source=request.candidate_source,
+                batch_days=request.batch_days,
+            ):
+                yield _encode_event(event, format)
+
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
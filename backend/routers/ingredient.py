@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from schemas.ingredient import IngredientSearchResult
+from services.ingredient_search import get_search_backend
+from auth import get_current_user
+from models.user import User
+
+
+router = APIRouter(prefix="/ingredients", tags=["ingredients"])
+
+
+@router.get("/search", response_model=list[IngredientSearchResult])
+def search_ingredients(
+    q: str = Query(min_length=1, max_length=150),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Autocomplete składników.
+
+    Zwraca składniki globalne i prywatne zalogowanego użytkownika,
+    najpierw dopasowania prefiksu, potem "zawiera" i literówki.
+    """
+    backend = get_search_backend(db)
+    return backend.search(q, user_id=current_user.id, limit=limit)
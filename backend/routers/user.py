@@ -2,11 +2,21 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from database import get_db
-from schemas.user import UserCreate, UserUpdate, UserResponse
+from schemas.user import (
+    UserCreate,
+    UserUpdate,
+    UserResponse,
+    PhysicalDataCreate,
+    PhysicalDataResponse,
+    RecalculationStatus,
+    MacroProfileResponse,
+)
 from cruds import user as user_crud
 from utils import hash_password
 from auth import get_current_user
 from models.user import User
+from services.macro_profiles import macro_profile_cache
+from services.recalculation import recalculation_queue
 
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -20,6 +30,46 @@ def get_current_user_data(
     return current_user
 
 
+@router.post("/me/physical-data", response_model=PhysicalDataResponse, status_code=status.HTTP_201_CREATED)
+def add_physical_data(
+    data: PhysicalDataCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Dodaj pomiar. Plany przeliczają się w tle -
+    stan w GET /users/me/recalculation.
+    """
+    return user_crud.create_physical_data(db, current_user.id, data)
+
+
+@router.get("/me/recalculation", response_model=RecalculationStatus)
+def get_recalculation_status(current_user: User = Depends(get_current_user)):
+    """Stan ostatniego przeliczania planów zalogowanego użytkownika."""
+    job = recalculation_queue.status(current_user.id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No recalculation requested"
+        )
+    return job
+
+
+@router.get("/me/macro-profile", response_model=MacroProfileResponse)
+def get_macro_profile(current_user: User = Depends(get_current_user)):
+    """
+    BMR, TDEE, dzienne makro i podział na posiłki - z cache, liczone
+    tylko po nowym pomiarze lub zmianie danych / aktywnego planu.
+    """
+    profile = macro_profile_cache.get(current_user.id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Macro profile not available - add physical data first"
+        )
+    return profile
+
+
 @router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 def create_user(user: UserCreate, db: Session = Depends(get_db)):
     """Rejestracja nowego użytkownika."""
@@ -3,14 +3,38 @@ from schemas.user import (
     UserUpdate,
     UserResponse,
     UserLogin,
+    PhysicalDataCreate,
+    PhysicalDataResponse,
+    RecalculationStatus,
+    MealMacros,
+    MacroProfileResponse,
 )
 from schemas.auth import Token, TokenPayload
+from schemas.diet import (
+    DietPlanSummary,
+    DietPlanResponse,
+    DailyPlanSummary,
+    DailyPlanResponse,
+    MealResponse,
+    GeneratePlanRequest,
+)
 
 __all__ = [
     "UserCreate",
     "UserUpdate",
     "UserResponse",
     "UserLogin",
+    "PhysicalDataCreate",
+    "PhysicalDataResponse",
+    "RecalculationStatus",
+    "MealMacros",
+    "MacroProfileResponse",
     "Token",
     "TokenPayload",
+    "DietPlanSummary",
+    "DietPlanResponse",
+    "DailyPlanSummary",
+    "DailyPlanResponse",
+    "MealResponse",
+    "GeneratePlanRequest",
 ]
\ No newline at end of file
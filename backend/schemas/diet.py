@@ -0,0 +1,99 @@
+from datetime import date, datetime, time
+from typing import Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from models.diet import DietGoal
+
+
+class IngredientBrief(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+
+
+class MealIngredientResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    ingredient: IngredientBrief
+    quantity: float
+    unit: str
+
+
+class MealResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    template_id: Optional[int] = None
+    name: str
+    meal_order: int
+    planned_time: Optional[time] = None
+    calories: float
+    protein: float
+    carbs: float
+    fats: float
+    fiber: float
+    is_eaten: bool
+    meal_ingredients: list[MealIngredientResponse] = []
+
+
+class DailyPlanSummary(BaseModel):
+    """Dzień bez posiłków (profil summary)."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    date: date
+    target_calories: int
+    target_protein: float
+    target_carbs: float
+    target_fats: float
+    actual_calories: int
+    actual_protein: float
+    actual_carbs: float
+    actual_fats: float
+    actual_fiber: Optional[float] = None
+    actual_sodium: Optional[float] = None
+    actual_cholesterol: Optional[float] = None
+    is_completed: bool
+
+
+class DailyPlanResponse(DailyPlanSummary):
+    """Dzień z posiłkami (profil full_day)."""
+    notes: Optional[str] = None
+    meals: list[MealResponse] = []
+
+
+class DietPlanSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    goal: DietGoal
+    date_from: date
+    date_to: date
+    meals_per_day: int
+    target_calories: int
+    is_active: bool
+    is_completed: bool
+    created_at: datetime
+    daily_plans: list[DailyPlanSummary] = []
+
+
+class DietPlanResponse(DietPlanSummary):
+    """Cały plan (profil full_plan)."""
+    daily_plans: list[DailyPlanResponse] = []
+
+
+class GeneratePlanRequest(BaseModel):
+    """Parametry generowania dni planu (endpoint strumieniowy)."""
+    target_protein: float = Field(gt=0)
+    target_carbs: float = Field(gt=0)
+    target_fats: float = Field(gt=0)
+    categories: Optional[list[str]] = None  # sloty dnia, domyślnie wg meals_per_day
+    shares: Optional[list[float]] = None
+    distribution: Optional[str] = None  # strategia podziału makro na posiłki, gdy brak shares
+    seed: int = 0
+    candidate_source: Literal["nearest", "sampled"] = "nearest"
+    batch_days: int = Field(7, ge=1, le=90)  # dni na transakcję
@@ -8,4 +8,13 @@ class IngredientCategoryResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     
     id: int
-    name: str
\ No newline at end of file
+    name: str
+
+
+class IngredientSearchResult(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    is_global: bool
+    score: float  # podobieństwo trigramowe 0-1
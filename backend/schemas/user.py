@@ -52,4 +52,58 @@ class UserResponse(UserBase):
 class UserLogin(BaseModel):
     """Schema do logowania."""
     email: EmailStr
-    password: str
\ No newline at end of file
+    password: str
+
+class PhysicalDataCreate(BaseModel):
+    """Schema nowego pomiaru - uruchamia przeliczenie planów w tle."""
+    weight: float = Field(gt=0, lt=500)  # kg
+    activity_level: str = Field(pattern="^(sedentary|light|moderate|very|super)$")
+    body_fat_percentage: Optional[float] = Field(None, ge=0, le=100)
+    muscle_mass: Optional[float] = Field(None, gt=0)
+    waist_circumference: Optional[float] = Field(None, gt=0)
+    notes: Optional[str] = None
+
+
+class PhysicalDataResponse(PhysicalDataCreate):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    recorded_at: datetime
+
+
+class RecalculationStatus(BaseModel):
+    """Stan zadania przeliczania planów użytkownika."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    status: str  # queued, running, done, failed
+    requests: int
+    requested_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    days: int
+    meals: int
+    error: Optional[str] = None
+
+
+class MealMacros(BaseModel):
+    """Cele jednego posiłku."""
+    calories: float
+    protein_g: float
+    fat_g: float
+    carbs_g: float
+
+
+class MacroProfileResponse(BaseModel):
+    """Profil makro użytkownika (z cache - bez przeliczania)."""
+    model_config = ConfigDict(from_attributes=True)
+
+    goal: str  # maintain, lose, gain
+    meals_per_day: int
+    bmr: float
+    tdee: float
+    calories: float
+    protein_g: float
+    fat_g: float
+    carbs_g: float
+    per_meal: list[MealMacros]
@@ -0,0 +1,446 @@
+"""
+Versioned binary snapshot of the global ingredient catalog.
+
+The snapshot is written after each import and memory-mapped read-only by
+every worker, so N workers on one host share a single page-cache copy and
+start with a file open instead of a scan of `ingredients`,
+`ingredient_units` and `ingredient_categories`.
+
+Workers read it through `load_ingredient_matrix` (recipe scaling) and
+the ingredient search index, which is built from it at startup: global
+ingredients come from the snapshot, private ones (few, and not in the
+snapshot) from the database.
+
+Every committed change of the global catalog rewrites the configured
+snapshot - ORM edits through the session hooks at the bottom, bulk
+imports through `refresh_catalog_snapshot` - and a worker whose file was
+replaced reopens it. If the rewrite fails the worker stops using the
+file it has; a snapshot that no longer matches the global rows in the
+database (count / highest id, for writes outside both paths) is ignored
+as well, and the catalog is read from the database as before.
+
+File layout (little-endian, every section 8-byte aligned):
+
+    header      magic, format version, catalog version, counts
+    sections    offset/length table for the sections below
+    ids                 int64[n]          sorted ingredient ids
+    category_ids        int32[n]
+    base_amount         float64[n]
+    base_unit           int32[n]          index into the unit name table
+    nutrients           float64[n, k]     per base unit, k = len(NUTRIENTS)
+    name_offsets        uint32[n + 1]     + names blob (UTF-8)
+    category_table_ids  int32[c]          + category name table
+    unit_ingredient     int32[m]          row position in `ids`
+    unit_name           int32[m]          index into the unit name table
+    unit_factor         float64[m]        gram equivalent
+    unit_name_offsets   uint32[u + 1]     + interned unit names blob
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models.ingredient import Ingredient, IngredientCategory, IngredientUnit
+from services.ingredient_matrix import NUTRIENTS, IngredientMatrix
+from utils import log_error
+
+
+MAGIC = b"PDMCATLG"
+FORMAT_VERSION = 1
+
+SECTIONS = (
+    "ids",
+    "category_ids",
+    "base_amount",
+    "base_unit",
+    "nutrients",
+    "name_offsets",
+    "names",
+    "category_table_ids",
+    "category_offsets",
+    "category_names",
+    "unit_ingredient",
+    "unit_name",
+    "unit_factor",
+    "unit_name_offsets",
+    "unit_names",
+)
+
+# magic, format version, nutrient count, catalog version, ingredients, units, categories, unit names
+HEADER = struct.Struct("<8sIIQIIII")
+SECTION_ENTRY = struct.Struct("<QQ")
+ALIGNMENT = 8
+
+
+def _pack_strings(strings: list[str]) -> tuple[np.ndarray, bytes]:
+    """Concatenate strings into one UTF-8 blob with an offsets array."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def _build_sections(session: Session) -> tuple[dict[str, bytes], dict[str, int]]:
+    """Read the global catalog with column queries and encode every section."""
+    nutrient_columns = [getattr(Ingredient, name) for name in NUTRIENTS]
+    rows = session.execute(
+        select(
+            Ingredient.id,
+            Ingredient.category_id,
+            Ingredient.base_amount,
+            Ingredient.base_unit,
+            Ingredient.name,
+            *nutrient_columns,
+        )
+        .where(Ingredient.user_id.is_(None))
+        .order_by(Ingredient.id)
+    ).all()
+    n = len(rows)
+
+    ids = np.array([row.id for row in rows], dtype=np.int64)
+    category_ids = np.array([row.category_id for row in rows], dtype=np.int32)
+    base_amount = np.array([row.base_amount for row in rows], dtype=np.float64)
+    raw = np.array([row[5:] for row in rows], dtype=np.float64).reshape(n, len(NUTRIENTS))
+    nutrients = raw / np.where(base_amount == 0, 1.0, base_amount)[:, None]
+    name_offsets, names = _pack_strings([row.name for row in rows])
+
+    # Interned unit names - base units and alternative units share one table
+    unit_codes: dict[str, int] = {}
+
+    def intern(unit: str) -> int:
+        return unit_codes.setdefault(unit, len(unit_codes))
+
+    base_unit = np.array([intern(row.base_unit) for row in rows], dtype=np.int32)
+
+    position = {ingredient_id: i for i, ingredient_id in enumerate(ids.tolist())}
+    unit_rows = session.execute(
+        select(IngredientUnit.ingredient_id, IngredientUnit.unit_name, IngredientUnit.gram_equivalent)
+        .where(IngredientUnit.ingredient_id.in_(select(Ingredient.id).where(Ingredient.user_id.is_(None))))
+        .order_by(IngredientUnit.ingredient_id, IngredientUnit.id)
+    ).all()
+    unit_ingredient = np.array([position[row[0]] for row in unit_rows], dtype=np.int32)
+    unit_name = np.array([intern(row[1]) for row in unit_rows], dtype=np.int32)
+    unit_factor = np.array([row[2] for row in unit_rows], dtype=np.float64)
+    unit_name_offsets, unit_names = _pack_strings(list(unit_codes))
+
+    category_rows = session.execute(
+        select(IngredientCategory.id, IngredientCategory.name).order_by(IngredientCategory.id)
+    ).all()
+    category_table_ids = np.array([row[0] for row in category_rows], dtype=np.int32)
+    category_offsets, category_names = _pack_strings([row[1] for row in category_rows])
+
+    sections = {
+        "ids": ids.tobytes(),
+        "category_ids": category_ids.tobytes(),
+        "base_amount": base_amount.tobytes(),
+        "base_unit": base_unit.tobytes(),
+        "nutrients": np.ascontiguousarray(nutrients).tobytes(),
+        "name_offsets": name_offsets.tobytes(),
+        "names": names,
+        "category_table_ids": category_table_ids.tobytes(),
+        "category_offsets": category_offsets.tobytes(),
+        "category_names": category_names,
+        "unit_ingredient": unit_ingredient.tobytes(),
+        "unit_name": unit_name.tobytes(),
+        "unit_factor": unit_factor.tobytes(),
+        "unit_name_offsets": unit_name_offsets.tobytes(),
+        "unit_names": unit_names,
+    }
+    counts = {
+        "ingredients": n,
+        "units": len(unit_rows),
+        "categories": len(category_rows),
+        "unit_names": len(unit_codes),
+    }
+    return sections, counts
+
+
+def write_snapshot(session: Session, path: str | os.PathLike) -> int:
+    """
+    Write the snapshot atomically (temp file + rename).
+
+    Workers that still have the previous file mapped keep reading it
+    until they reopen. Returns the catalog version (content hash).
+    """
+    sections, counts = _build_sections(session)
+
+    digest = hashlib.blake2b(digest_size=8)
+    for name in SECTIONS:
+        digest.update(sections[name])
+    catalog_version = int.from_bytes(digest.digest(), "little")
+
+    table_size = HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+    offset = -(-table_size // ALIGNMENT) * ALIGNMENT
+    entries = []
+    for name in SECTIONS:
+        entries.append((offset, len(sections[name])))
+        offset = -(-(offset + len(sections[name])) // ALIGNMENT) * ALIGNMENT
+
+    path = Path(path)
+    # Per writer, so two processes refreshing at once do not share a temp file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            len(NUTRIENTS),
+            catalog_version,
+            counts["ingredients"],
+            counts["units"],
+            counts["categories"],
+            counts["unit_names"],
+        ))
+        for entry in entries:
+            f.write(SECTION_ENTRY.pack(*entry))
+        for name, (section_offset, _) in zip(SECTIONS, entries):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(sections[name])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    return catalog_version
+
+
+class CatalogSnapshot:
+    """Read-only view over a memory-mapped snapshot file."""
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.file_id = _file_id(os.fstat(f.fileno()))
+
+        (
+            magic,
+            format_version,
+            n_nutrients,
+            self.catalog_version,
+            self.n_ingredients,
+            self.n_units,
+            self.n_categories,
+            self.n_unit_names,
+        ) = HEADER.unpack_from(self._mmap, 0)
+
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a catalog snapshot")
+        if format_version != FORMAT_VERSION or n_nutrients != len(NUTRIENTS):
+            raise ValueError(
+                f"Unsupported snapshot format {format_version} with {n_nutrients} nutrients"
+            )
+
+        self._sections = {
+            name: SECTION_ENTRY.unpack_from(self._mmap, HEADER.size + i * SECTION_ENTRY.size)
+            for i, name in enumerate(SECTIONS)
+        }
+
+        n = self.n_ingredients
+        self.ids = self._array("ids", np.int64)
+        self.category_ids = self._array("category_ids", np.int32)
+        self.base_amount = self._array("base_amount", np.float64)
+        self.base_unit = self._array("base_unit", np.int32)
+        self.nutrients = self._array("nutrients", np.float64).reshape(n, len(NUTRIENTS))
+        self.unit_ingredient = self._array("unit_ingredient", np.int32)
+        self.unit_name = self._array("unit_name", np.int32)
+        self.unit_factor = self._array("unit_factor", np.float64)
+
+        self._name_offsets = self._array("name_offsets", np.uint32)
+        self._unit_names = self._strings("unit_name_offsets", "unit_names")
+        self._category_names = dict(zip(
+            self._array("category_table_ids", np.int32).tolist(),
+            self._strings("category_offsets", "category_names"),
+        ))
+
+    def __len__(self) -> int:
+        return self.n_ingredients
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _array(self, section: str, dtype) -> np.ndarray:
+        """Zero-copy numpy view of a section (read-only)."""
+        offset, length = self._sections[section]
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=offset)
+
+    def _strings(self, offsets_section: str, blob_section: str) -> list[str]:
+        offsets = self._array(offsets_section, np.uint32).tolist()
+        start, _ = self._sections[blob_section]
+        return [
+            self._mmap[start + offsets[i]:start + offsets[i + 1]].decode("utf-8")
+            for i in range(len(offsets) - 1)
+        ]
+
+    # ---------------- Lookups ----------------
+    def position(self, ingredient_id: int) -> int:
+        pos = int(np.searchsorted(self.ids, ingredient_id))
+        if pos >= self.n_ingredients or self.ids[pos] != ingredient_id:
+            raise KeyError(ingredient_id)
+        return pos
+
+    def name(self, position: int) -> str:
+        """Ingredient name, decoded straight from the mapped blob."""
+        start, _ = self._sections["names"]
+        lo, hi = int(self._name_offsets[position]), int(self._name_offsets[position + 1])
+        return self._mmap[start + lo:start + hi].decode("utf-8")
+
+    def names(self) -> list[str]:
+        """All names in `ids` order."""
+        return self._strings("name_offsets", "names")
+
+    def matches(self, session: Session) -> bool:
+        """Whether the database still holds the same global ingredients (count and highest id)."""
+        count, max_id = session.execute(
+            select(func.count(Ingredient.id), func.max(Ingredient.id)).where(Ingredient.user_id.is_(None))
+        ).one()
+        last_id = int(self.ids[-1]) if self.n_ingredients else None
+        return count == self.n_ingredients and max_id == last_id
+
+    def category_name(self, position: int) -> str:
+        return self._category_names[int(self.category_ids[position])]
+
+    def unit_name_of(self, code: int) -> str:
+        return self._unit_names[code]
+
+    def unit_factors(self) -> dict[tuple[int, str], float]:
+        """(ingredient_id, unit_name) -> grams, same rule as quantity_in_base_units."""
+        factors = {}
+        ids = self.ids
+        grams = self._unit_names.index("g") if "g" in self._unit_names else -1
+        # Reversed so the first unit with a given name wins, as in the linear scan
+        for pos, code, factor in reversed(list(zip(
+            self.unit_ingredient.tolist(), self.unit_name.tolist(), self.unit_factor.tolist()
+        ))):
+            if self.base_unit[pos] == grams and code != grams:
+                factors[(int(ids[pos]), self._unit_names[code])] = factor
+        return factors
+
+    def to_matrix(self) -> IngredientMatrix:
+        """IngredientMatrix backed by the mapped arrays (no copy of the nutrient table)."""
+        return IngredientMatrix(self.ids, self.nutrients, self.unit_factors())
+
+
+def _file_id(stat: os.stat_result) -> tuple[int, int]:
+    return stat.st_ino, stat.st_mtime_ns
+
+
+_snapshot: CatalogSnapshot | None = None
+_snapshot_lock = threading.Lock()
+# File this process failed to refresh after a catalog change - not used any more
+_stale_file_id: tuple[int, int] | None = None
+
+
+def get_catalog_snapshot() -> CatalogSnapshot | None:
+    """
+    Process-wide snapshot from `settings.catalog_snapshot_path` (None if not configured).
+
+    Reopened when an import has renamed a new file into place; the old
+    mapping stays valid for arrays still referencing it.
+    """
+    global _snapshot
+    path = settings.catalog_snapshot_path
+    if not path:
+        return None
+    try:
+        file_id = _file_id(os.stat(path))
+    except FileNotFoundError:
+        return None
+    if file_id == _stale_file_id:
+        return None
+    if _snapshot is None or _snapshot.file_id != file_id:
+        with _snapshot_lock:
+            if _snapshot is None or _snapshot.file_id != file_id:
+                _snapshot = CatalogSnapshot(path)
+    return _snapshot
+
+
+def current_catalog_snapshot(session: Session) -> CatalogSnapshot | None:
+    """The process-wide snapshot, if it still matches the database."""
+    snapshot = get_catalog_snapshot()
+    if snapshot is None or not snapshot.matches(session):
+        return None
+    return snapshot
+
+
+def load_ingredient_matrix(session: Session) -> IngredientMatrix:
+    """
+    IngredientMatrix of the whole catalog.
+
+    Global rows are the snapshot's mapped arrays (copied only when there
+    are private ingredients to append); without a current snapshot the
+    catalog is read from the database.
+    """
+    snapshot = current_catalog_snapshot(session)
+    if snapshot is None:
+        return IngredientMatrix.from_session(session)
+    return snapshot.to_matrix().merged(IngredientMatrix.from_session(session, Ingredient.user_id.is_not(None)))
+
+
+def refresh_catalog_snapshot() -> int | None:
+    """
+    Rewrite the configured snapshot from the committed catalog.
+
+    Called after every change of the global catalog; other workers see
+    the replaced file and reopen it. Returns the new catalog version, or
+    None if no snapshot is configured or the rewrite failed.
+    """
+    global _stale_file_id
+    path = settings.catalog_snapshot_path
+    if not path:
+        return None
+    try:
+        with SessionLocal() as session:
+            return write_snapshot(session, path)
+    except Exception as e:
+        log_error(f"Catalog snapshot {path} could not be refreshed: {e}")
+        try:
+            _stale_file_id = _file_id(os.stat(path))
+        except FileNotFoundError:
+            pass
+        return None
+
+
+def reload_catalog_snapshot() -> CatalogSnapshot | None:
+    """Reopen the snapshot after a new import has replaced the file."""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+    return get_catalog_snapshot()
+
+
+# ---------------- Session hooks ----------------
+
+def _changes_global_catalog(session: Session, obj) -> bool:
+    if isinstance(obj, (IngredientUnit, IngredientCategory)):
+        return obj in session.new or obj in session.deleted or session.is_modified(obj)
+    if isinstance(obj, Ingredient):
+        if obj in session.dirty and not session.is_modified(obj):
+            return False
+        # Also a global ingredient made private
+        return obj.user_id is None or None in inspect(obj).attrs.user_id.history.deleted
+    return False
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_catalog_changes(session, flush_context) -> None:
+    if any(_changes_global_catalog(session, obj) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _refresh_after_catalog_change(session) -> None:
+    if session.info.pop("catalog_changed", False):
+        refresh_catalog_snapshot()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_changes(session) -> None:
+    session.info.pop("catalog_changed", None)
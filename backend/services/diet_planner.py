@@ -1,7 +1,10 @@
 from typing import Dict, Any, List
+from array import array
 from datetime import datetime, timedelta
 import json
 
+import numpy as np
+
 
 # # Class to manage ingredient information
 # class IngredientService:
@@ -37,11 +40,175 @@ import json
         
         
         
+# Day totals layout: one row per day, one column per nutrient
+MACRO_KEYS = ("total fat", "cholesterol", "sodium", "carbohydrates", "protein")
+NUTRIENTS = ("calories",) + MACRO_KEYS
+INITIAL_DAYS = 32
+
+
+class PlannedMeal:
+    """One meal: name, position in its day and nutrient values in NUTRIENTS order."""
+    __slots__ = ("name", "order", "values", "extra")
+
+    def __init__(self, name: str, order: int, values: array, extra: Dict[str, Any] | None = None) -> None:
+        self.name = name
+        self.order = order
+        self.values = values
+        # Keys of the meal dict other than name / calories / macros (kept for the dict view)
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, meal: Dict[str, Any], order: int) -> "PlannedMeal":
+        extra = {k: v for k, v in meal.items() if k not in ("name", "calories", "macros")}
+        return cls(meal["name"], order, _values(meal), extra or None)
+
+    def update(self, new_values: Dict[str, Any]) -> None:
+        """Same semantics as dict.update on the meal dict (macros are replaced whole)."""
+        if "name" in new_values:
+            self.name = new_values["name"]
+        if "calories" in new_values:
+            self.values[0] = new_values["calories"]
+        if "macros" in new_values:
+            macros = new_values["macros"] or {}
+            for i, key in enumerate(MACRO_KEYS, start=1):
+                self.values[i] = macros.get(key, 0)
+        extra = {k: v for k, v in new_values.items() if k not in ("name", "calories", "macros")}
+        if extra:
+            self.extra = {**(self.extra or {}), **extra}
+
+    def to_dict(self) -> Dict[str, Any]:
+        meal = {
+            "name": self.name,
+            "calories": self.values[0],
+            "macros": dict(zip(MACRO_KEYS, self.values[1:])),
+        }
+        if self.extra:
+            meal.update(self.extra)
+        return meal
+
+
+class DayPlan:
+    """Meals of one date, by order and by name; totals live in the plan's array row."""
+    __slots__ = ("date", "row", "meals", "by_name", "next_order")
+
+    def __init__(self, date, row: int) -> None:
+        self.date = date
+        self.row = row
+        self.meals: Dict[int, PlannedMeal] = {}  # order -> meal, insertion ordered
+        self.by_name: Dict[str, List[int]] = {}  # name -> orders (duplicates allowed)
+        self.next_order = 0
+
+    def add(self, meal: PlannedMeal) -> None:
+        self.meals[meal.order] = meal
+        self.by_name.setdefault(meal.name, []).append(meal.order)
+        self.next_order = max(self.next_order, meal.order + 1)
+
+    def first(self, name: str) -> PlannedMeal | None:
+        orders = self.by_name.get(name)
+        return self.meals[orders[0]] if orders else None
+
+    def pop_all(self, name: str) -> List[PlannedMeal]:
+        return [self.meals.pop(order) for order in self.by_name.pop(name, [])]
+
+    def rename(self, meal: PlannedMeal, old_name: str) -> None:
+        orders = self.by_name[old_name]
+        orders.remove(meal.order)
+        if not orders:
+            del self.by_name[old_name]
+        # Keep the name index in day order
+        renamed = self.by_name.setdefault(meal.name, [])
+        renamed.append(meal.order)
+        renamed.sort()
+
+
+class PlanState:
+    """
+    Compact in-memory diet plan: days keyed by date, day totals in one
+    float64 array (row per day, NUTRIENTS columns), meals as slot records.
+    `to_dict` / `from_dict` convert to and from the original nested dict.
+    """
+
+    def __init__(self, goal: str, date_from: str, date_to: str, duration_in_days: int, meals_per_day: int) -> None:
+        self.goal = goal
+        self.date_from = date_from
+        self.date_to = date_to
+        self.duration_in_days = duration_in_days
+        self.meals_per_day = meals_per_day
+        self.days: Dict[Any, DayPlan] = {}
+        self.totals = np.zeros((max(INITIAL_DAYS, duration_in_days or 0), len(NUTRIENTS)))
+
+    def add_day(self, date, totals) -> DayPlan:
+        """New day with its own totals row; a date can only be added once."""
+        if date in self.days:
+            raise ValueError("Day plan already exists")
+        row = len(self.days)
+        if row == len(self.totals):
+            self.totals = np.concatenate([self.totals, np.zeros_like(self.totals)])
+        day = DayPlan(date, row)
+        self.totals[row] = totals
+        self.days[date] = day
+        return day
+
+    def day(self, date) -> DayPlan | None:
+        return self.days.get(date)
+
+    def day_to_dict(self, day: DayPlan) -> Dict[str, Any]:
+        totals = self.totals[day.row].tolist()
+        return {
+            "date": day.date,
+            "calories": totals[0],
+            "macros": dict(zip(MACRO_KEYS, totals[1:])),
+            "meals": [meal.to_dict() for meal in day.meals.values()],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "goal": self.goal,
+            "date_from": self.date_from,
+            "date_to": self.date_to,
+            "duration_in_days": self.duration_in_days,
+            "meals_per_day": self.meals_per_day,
+            "plans_per_day": [self.day_to_dict(day) for day in sorted(self.days.values(), key=lambda d: d.row)],
+        }
+
+    @classmethod
+    def from_dict(cls, plan: Dict[str, Any]) -> "PlanState":
+        state = cls(plan["goal"], plan["date_from"], plan["date_to"], plan["duration_in_days"], plan["meals_per_day"])
+        for day_dict in plan.get("plans_per_day", []):
+            if day_dict["date"] in state.days:
+                # Older plans could repeat a date - lookups only ever found the first
+                continue
+            day = state.add_day(day_dict["date"], _values(day_dict))
+            for order, meal in enumerate(day_dict.get("meals", [])):
+                day.add(PlannedMeal.from_dict(meal, order))
+        return state
+
+
+def _values(item: Dict[str, Any]) -> array:
+    """calories + MACRO_KEYS of a meal or day dict, as a compact double array."""
+    macros = item.get("macros") or {}
+    return array("d", [item.get("calories", 0)] + [macros.get(key, 0) for key in MACRO_KEYS])
+
+
 class DietManager:
-    def __init__(self, user):
+    def __init__(self, user, changes=None):
         self.user = user
-        if not user.diet_plan:
-            self.user.diet_plan = {}
+        # Optional change listener, e.g. services.plan_unit_of_work.PlanUnitOfWork
+        self.changes = changes
+        if isinstance(user.diet_plan, dict) and user.diet_plan:
+            # Plan stored in the dict shape - load it into the compact structure
+            self.user.diet_plan = PlanState.from_dict(user.diet_plan)
+
+    @property
+    def plan(self) -> PlanState:
+        if not isinstance(self.user.diet_plan, PlanState):
+            raise ValueError("No diet plan")
+        return self.user.diet_plan
+
+    def to_dict(self) -> Dict[str, Any] | None:
+        """The plan in its original nested dict shape (serialization view)."""
+        plan = self.user.diet_plan
+        return plan.to_dict() if isinstance(plan, PlanState) else None
 
     # ---------------- Diet level ----------------
     def create_diet(self, goal: str, date_from: str, duration: int, meals_per_day: int):
@@ -53,75 +220,115 @@ class DietManager:
         start_date = datetime.strptime(date_from, "%Y-%m-%d").date()
         end_date = start_date + timedelta(days=duration)
 
-        self.user.diet_plan = {
-            "goal": goal,
-            "date_from": start_date.isoformat(),  # save as ISO string
-            "date_to": end_date.isoformat(),      # calculated end date
-            "duration_in_days": duration,
-            "meals_per_day": meals_per_day,
-            "plans_per_day": []
-        }
+        self.user.diet_plan = PlanState(
+            goal=goal,
+            date_from=start_date.isoformat(),  # save as ISO string
+            date_to=end_date.isoformat(),      # calculated end date
+            duration_in_days=duration,
+            meals_per_day=meals_per_day,
+        )
+        if self.changes is not None:
+            self.changes.plan_created(self.user.diet_plan)
         return self.user.diet_plan
 #
     def finish_diet(self):
         if self.user.diet_plan:
             if not self.user.finished_diet_plans:
                 self.user.finished_diet_plans = []
-            self.user.finished_diet_plans.append(self.user.diet_plan)
+            # Finished plans are only read back - keep them in the dict shape
+            self.user.finished_diet_plans.append(self.to_dict())
             self.user.diet_plan = None
+            if self.changes is not None:
+                self.changes.plan_finished()
 
     def delete_diet(self):
         self.user.diet_plan = None
+        if self.changes is not None:
+            self.changes.plan_deleted()
 
     # ---------------- Day level ----------------
     def add_day_plan(self, date, calories=0, macros=None):
         if macros is None:
             macros = {"total fat": 0, "cholesterol": 0, "sodium": 0, "carbohydrates": 0, "protein": 0}
+        values = _values({"calories": calories, "macros": macros})
+        day = self.plan.add_day(date, values)
+        if self.changes is not None:
+            self.changes.day_added(day, values)
+        return day
 
-        day_plan = {
-            "date": date,
-            "calories": calories,
-            "macros": macros,
-            "meals": []
-        }
-        self.user.diet_plan["plans_per_day"].append(day_plan)
-        return day_plan
+    def _day(self, date) -> DayPlan:
+        day = self.plan.day(date)
+        if day is None:
+            raise ValueError("Day plan not found")
+        return day
 
     # ---------------- Meal level ----------------
     def add_meal(self, date, meal):
-        for day in self.user.diet_plan["plans_per_day"]:
-            if day["date"] == date:
-                day["meals"].append(meal)
-                self._recalculate_totals(day)
-                return day
-        raise ValueError("Day plan not found")
+        day = self._day(date)
+        planned = PlannedMeal.from_dict(meal, day.next_order)
+        day.add(planned)
+        if len(day.meals) == 1:
+            # First meal replaces whatever totals the day was created with
+            self.plan.totals[day.row] = planned.values
+        else:
+            self._apply_delta(day, new_meal=planned)
+        if self.changes is not None:
+            self.changes.meal_added(day, planned)
+        return day
 
     def update_meal(self, date, meal_name, new_values):
-        for day in self.user.diet_plan["plans_per_day"]:
-            if day["date"] == date:
-                for meal in day["meals"]:
-                    if meal["name"] == meal_name:
-                        meal.update(new_values)
-                        self._recalculate_totals(day)
-                        return meal
-        raise ValueError("Meal not found")
+        day = self.plan.day(date)
+        meal = day.first(meal_name) if day is not None else None
+        if meal is None:
+            raise ValueError("Meal not found")
+
+        old_values = array("d", meal.values)
+        meal.update(new_values)
+        if meal.name != meal_name:
+            day.rename(meal, meal_name)
+        self.plan.totals[day.row] += np.subtract(meal.values, old_values)
+        if self.changes is not None:
+            self.changes.meal_updated(day, meal)
+        return meal
 
     def remove_meal(self, date, meal_name):
-        for day in self.user.diet_plan["plans_per_day"]:
-            if day["date"] == date:
-                day["meals"] = [m for m in day["meals"] if m["name"] != meal_name]
-                self._recalculate_totals(day)
-                return day
+        day = self.plan.day(date)
+        if day is None:
+            return None
+        for meal in day.pop_all(meal_name):
+            self._apply_delta(day, old_meal=meal)
+            if self.changes is not None:
+                self.changes.meal_removed(day, meal)
+        return day
 
-    # ---------------- Utility ----------------
-    def _recalculate_totals(self, day):
-        total_calories = 0
-        total_macros = {"total fat": 0, "cholesterol": 0, "sodium": 0, "carbohydrates": 0, "protein": 0}
+    def verify_totals(self, fix=True):
+        """
+        Full recompute of every day, catching drift from the incremental updates.
+        Returns the dates whose totals were off.
+        """
+        if not isinstance(self.user.diet_plan, PlanState):
+            return []
+        plan = self.plan
+        drifted = []
+        for day in plan.days.values():
+            expected = self._recalculate_totals(day)
+            if np.any(np.abs(plan.totals[day.row] - expected) > 1e-6):
+                drifted.append(day.date)
+                if fix:
+                    plan.totals[day.row] = expected
+        return drifted
 
-        for meal in day["meals"]:
-            total_calories += meal.get("calories", 0)
-            for k in total_macros.keys():
-                total_macros[k] += meal.get("macros", {}).get(k, 0)
+    # ---------------- Utility ----------------
+    def _apply_delta(self, day, old_meal=None, new_meal=None):
+        """Adjust day totals by (new_meal - old_meal) instead of re-summing every meal."""
+        row = self.plan.totals[day.row]
+        if old_meal is not None:
+            row -= old_meal.values
+        if new_meal is not None:
+            row += new_meal.values
 
-        day["calories"] = total_calories
-        day["macros"] = total_macros
+    def _recalculate_totals(self, day):
+        totals = np.zeros(len(NUTRIENTS))
+        for meal in day.meals.values():
+            totals += meal.values
+        return totals
@@ -0,0 +1,373 @@
+"""
+Nearest-neighbour dish selection over MealTemplate macro vectors.
+
+"Select dishes whose macronutrient profile is closest to the remaining
+macro budget" is a k-nearest query in (protein, carbs, fats, calories)
+space. Every `MealTemplate.category` gets its own dense float64 matrix
+with precomputed squared norms, so one query is a single BLAS
+matrix-vector product plus `argpartition` - no Python loop over
+templates. Global templates and every user's private ones live in the
+same matrix; an owner column masks out other users' dishes.
+
+The process-wide index is built once from a column query and then kept
+current incrementally: template changes are collected by session hooks
+and applied (one SELECT for the changed ids) on the next `get_dish_index`.
+Updates change the arrays in place, so reads of a shared index take the
+same lock; frozen copies (`freeze`, e.g. the planner's per-request
+copies) are never changed and are read without it.
+"""
+import itertools
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Iterable, Sequence
+
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models.meal import MealTemplate
+
+
+FEATURES = ("protein", "carbs", "fats", "calories")
+# Each dimension weighted to kcal, so 1 g of fat counts like 9 kcal of calories
+FEATURE_WEIGHTS = np.array([4.0, 4.0, 9.0, 1.0])
+
+GLOBAL_OWNER = -1
+INITIAL_CAPACITY = 64
+
+# Process-wide, so a rebuilt index never reuses the version of the one it replaced
+_versions = itertools.count(1)
+
+
+@dataclass(frozen=True, slots=True)
+class DishMatch:
+    template_id: int
+    distance: float
+
+
+class CategoryIndex:
+    """Dense weighted vectors of one category's templates, swap-remove on delete."""
+
+    def __init__(self, weights: np.ndarray = FEATURE_WEIGHTS) -> None:
+        self.weights = weights
+        self.size = 0
+        self.vectors = np.zeros((INITIAL_CAPACITY, len(FEATURES)), dtype=np.float64)
+        self.norms = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self.ids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.owners = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._rows: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, template_id: int) -> bool:
+        return template_id in self._rows
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("vectors", "norms", "ids", "owners"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def extend(self, ids: Sequence[int], owners: Sequence[int | None], vectors: np.ndarray) -> None:
+        """Append many new templates at once (bulk build)."""
+        n = len(ids)
+        self._grow(self.size + n)
+        rows = slice(self.size, self.size + n)
+        weighted = np.asarray(vectors, dtype=np.float64) * self.weights
+        self.vectors[rows] = weighted
+        self.norms[rows] = np.einsum("ij,ij->i", weighted, weighted)
+        self.ids[rows] = ids
+        self.owners[rows] = [GLOBAL_OWNER if owner is None else owner for owner in owners]
+        for offset, template_id in enumerate(ids):
+            self._rows[int(template_id)] = self.size + offset
+        self.size += n
+
+    def upsert(self, template_id: int, owner: int | None, vector: Sequence[float]) -> None:
+        row = self._rows.get(template_id)
+        if row is None:
+            self.extend([template_id], [owner], np.asarray([vector]))
+            return
+        weighted = np.asarray(vector, dtype=np.float64) * self.weights
+        self.vectors[row] = weighted
+        self.norms[row] = weighted @ weighted
+        self.owners[row] = GLOBAL_OWNER if owner is None else owner
+
+    def remove(self, template_id: int) -> None:
+        row = self._rows.pop(template_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            for array in (self.vectors, self.norms, self.ids, self.owners):
+                array[row] = array[last]
+            self._rows[int(self.ids[row])] = row
+        self.size = last
+
+    def features(self, template_ids: Iterable[int]) -> np.ndarray:
+        """Unweighted (protein, carbs, fats, calories) rows of the given templates."""
+        rows = [self._rows[int(i)] for i in template_ids]
+        return self.vectors[rows] / self.weights
+
+    def nearest_many(
+        self,
+        targets: np.ndarray,
+        k: int,
+        user_id: int | None = None,
+        exclude: Iterable[int] = (),
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest templates for each row of `targets` (shape (m, 4)).
+
+        Returns (template_ids, distances), both of shape (m, min(k, visible)),
+        nearest first.
+        """
+        targets = np.atleast_2d(np.asarray(targets, dtype=np.float64)) * self.weights
+        n = self.size
+        vectors, norms, owners = self.vectors[:n], self.norms[:n], self.owners[:n]
+
+        # |v - t|^2 = |v|^2 - 2 v.t + |t|^2
+        distances = norms[None, :] - 2.0 * (targets @ vectors.T) + np.einsum("ij,ij->i", targets, targets)[:, None]
+
+        hidden = owners != GLOBAL_OWNER
+        if user_id is not None:
+            hidden &= owners != user_id
+        excluded = [self._rows[i] for i in exclude if i in self._rows]
+        if excluded:
+            hidden[excluded] = True
+        distances[:, hidden] = np.inf
+
+        k = min(k, n - int(hidden.sum()))
+        if k <= 0:
+            return np.zeros((len(targets), 0), dtype=np.int64), np.zeros((len(targets), 0))
+
+        if k < n:
+            part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(n), (len(targets), 1))
+        part_distances = np.take_along_axis(distances, part, axis=1)
+        order = np.argsort(part_distances, axis=1, kind="stable")
+        rows = np.take_along_axis(part, order, axis=1)
+        nearest = np.take_along_axis(part_distances, order, axis=1)
+        return self.ids[rows], np.sqrt(np.maximum(nearest, 0.0))
+
+
+class DishIndex:
+    """One CategoryIndex per MealTemplate.category."""
+
+    def __init__(self, weights: np.ndarray = FEATURE_WEIGHTS) -> None:
+        self.weights = weights
+        self.categories: dict[str, CategoryIndex] = {}
+        self._category_of: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._frozen = False
+        self._stale: set[int] = set()
+        # Changes with every template update - keys results derived from the catalog
+        self.version = next(_versions)
+
+    def __len__(self) -> int:
+        return len(self._category_of)
+
+    @classmethod
+    def from_session(cls, session: Session, weights: np.ndarray = FEATURE_WEIGHTS) -> "DishIndex":
+        index = cls(weights)
+        rows = session.execute(
+            select(MealTemplate.id, MealTemplate.user_id, MealTemplate.category, *_feature_columns())
+            .order_by(MealTemplate.category, MealTemplate.id)
+        ).all()
+
+        by_category: dict[str, list] = {}
+        for row in rows:
+            by_category.setdefault(row.category, []).append(row)
+        for category, category_rows in by_category.items():
+            vectors = np.array([row[3:] for row in category_rows], dtype=np.float64).reshape(-1, len(FEATURES))
+            index._category(category).extend(
+                [row.id for row in category_rows],
+                [row.user_id for row in category_rows],
+                vectors,
+            )
+            index._category_of.update((row.id, category) for row in category_rows)
+        return index
+
+    def freeze(self) -> "DishIndex":
+        """Make the index read-only: updates raise, reads no longer lock."""
+        self._frozen = True
+        return self
+
+    def _reading(self):
+        return nullcontext() if self._frozen else self._lock
+
+    def _category(self, category: str) -> CategoryIndex:
+        if category not in self.categories:
+            self.categories[category] = CategoryIndex(self.weights)
+        return self.categories[category]
+
+    # ---------------- Updates ----------------
+    def upsert(self, template_id: int, category: str, owner: int | None, vector: Sequence[float]) -> None:
+        if self._frozen:
+            raise RuntimeError("Frozen dish index")
+        with self._lock:
+            previous = self._category_of.get(template_id)
+            if previous is not None and previous != category:
+                self.categories[previous].remove(template_id)
+            self._category(category).upsert(template_id, owner, vector)
+            self._category_of[template_id] = category
+            self.version = next(_versions)
+
+    def remove(self, template_id: int) -> None:
+        if self._frozen:
+            raise RuntimeError("Frozen dish index")
+        with self._lock:
+            category = self._category_of.pop(template_id, None)
+            if category is not None:
+                self.categories[category].remove(template_id)
+                self.version = next(_versions)
+
+    def mark_stale(self, template_ids: Iterable[int]) -> None:
+        """Queue templates to be re-read on the next `refresh`."""
+        with self._lock:
+            self._stale.update(template_ids)
+
+    def refresh(self, session: Session) -> int:
+        """Re-read the stale templates (one SELECT); deleted ones are dropped."""
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        if not stale:
+            return 0
+
+        rows = session.execute(
+            select(MealTemplate.id, MealTemplate.user_id, MealTemplate.category, *_feature_columns())
+            .where(MealTemplate.id.in_(stale))
+        ).all()
+        for row in rows:
+            self.upsert(row.id, row.category, row.user_id, row[3:])
+        for template_id in stale - {row.id for row in rows}:
+            self.remove(template_id)
+        return len(stale)
+
+    # ---------------- Queries ----------------
+    def nearest(
+        self,
+        category: str,
+        target: Sequence[float],
+        k: int = 10,
+        user_id: int | None = None,
+        exclude: Iterable[int] = (),
+    ) -> list[DishMatch]:
+        """k templates of `category` closest to `target` = (protein, carbs, fats, calories)."""
+        ids, distances = self.nearest_many(category, [target], k, user_id, exclude)
+        return [DishMatch(int(i), float(d)) for i, d in zip(ids[0], distances[0])]
+
+    def nearest_many(
+        self,
+        category: str,
+        targets: Sequence[Sequence[float]] | np.ndarray,
+        k: int = 10,
+        user_id: int | None = None,
+        exclude: Iterable[int] = (),
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Batched `nearest` - one matrix product for all targets (e.g. every day of a plan)."""
+        with self._reading():
+            index = self.categories.get(category)
+            if index is None or not len(index):
+                m = len(targets)
+                return np.zeros((m, 0), dtype=np.int64), np.zeros((m, 0))
+            return index.nearest_many(targets, k, user_id, exclude)
+
+    def has_private(self, user_id: int | None) -> bool:
+        """Whether `user_id` owns any template (results then differ from other users')."""
+        if user_id is None:
+            return False
+        with self._reading():
+            return any(
+                bool(np.any(index.owners[:len(index)] == user_id)) for index in self.categories.values()
+            )
+
+    def features(self, category: str, template_ids: Iterable[int]) -> np.ndarray:
+        """Unweighted feature vectors, shape (len(template_ids), 4)."""
+        with self._reading():
+            return self.categories[category].features(template_ids)
+
+    def visible(self, user_id: int | None) -> tuple[int, dict[str, tuple[np.ndarray, np.ndarray]]]:
+        """
+        (version, {category: (ids, features)}) of the templates `user_id` can see.
+
+        A consistent copy: taken under the lock, tagged with the version it
+        was taken at. Features are unweighted.
+        """
+        with self._reading():
+            templates = {}
+            for category, index in self.categories.items():
+                n = len(index)
+                owners = index.owners[:n]
+                shown = owners == GLOBAL_OWNER
+                if user_id is not None:
+                    shown |= owners == user_id
+                templates[category] = (index.ids[:n][shown].copy(), index.vectors[:n][shown] / index.weights)
+            return self.version, templates
+
+
+def _feature_columns():
+    return [getattr(MealTemplate, name) for name in FEATURES]
+
+
+_index: DishIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_dish_index(session: Session) -> DishIndex:
+    """Process-wide index, built on first use and refreshed with pending template changes."""
+    global _index
+    # Local reference - a concurrent invalidate_dish_index may reset the global at any time
+    with _index_lock:
+        if _index is None:
+            _index = DishIndex.from_session(session)
+        index = _index
+    index.refresh(session)
+    return index
+
+
+def invalidate_dish_index() -> None:
+    """Drop the whole index - rebuilt on next use (e.g. after a bulk template import)."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def mark_templates_changed(session: Session, template_ids: Iterable[int]) -> None:
+    """
+    Record template ids changed in this transaction (also by bulk SQL, e.g.
+    `nutrition_recompute.recompute_templates`); applied after commit.
+    """
+    session.info.setdefault("dish_index_changes", set()).update(template_ids)
+
+
+# ---------------- Session hooks ----------------
+
+@event.listens_for(Session, "after_flush")
+def _collect_template_changes(session, flush_context) -> None:
+    changed = [
+        obj.id for obj in session.new | session.dirty | session.deleted
+        if isinstance(obj, MealTemplate)
+    ]
+    if changed:
+        mark_templates_changed(session, changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_template_changes(session) -> None:
+    changed = session.info.pop("dish_index_changes", None)
+    if changed and _index is not None:
+        _index.mark_stale(changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_template_changes(session) -> None:
+    session.info.pop("dish_index_changes", None)
@@ -0,0 +1,181 @@
+"""
+Constant-time random dish draws for varied plans.
+
+Templates are bucketed once per (category, calorie band, dominant macro)
+- e.g. "dinner, 500-600 kcal, protein-heavy" - and every bucket gets a
+Vose alias table, so a weighted draw is one random index plus one coin
+flip, whatever the bucket or catalog size. Variety is a rolling
+exclusion window (any container of recently used template ids, e.g. the
+last days' picks): a drawn template that is in the window is rejected
+and redrawn, which stays O(1) on average as long as buckets are larger
+than the window. Buckets that are too small or exhausted fall back to
+the neighbouring calorie bands.
+
+Used by the planner as an alternative to nearest-neighbour candidates
+(`plan_solver.sampled_slot_candidates`): the k candidates of a slot are
+drawn from the band matching the slot's calories instead of being the k
+closest templates, which gives a varied pool per day at O(k) cost.
+"""
+from dataclasses import dataclass
+from typing import Container, Mapping
+
+import numpy as np
+
+from services.dish_index import DishIndex
+
+
+DEFAULT_BAND_KCAL = 100.0
+DEFAULT_MAX_ATTEMPTS = 8
+# How many calorie bands to each side are tried when a bucket runs dry
+DEFAULT_BAND_REACH = 3
+
+MACRO_CLASSES = ("protein", "carbs", "fats")
+# kcal per gram of protein, carbs, fats
+_ENERGY = np.array([4.0, 4.0, 9.0])
+
+
+@dataclass
+class AliasTable:
+    """Vose alias table over `ids` - O(1) weighted draws."""
+    ids: np.ndarray
+    prob: np.ndarray
+    alias: np.ndarray
+
+    @classmethod
+    def build(cls, ids: np.ndarray, weights: np.ndarray) -> "AliasTable":
+        n = len(ids)
+        scaled = np.asarray(weights, dtype=np.float64) * n / weights.sum()
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s], alias[s] = scaled[s], l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Leftovers are 1 up to rounding
+        return cls(np.asarray(ids, dtype=np.int64), prob, alias)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def draw(self, rng: np.random.Generator) -> int:
+        i = int(rng.integers(len(self.ids)))
+        return int(self.ids[i] if rng.random() < self.prob[i] else self.ids[self.alias[i]])
+
+
+def macro_class(features: np.ndarray) -> np.ndarray:
+    """Index into MACRO_CLASSES of the macro giving most of the energy, per row."""
+    return np.argmax(np.asarray(features)[:, :3] * _ENERGY, axis=1)
+
+
+class DishSampler:
+    """Alias-table buckets per (category, calorie band, macro class)."""
+
+    def __init__(self, band_kcal: float = DEFAULT_BAND_KCAL) -> None:
+        self.band_kcal = band_kcal
+        self.buckets: dict[tuple[str, int, int], AliasTable] = {}
+        # category -> bands present, to walk to neighbours without probing empty ones
+        self._bands: dict[str, dict[int, list[int]]] = {}
+
+    def band(self, calories: float) -> int:
+        return int(calories // self.band_kcal)
+
+    @classmethod
+    def from_index(
+        cls,
+        index: DishIndex,
+        user_id: int | None = None,
+        weights: Mapping[int, float] | None = None,
+        band_kcal: float = DEFAULT_BAND_KCAL,
+    ) -> "DishSampler":
+        """
+        Bucket the templates visible to `user_id`.
+
+        `weights` (template_id -> weight, default 1) biases the draws, e.g.
+        toward well rated dishes.
+        """
+        sampler = cls(band_kcal)
+        _, templates = index.visible(user_id)
+        for category, (ids, features) in templates.items():
+            # Templates without computed nutrition can't be scaled toward anything
+            usable = features.any(axis=1)
+            sampler.add_category(category, ids[usable], features[usable], weights)
+        return sampler
+
+    def add_category(
+        self,
+        category: str,
+        ids: np.ndarray,
+        features: np.ndarray,
+        weights: Mapping[int, float] | None = None,
+    ) -> None:
+        bands = (features[:, 3] // self.band_kcal).astype(np.int64)
+        classes = macro_class(features)
+        template_weights = np.array([weights.get(int(i), 1.0) for i in ids] if weights else np.ones(len(ids)))
+
+        by_band = self._bands.setdefault(category, {})
+        for band, cls_ in set(zip(bands.tolist(), classes.tolist())):
+            members = (bands == band) & (classes == cls_) & (template_weights > 0)
+            if members.any():
+                self.buckets[(category, band, cls_)] = AliasTable.build(ids[members], template_weights[members])
+                by_band.setdefault(band, []).append(cls_)
+
+    def _bucket_order(self, category: str, band: int, cls_: int | None, reach: int):
+        """Buckets to try: the target band first, then neighbours by distance."""
+        bands = self._bands.get(category, {})
+        for offset in [0] + [sign * d for d in range(1, reach + 1) for sign in (-1, 1)]:
+            classes = bands.get(band + offset, ())
+            if cls_ is not None and cls_ in classes:
+                yield self.buckets[(category, band + offset, cls_)]
+            for other in classes:
+                if other != cls_:
+                    yield self.buckets[(category, band + offset, other)]
+
+    def sample(
+        self,
+        category: str,
+        calories: float,
+        rng: np.random.Generator,
+        recent: Container[int] = (),
+        macro: int | None = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        reach: int = DEFAULT_BAND_REACH,
+    ) -> int | None:
+        """One template near `calories` not in `recent`; None if nothing is left within reach."""
+        for table in self._bucket_order(category, self.band(calories), macro, reach):
+            for _ in range(max_attempts):
+                template_id = table.draw(rng)
+                if template_id not in recent:
+                    return template_id
+        return None
+
+    def sample_many(
+        self,
+        category: str,
+        calories: float,
+        k: int,
+        rng: np.random.Generator,
+        recent: Container[int] = (),
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        reach: int = DEFAULT_BAND_REACH,
+    ) -> list[int]:
+        """Up to k distinct templates, drawn bucket by bucket starting at the target band."""
+        picked: dict[int, None] = {}
+        for table in self._bucket_order(category, self.band(calories), None, reach):
+            # A bucket smaller than what is still missing is taken whole
+            if len(table) <= k - len(picked):
+                picked.update((int(i), None) for i in table.ids if int(i) not in recent)
+            else:
+                misses = 0
+                while len(picked) < k and misses < max_attempts:
+                    template_id = table.draw(rng)
+                    if template_id in recent or template_id in picked:
+                        misses += 1
+                        continue
+                    picked[template_id] = None
+                    misses = 0
+            if len(picked) >= k:
+                break
+        return list(picked)[:k]
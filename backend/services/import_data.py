@@ -1,10 +1,41 @@
-import pandas as pd
-from backend.databases.database import get_db
+"""
+Import the CIQUAL food composition table into the ingredient catalog.
 
-from backend.models.models import Base, Ingredient, IngredientCategory, IngredientNutrition
+The CSV is streamed in chunks, categories are resolved in a single pre-pass
+and ingredients are written with batched multi-row statements (or COPY on
+PostgreSQL + psycopg2), so memory use does not grow with the file size.
+
+Every row carries a content hash, so a refresh can run in incremental mode
+and only touch the rows that actually changed since the previous release.
+
+After the import a binary catalog snapshot is written for the workers
+(see services.catalog_snapshot) when a snapshot path is configured.
+
+Usage (run from backend/):
+    python -m services.import_data ciqual.csv [--chunk-size 1000] [--no-copy]
+    python -m services.import_data ciqual.csv --incremental [--manifest changes.json]
+    python -m services.import_data ciqual.csv --snapshot catalog.bin
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Iterator
+
+from sqlalchemy import delete, exists, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models.ingredient import Ingredient, IngredientCategory, IngredientUnit
+from models.meal import MealIngredient, MealTemplateIngredient
+from services.catalog_snapshot import refresh_catalog_snapshot, write_snapshot
+from services.ingredient_search import invalidate_search_index
+from services.nutrition_invalidation import invalidate_ingredients
+from utils import log_info
 
-# --- Load CIQUAL data ---
-df = pd.read_csv("ciqual.csv", sep=";")  # adjust separator depending on file
 
 # column mapping
 CIQUAL_COLS = {
@@ -21,48 +52,414 @@ CIQUAL_COLS = {
     "Cholesterol (mg/100g)": "cholesterol"
 }
 
-df = df.rename(columns=CIQUAL_COLS)
+NUTRIENT_FIELDS = ("calories", "protein", "fat", "carbs", "fiber", "sugar", "sodium", "cholesterol")
 
-session = next(get_db())
+# Kolumny zapisywane do tabeli ingredients (kolejność ważna dla COPY)
+INGREDIENT_COLUMNS = (
+    "id", "name", "category_id", "user_id", "source_type", "base_amount", "base_unit",
+) + NUTRIENT_FIELDS + ("content_hash",)
 
-# --- Category cache ---
-categories = {}
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CATEGORY = "Other"
+STAGING_TABLE = "ingredients_import"
 
-for _, row in df.iterrows():
-    # Handle category
-    cat_name = row["category"]
-    if cat_name not in categories:
-        cat = IngredientCategory(name=cat_name)
-        session.add(cat)
-        session.flush()  # get id
-        categories[cat_name] = cat
-    else:
-        cat = categories[cat_name]
-
-    # Create ingredient
-    ingredient = Ingredient(
-        id=int(row["code"]),  # use CIQUAL code as primary key
-        name=row["name"],
-        category=cat,
-        unit="g",
-        source_type="raw"
+
+def _parse_value(raw: str | None) -> float:
+    """
+    Parse a CIQUAL cell into a float.
+
+    CIQUAL uses decimal commas and markers such as "traces", "-" or "< 0,5".
+    Missing values and traces become 0, upper bounds ("< x") become x.
+    """
+    if raw is None:
+        return 0.0
+    value = raw.strip().lstrip("<").strip().replace(",", ".")
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def _normalize_row(raw: dict[str, str]) -> dict | None:
+    """Map a raw CSV row onto ingredient fields, or None if it has no code/name."""
+    row = {CIQUAL_COLS.get(key, key): value for key, value in raw.items()}
+
+    code = (row.get("code") or "").strip()
+    name = (row.get("name") or "").strip()
+    if not code.isdigit() or not name:
+        return None
+
+    normalized = {
+        "id": int(code),  # CIQUAL code jako klucz główny
+        "name": name[:150],
+        "category": ((row.get("category") or "").strip() or DEFAULT_CATEGORY)[:100],
+    }
+    for field in NUTRIENT_FIELDS:
+        normalized[field] = _parse_value(row.get(field))
+    return normalized
+
+
+def _content_hash(row: dict) -> str:
+    """Stable hash of everything the importer writes for a row."""
+    payload = "|".join(
+        [row["name"], row["category"]] + [repr(row[field]) for field in NUTRIENT_FIELDS]
     )
-    session.add(ingredient)
-    session.flush()
-
-    # Create nutrition
-    nutrition = IngredientNutrition(
-        ingredient=ingredient,
-        per_amount=100,
-        per_unit="g",
-        calories=row.get("calories", 0) or 0,
-        protein=row.get("protein", 0) or 0,
-        fat=row.get("fat", 0) or 0,
-        carbs=row.get("carbs", 0) or 0,
-        fiber=row.get("fiber", 0) or 0,
-        sugar=row.get("sugar", 0) or 0
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def iter_ciqual_chunks(
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    sep: str = ";",
+    encoding: str = "utf-8",
+) -> Iterator[list[dict]]:
+    """Stream normalized CIQUAL rows in lists of at most `chunk_size`."""
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.DictReader(f, delimiter=sep)
+        chunk: list[dict] = []
+        for raw in reader:
+            row = _normalize_row(raw)
+            if row is None:
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def resolve_categories(
+    session: Session,
+    path: str,
+    sep: str = ";",
+    encoding: str = "utf-8",
+) -> dict[str, int]:
+    """
+    Pre-pass over the file: create every missing category in one statement.
+
+    Returns:
+        dict: category name -> id
+    """
+    names: set[str] = set()
+    for chunk in iter_ciqual_chunks(path, sep=sep, encoding=encoding):
+        names.update(row["category"] for row in chunk)
+
+    stmt = select(IngredientCategory.name, IngredientCategory.id)
+    categories = dict(session.execute(stmt).all())
+
+    missing = sorted(names - categories.keys())
+    if missing:
+        session.execute(insert(IngredientCategory), [{"name": name} for name in missing])
+        categories = dict(session.execute(stmt).all())
+
+    return categories
+
+
+def _to_record(row: dict, category_ids: dict[str, int]) -> dict:
+    """Build an `ingredients` row from a normalized CIQUAL row."""
+    record = {
+        "id": row["id"],
+        "name": row["name"],
+        "category_id": category_ids[row["category"]],
+        "user_id": None,  # globalny składnik
+        "source_type": "raw",
+        "base_amount": 100.0,  # CIQUAL podaje wartości na 100 g
+        "base_unit": "g",
+    }
+    for field in NUTRIENT_FIELDS:
+        record[field] = row[field]
+    record["content_hash"] = _content_hash(row)
+    return record
+
+
+def _supports_copy(session: Session) -> bool:
+    dialect = session.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def _write_chunk(session: Session, records: list[dict]) -> list[int]:
+    """
+    Upsert one chunk with two batched statements (UPDATE by PK + multi-row INSERT).
+
+    Returns the ids of existing ingredients whose content changed.
+    """
+    ids = [record["id"] for record in records]
+    existing: dict[int, str | None] = dict(session.execute(
+        select(Ingredient.id, Ingredient.content_hash).where(Ingredient.id.in_(ids))
+    ).all())
+
+    to_update = [record for record in records if record["id"] in existing]
+    to_insert = [record for record in records if record["id"] not in existing]
+
+    if to_update:
+        session.execute(update(Ingredient), to_update)
+    if to_insert:
+        session.execute(insert(Ingredient), to_insert)
+    return [record["id"] for record in to_update if existing[record["id"]] != record["content_hash"]]
+
+
+def _copy_chunk(session: Session, records: list[dict]) -> None:
+    """Stream one chunk into the staging table with COPY."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow(["" if record[col] is None else record[col] for col in INGREDIENT_COLUMNS])
+    buffer.seek(0)
+
+    dbapi_connection = session.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(INGREDIENT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+
+def _create_staging_table(session: Session) -> None:
+    session.execute(text(
+        f"CREATE TEMP TABLE {STAGING_TABLE} "
+        f"(LIKE ingredients INCLUDING DEFAULTS) ON COMMIT DROP"
+    ))
+
+
+def _changed_staged_ids(session: Session) -> list[int]:
+    """Ids of existing ingredients whose staged row has different content."""
+    return list(session.execute(text(
+        f"SELECT s.id FROM {STAGING_TABLE} s JOIN ingredients i ON i.id = s.id "
+        f"WHERE i.content_hash IS DISTINCT FROM s.content_hash"
+    )).scalars())
+
+
+def _merge_staging_table(session: Session) -> None:
+    """Move staged rows into `ingredients` with one INSERT ... ON CONFLICT."""
+    columns = ", ".join(INGREDIENT_COLUMNS)
+    assignments = ", ".join(f"{col} = EXCLUDED.{col}" for col in INGREDIENT_COLUMNS if col != "id")
+    session.execute(text(
+        f"INSERT INTO ingredients ({columns}) "
+        f"SELECT {columns} FROM {STAGING_TABLE} "
+        f"ON CONFLICT (id) DO UPDATE SET {assignments}"
+    ))
+
+
+def import_ciqual(
+    session: Session,
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    use_copy: bool = True,
+    sep: str = ";",
+    encoding: str = "utf-8",
+) -> int:
+    """
+    Full (re)load of the CIQUAL table in a single transaction.
+
+    Existing ingredients with the same CIQUAL code are updated in place,
+    so rows referenced by meals and templates are never deleted. The bulk
+    writes bypass the session hooks, so the templates and meals using
+    ingredients whose content changed are recomputed in the same
+    transaction (`invalidate_ingredients`).
+
+    Returns:
+        int: number of imported ingredients
+    """
+    category_ids = resolve_categories(session, path, sep=sep, encoding=encoding)
+
+    use_copy = use_copy and _supports_copy(session)
+    if use_copy:
+        _create_staging_table(session)
+
+    imported = 0
+    changed: list[int] = []
+    for chunk in iter_ciqual_chunks(path, chunk_size, sep=sep, encoding=encoding):
+        records = [_to_record(row, category_ids) for row in chunk]
+        if use_copy:
+            _copy_chunk(session, records)
+        else:
+            changed.extend(_write_chunk(session, records))
+        imported += len(records)
+
+    if use_copy:
+        changed = _changed_staged_ids(session)
+        _merge_staging_table(session)
+
+    stats = invalidate_ingredients(session, changed)
+    session.commit()
+    if stats.ingredients:
+        log_info(
+            f"CIQUAL import changed {stats.ingredients} ingredients; "
+            f"recomputed {stats.templates} templates, {stats.meals} meals"
+        )
+    # Bulk SQL bypasses the search index and snapshot hooks
+    invalidate_search_index()
+    refresh_catalog_snapshot()
+    return imported
+
+
+@dataclass
+class ChangeManifest:
+    """Result of an incremental sync - which ingredient ids were touched."""
+    inserted: list[int] = field(default_factory=list)
+    updated: list[int] = field(default_factory=list)
+    deleted: list[int] = field(default_factory=list)
+    # Usunięte ze źródła, ale nadal używane w posiłkach/szablonach - zostają w bazie
+    retained: list[int] = field(default_factory=list)
+    unchanged: int = 0
+    # Szablony i posiłki przeliczone w tej samej transakcji
+    recomputed_templates: int = 0
+    recomputed_meals: int = 0
+
+    @property
+    def stale_ingredient_ids(self) -> list[int]:
+        """Ids whose nutrition changed or disappeared - dependent caches must be refreshed."""
+        return sorted(self.updated + self.deleted)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["stale_ingredient_ids"] = self.stale_ingredient_ids
+        return data
+
+
+def _delete_missing(session: Session, ids: list[int], manifest: ChangeManifest) -> None:
+    """Delete ingredients gone from the source unless meals or templates still use them."""
+    referenced = select(Ingredient.id).where(
+        Ingredient.id.in_(ids),
+        exists().where(MealIngredient.ingredient_id == Ingredient.id)
+        | exists().where(MealTemplateIngredient.ingredient_id == Ingredient.id),
+    )
+    retained = set(session.execute(referenced).scalars())
+    to_delete = [ingredient_id for ingredient_id in ids if ingredient_id not in retained]
+
+    if to_delete:
+        session.execute(delete(IngredientUnit).where(IngredientUnit.ingredient_id.in_(to_delete)))
+        session.execute(delete(Ingredient).where(Ingredient.id.in_(to_delete)))
+
+    manifest.deleted.extend(sorted(to_delete))
+    manifest.retained.extend(sorted(retained))
+
+
+def sync_ciqual(
+    session: Session,
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    delete_missing: bool = True,
+    sep: str = ";",
+    encoding: str = "utf-8",
+) -> ChangeManifest:
+    """
+    Incremental sync keyed on the CIQUAL code (`Ingredient.id`).
+
+    Only rows whose content hash differs from the stored one are written:
+    new codes are inserted, changed codes updated and - with `delete_missing` -
+    previously imported codes absent from the file are deleted. The bulk
+    writes bypass the session hooks, so the templates and meals using the
+    changed ingredients are recomputed before the single commit.
+
+    Returns:
+        ChangeManifest: ids inserted / updated / deleted by this run
+    """
+    category_ids = resolve_categories(session, path, sep=sep, encoding=encoding)
+
+    # Tylko globalne składniki z importu (mają hash) - prywatne i ręczne nie są ruszane
+    stmt = select(Ingredient.id, Ingredient.content_hash).where(
+        Ingredient.user_id.is_(None),
+        Ingredient.content_hash.is_not(None),
     )
-    session.add(nutrition)
+    known_hashes: dict[int, str] = dict(session.execute(stmt).all())
+    existing_ids = set(session.execute(
+        select(Ingredient.id).where(Ingredient.user_id.is_(None))
+    ).scalars())
+
+    manifest = ChangeManifest()
+    seen: set[int] = set()
+
+    for chunk in iter_ciqual_chunks(path, chunk_size, sep=sep, encoding=encoding):
+        to_insert, to_update = [], []
+        for row in chunk:
+            seen.add(row["id"])
+            record = _to_record(row, category_ids)
+            if row["id"] not in existing_ids:
+                to_insert.append(record)
+            elif known_hashes.get(row["id"]) != record["content_hash"]:
+                to_update.append(record)
+            else:
+                manifest.unchanged += 1
+
+        if to_update:
+            session.execute(update(Ingredient), to_update)
+            manifest.updated.extend(record["id"] for record in to_update)
+        if to_insert:
+            session.execute(insert(Ingredient), to_insert)
+            manifest.inserted.extend(record["id"] for record in to_insert)
+
+    if delete_missing:
+        missing = sorted(known_hashes.keys() - seen)
+        if missing:
+            _delete_missing(session, missing, manifest)
+
+    stats = invalidate_ingredients(session, manifest.stale_ingredient_ids)
+    manifest.recomputed_templates, manifest.recomputed_meals = stats.templates, stats.meals
+    session.commit()
+    if manifest.inserted or manifest.updated or manifest.deleted:
+        invalidate_search_index()
+        refresh_catalog_snapshot()
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import CIQUAL data into the ingredient catalog")
+    parser.add_argument("path", nargs="?", default="ciqual.csv")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--sep", default=";")  # adjust separator depending on file
+    parser.add_argument("--encoding", default="utf-8")
+    parser.add_argument("--no-copy", action="store_true", help="use batched INSERT even on PostgreSQL")
+    parser.add_argument("--incremental", action="store_true", help="write only rows that changed")
+    parser.add_argument("--keep-missing", action="store_true", help="do not delete rows missing from the file")
+    parser.add_argument("--manifest", help="write the change manifest (JSON) to this path")
+    parser.add_argument(
+        "--snapshot",
+        default=settings.catalog_snapshot_path,
+        help="write the binary catalog snapshot to this path after the import",
+    )
+    args = parser.parse_args()
+
+    if args.incremental:
+        with SessionLocal() as session:
+            manifest = sync_ciqual(
+                session,
+                args.path,
+                chunk_size=args.chunk_size,
+                delete_missing=not args.keep_missing,
+                sep=args.sep,
+                encoding=args.encoding,
+            )
+
+        if args.manifest:
+            with open(args.manifest, "w", encoding="utf-8") as f:
+                json.dump(manifest.to_dict(), f, indent=2)
+
+        log_info(
+            f"CIQUAL sync: {len(manifest.inserted)} inserted, {len(manifest.updated)} updated, "
+            f"{len(manifest.deleted)} deleted, {len(manifest.retained)} retained, "
+            f"{manifest.unchanged} unchanged; recomputed {manifest.recomputed_templates} templates, "
+            f"{manifest.recomputed_meals} meals"
+        )
+    else:
+        with SessionLocal() as session:
+            imported = import_ciqual(
+                session,
+                args.path,
+                chunk_size=args.chunk_size,
+                use_copy=not args.no_copy,
+                sep=args.sep,
+                encoding=args.encoding,
+            )
+
+        log_info(f"Imported {imported} CIQUAL ingredients into database")
+
+    if args.snapshot:
+        with SessionLocal() as session:
+            version = write_snapshot(session, args.snapshot)
+        log_info(f"Wrote catalog snapshot {args.snapshot} (version {version:016x})")
+
 
-session.commit()
-print("✅ Imported CIQUAL data into database")
+if __name__ == "__main__":
+    main()
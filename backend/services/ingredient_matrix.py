@@ -0,0 +1,230 @@
+"""
+Array-backed nutrient matrix of the ingredient catalog.
+
+Every ingredient's nutrients are kept per base unit (1 g / 1 ml) in one
+contiguous float64 array indexed by ingredient id, so the totals of any
+number of meals are a single scatter matrix-vector product instead of
+per-ingredient ORM property chains.
+"""
+from typing import Iterable, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.ingredient import Ingredient, IngredientUnit
+
+
+NUTRIENTS = ("calories", "protein", "fat", "carbs", "fiber", "sugar", "sodium", "cholesterol")
+NUTRIENT_INDEX = {name: i for i, name in enumerate(NUTRIENTS)}
+
+# Cached columns on Meal / MealTemplate -> nutrient they hold
+CACHED_COLUMNS = {
+    "calories": "calories",
+    "protein": "protein",
+    "carbs": "carbs",
+    "fats": "fat",
+    "fiber": "fiber",
+}
+
+
+class IngredientMatrix:
+    def __init__(
+        self,
+        ids: np.ndarray,
+        values: np.ndarray,
+        unit_factors: dict[tuple[int, str], float] | None = None,
+    ) -> None:
+        """
+        Parameters:
+        ids (np.ndarray): ingredient ids, shape (n,)
+        values (np.ndarray): nutrients per base unit, shape (n, len(NUTRIENTS))
+        unit_factors (dict): (ingredient_id, unit_name) -> base units per unit
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(ids) > 1 and np.any(ids[1:] < ids[:-1]):
+            order = np.argsort(ids, kind="stable")
+            ids, values = ids[order], values[order]
+        # Already sorted, contiguous input (e.g. a memory-mapped snapshot) is used without a copy
+        self.ids = np.ascontiguousarray(ids)
+        self.values = np.ascontiguousarray(values)
+        self.unit_factors = unit_factors or {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_session(cls, session: Session, where=None) -> "IngredientMatrix":
+        """
+        Load the catalog with two column queries (no ORM objects).
+
+        `where` restricts the ingredients, e.g. `Ingredient.user_id.is_not(None)`.
+        """
+        columns = [getattr(Ingredient, name) for name in NUTRIENTS]
+        stmt = select(Ingredient.id, Ingredient.base_amount, *columns).order_by(Ingredient.id)
+        if where is not None:
+            stmt = stmt.where(where)
+        rows = session.execute(stmt).all()
+
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        data = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(NUTRIENTS) + 1)
+        base_amount = data[:, 0]
+        base_amount[base_amount == 0] = 1.0
+        values = data[:, 1:] / base_amount[:, None]
+
+        # Same rule as MealIngredient.quantity_in_base_units: alternative units
+        # only convert when the ingredient's base unit is grams
+        stmt = (
+            select(IngredientUnit.ingredient_id, IngredientUnit.unit_name, IngredientUnit.gram_equivalent)
+            .join(Ingredient, Ingredient.id == IngredientUnit.ingredient_id)
+            .where(Ingredient.base_unit == "g", IngredientUnit.unit_name != Ingredient.base_unit)
+            .order_by(IngredientUnit.id.desc())
+        )
+        if where is not None:
+            stmt = stmt.where(where)
+        unit_rows = session.execute(stmt).all()
+        # Descending id order so the first matching unit (as in the linear scan) wins
+        unit_factors = {(ingredient_id, unit_name): factor for ingredient_id, unit_name, factor in unit_rows}
+
+        return cls(ids, values, unit_factors)
+
+    def merged(self, other: "IngredientMatrix") -> "IngredientMatrix":
+        """Matrix with the rows of both (disjoint ids); `self` is returned as is if `other` is empty."""
+        if not len(other):
+            return self
+        return IngredientMatrix(
+            np.concatenate([self.ids, other.ids]),
+            np.concatenate([self.values, other.values]),
+            self.unit_factors | other.unit_factors,
+        )
+
+    # ---------------- Lookups ----------------
+    def positions(self, ingredient_ids: Sequence[int] | np.ndarray) -> np.ndarray:
+        """Row positions of the given ingredient ids."""
+        ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+        pos = np.searchsorted(self.ids, ingredient_ids)
+        pos[pos >= len(self.ids)] = 0
+        if len(ingredient_ids) and (len(self.ids) == 0 or np.any(self.ids[pos] != ingredient_ids)):
+            missing = sorted(set(ingredient_ids.tolist()) - set(self.ids.tolist()))
+            raise KeyError(f"Ingredients not in matrix: {missing}")
+        return pos
+
+    def base_quantities(
+        self,
+        ingredient_ids: Sequence[int],
+        quantities: Sequence[float],
+        units: Sequence[str] | None = None,
+    ) -> np.ndarray:
+        """Convert quantities to the ingredients' base units."""
+        quantities = np.asarray(quantities, dtype=np.float64)
+        if units is None or not self.unit_factors:
+            return quantities
+        factors = np.fromiter(
+            (self.unit_factors.get((int(i), u), 1.0) for i, u in zip(ingredient_ids, units)),
+            dtype=np.float64,
+            count=len(quantities),
+        )
+        return quantities * factors
+
+    # ---------------- Totals ----------------
+    def totals(
+        self,
+        ingredient_ids: Sequence[int],
+        quantities: Sequence[float],
+        units: Sequence[str] | None = None,
+    ) -> np.ndarray:
+        """Nutrient totals of one ingredient list, shape (len(NUTRIENTS),)."""
+        pos = self.positions(ingredient_ids)
+        base_qty = self.base_quantities(ingredient_ids, quantities, units)
+        return self.values[pos].T @ base_qty
+
+    def group_totals(
+        self,
+        group_index: Sequence[int] | np.ndarray,
+        ingredient_ids: Sequence[int],
+        quantities: Sequence[float],
+        units: Sequence[str] | None = None,
+        n_groups: int | None = None,
+    ) -> np.ndarray:
+        """
+        Nutrient totals of many ingredient lists at once.
+
+        Row i of the flat input belongs to group `group_index[i]` (e.g. the
+        position of its meal). Returns an array of shape (n_groups, len(NUTRIENTS)).
+        """
+        group_index = np.asarray(group_index, dtype=np.int64)
+        if n_groups is None:
+            n_groups = int(group_index.max()) + 1 if len(group_index) else 0
+
+        pos = self.positions(ingredient_ids)
+        base_qty = self.base_quantities(ingredient_ids, quantities, units)
+        contributions = self.values[pos] * base_qty[:, None]
+
+        out = np.zeros((n_groups, len(NUTRIENTS)), dtype=np.float64)
+        np.add.at(out, group_index, contributions)
+        return out
+
+    def items_totals(self, groups: Iterable[Iterable]) -> np.ndarray:
+        """
+        Totals for lists of MealIngredient / MealTemplateIngredient rows.
+
+        Only plain columns are read (the stored `quantity_base`, or
+        `quantity` + `unit` for rows not flushed yet), so the `ingredient`
+        and `units` relationships are never loaded.
+        """
+        group_index, ingredient_ids, base_quantities = [], [], []
+        n_groups = 0
+        for group in groups:
+            for item in group:
+                base_qty = item.quantity_base
+                if base_qty is None:
+                    base_qty = item.quantity * self.unit_factors.get((item.ingredient_id, item.unit), 1.0)
+                group_index.append(n_groups)
+                ingredient_ids.append(item.ingredient_id)
+                base_quantities.append(base_qty)
+            n_groups += 1
+        return self.group_totals(group_index, ingredient_ids, base_quantities, n_groups=n_groups)
+
+    # ---------------- ORM helpers ----------------
+    def apply_to_meals(self, meals: Sequence) -> np.ndarray:
+        """Recompute cached nutrition of many Meals in one pass, returns their totals."""
+        totals = self.items_totals(meal.meal_ingredients for meal in meals)
+        _write_cached_columns(meals, totals)
+        return totals
+
+    def apply_to_templates(self, templates: Sequence) -> np.ndarray:
+        """Recompute cached nutrition of many MealTemplates in one pass, returns their totals."""
+        totals = self.items_totals(template.template_ingredients for template in templates)
+        _write_cached_columns(templates, totals)
+        return totals
+
+    def apply_to_daily_plans(self, daily_plans: Sequence) -> np.ndarray:
+        """
+        Recompute every meal of many DailyPlans and roll them up into `actual_*`.
+
+        Unlike summing the cached meal columns this also fills
+        `actual_fiber`, `actual_sodium` and `actual_cholesterol`.
+        """
+        meals = [meal for plan in daily_plans for meal in plan.meals]
+        meal_totals = self.apply_to_meals(meals)
+
+        plan_index = np.repeat(np.arange(len(daily_plans)), [len(plan.meals) for plan in daily_plans])
+        totals = np.zeros((len(daily_plans), len(NUTRIENTS)), dtype=np.float64)
+        np.add.at(totals, plan_index, meal_totals)
+
+        for plan, row in zip(daily_plans, totals.tolist()):
+            plan.set_calories(row[NUTRIENT_INDEX["calories"]])
+            plan.actual_protein = row[NUTRIENT_INDEX["protein"]]
+            plan.actual_carbs = row[NUTRIENT_INDEX["carbs"]]
+            plan.actual_fats = row[NUTRIENT_INDEX["fat"]]
+            plan.actual_fiber = row[NUTRIENT_INDEX["fiber"]]
+            plan.actual_sodium = row[NUTRIENT_INDEX["sodium"]]
+            plan.actual_cholesterol = row[NUTRIENT_INDEX["cholesterol"]]
+        return totals
+
+
+def _write_cached_columns(objects: Sequence, totals: np.ndarray) -> None:
+    for obj, row in zip(objects, totals.tolist()):
+        for column, nutrient in CACHED_COLUMNS.items():
+            setattr(obj, column, row[NUTRIENT_INDEX[nutrient]])
@@ -0,0 +1,323 @@
+"""
+Ingredient name search for autocomplete.
+
+The default backend is an in-process index (sorted word prefixes + trigram
+postings) built from the `ingredients` table. Queries rank whole-name
+prefixes first, then word prefixes, then "contains" / typo-tolerant
+trigram matches, and only return rows visible to the caller: global
+ingredients (`user_id IS NULL`) plus the caller's own.
+
+With `ingredient_search_backend = "pg_trgm"` the same API is served by
+PostgreSQL's pg_trgm extension instead.
+
+The in-memory index is kept current like the dish index: ORM inserts,
+renames and deletes of ingredients are collected by session hooks and
+applied after commit. Bulk SQL (the CIQUAL import) bypasses the hooks
+and drops the whole index instead (`invalidate_search_index`).
+"""
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from itertools import chain
+from dataclasses import dataclass
+from typing import Protocol
+
+from sqlalchemy import case, event, func, inspect, literal, or_, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.ingredient import Ingredient
+from services.catalog_snapshot import current_catalog_snapshot
+
+
+DEFAULT_LIMIT = 10
+# Share of the query's trigrams found in the name - same idea as pg_trgm's
+# word_similarity(), so typos in one word of a long name still match
+SIMILARITY_THRESHOLD = 0.6
+# Shorter queries are served by prefixes only - their trigrams match almost everything
+MIN_FUZZY_LENGTH = 3
+
+# Rank classes - lower is better
+RANK_NAME_PREFIX = 0
+RANK_WORD_PREFIX = 1
+RANK_FUZZY = 2
+
+
+@dataclass(frozen=True, slots=True)
+class SearchHit:
+    id: int
+    name: str
+    is_global: bool
+    score: float
+
+
+class SearchBackend(Protocol):
+    def search(self, query: str, user_id: int | None, limit: int = DEFAULT_LIMIT) -> list[SearchHit]:
+        ...
+
+
+def normalize(text: str) -> str:
+    """Casefold and strip accents ("Crème brûlée" -> "creme brulee")."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def escape_like(text: str) -> str:
+    """Escape LIKE wildcards so user input matches literally (with `escape="\\"`)."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def trigrams(text: str) -> set[str]:
+    """pg_trgm-style trigrams: every word padded with two spaces in front, one behind."""
+    grams: set[str] = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class IngredientSearchIndex:
+    """In-memory n-gram / prefix index over ingredient names."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._names: dict[int, str] = {}
+        self._normalized: dict[int, str] = {}
+        self._owners: dict[int, int | None] = {}
+        self._grams: dict[int, set[str]] = {}
+        # Sorted (word, ingredient_id) pairs for prefix range scans
+        self._words: list[tuple[str, int]] = []
+        # trigram -> ingredient ids
+        self._postings: dict[str, set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @classmethod
+    def from_session(cls, session: Session) -> "IngredientSearchIndex":
+        """Build from the table - global names from the catalog snapshot when it is current."""
+        index = cls()
+        stmt = select(Ingredient.id, Ingredient.name, Ingredient.user_id)
+        snapshot = current_catalog_snapshot(session)
+        if snapshot is not None:
+            for ingredient_id, name in zip(snapshot.ids.tolist(), snapshot.names()):
+                index._add(ingredient_id, name, None)
+            stmt = stmt.where(Ingredient.user_id.is_not(None))
+        for ingredient_id, name, user_id in session.execute(stmt):
+            index._add(ingredient_id, name, user_id)
+        index._words.sort()
+        return index
+
+    # ---------------- Updates ----------------
+    def add(self, ingredient_id: int, name: str, user_id: int | None) -> None:
+        """Add or replace one ingredient (e.g. after a user creates a private one)."""
+        with self._lock:
+            self._remove(ingredient_id)
+            self._add(ingredient_id, name, user_id, keep_sorted=True)
+
+    def remove(self, ingredient_id: int) -> None:
+        with self._lock:
+            self._remove(ingredient_id)
+
+    def _add(self, ingredient_id: int, name: str, user_id: int | None, keep_sorted: bool = False) -> None:
+        normalized = normalize(name)
+        grams = trigrams(normalized)
+
+        self._names[ingredient_id] = name
+        self._normalized[ingredient_id] = normalized
+        self._owners[ingredient_id] = user_id
+        self._grams[ingredient_id] = grams
+
+        for word in set(normalized.split()):
+            if keep_sorted:
+                insort(self._words, (word, ingredient_id))
+            else:
+                self._words.append((word, ingredient_id))
+        for gram in grams:
+            self._postings[gram].add(ingredient_id)
+
+    def _remove(self, ingredient_id: int) -> None:
+        normalized = self._normalized.pop(ingredient_id, None)
+        if normalized is None:
+            return
+        for word in set(normalized.split()):
+            pos = bisect_left(self._words, (word, ingredient_id))
+            if pos < len(self._words) and self._words[pos] == (word, ingredient_id):
+                del self._words[pos]
+        for gram in self._grams.pop(ingredient_id):
+            self._postings[gram].discard(ingredient_id)
+        del self._names[ingredient_id]
+        del self._owners[ingredient_id]
+
+    # ---------------- Queries ----------------
+    def _visible(self, ingredient_id: int, user_id: int | None) -> bool:
+        owner = self._owners.get(ingredient_id, -1)
+        return owner is None or (user_id is not None and owner == user_id)
+
+    def _prefix_matches(self, word: str) -> set[int]:
+        """Ids with any word starting with `word`."""
+        matches = set()
+        pos = bisect_left(self._words, (word,))
+        while pos < len(self._words) and self._words[pos][0].startswith(word):
+            matches.add(self._words[pos][1])
+            pos += 1
+        return matches
+
+    def search(self, query: str, user_id: int | None, limit: int = DEFAULT_LIMIT) -> list[SearchHit]:
+        normalized = normalize(query)
+        if not normalized:
+            return []
+
+        with self._lock:
+            query_words = normalized.split()
+            query_grams = trigrams(normalized)
+
+            # Every query word must prefix-match some word of the name
+            prefix_ids = self._prefix_matches(query_words[0])
+            for word in query_words[1:]:
+                if not prefix_ids:
+                    break
+                prefix_ids &= self._prefix_matches(word)
+
+            # Trigram overlap counts for contains / typo matches
+            overlap: Counter[int] = Counter()
+            if len(normalized) >= MIN_FUZZY_LENGTH:
+                overlap.update(chain.from_iterable(self._postings.get(gram, ()) for gram in query_grams))
+
+            n_grams = len(query_grams)
+            ranked = []
+            for ingredient_id in prefix_ids | overlap.keys():
+                if not self._visible(ingredient_id, user_id):
+                    continue
+
+                similarity = overlap.get(ingredient_id, 0) / n_grams
+                name = self._normalized[ingredient_id]
+
+                if name.startswith(normalized):
+                    rank = RANK_NAME_PREFIX
+                elif ingredient_id in prefix_ids:
+                    rank = RANK_WORD_PREFIX
+                elif normalized in name or similarity >= SIMILARITY_THRESHOLD:
+                    rank = RANK_FUZZY
+                else:
+                    continue
+
+                ranked.append((rank, -similarity, len(name), name, ingredient_id))
+
+            return [
+                SearchHit(
+                    id=ingredient_id,
+                    name=self._names[ingredient_id],
+                    is_global=self._owners[ingredient_id] is None,
+                    score=-neg_similarity,
+                )
+                for _, neg_similarity, _, _, ingredient_id in heapq.nsmallest(limit, ranked)
+            ]
+
+
+class PgTrgmSearchBackend:
+    """Search served by PostgreSQL pg_trgm (GIN index `ix_ingredients_name_trgm`)."""
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def search(self, query: str, user_id: int | None, limit: int = DEFAULT_LIMIT) -> list[SearchHit]:
+        query = query.strip()
+        if not query:
+            return []
+
+        similarity = func.word_similarity(query, Ingredient.name)
+        pattern = escape_like(query)
+        is_prefix = Ingredient.name.ilike(f"{pattern}%", escape="\\")
+        visible = Ingredient.user_id.is_(None)
+        if user_id is not None:
+            visible = or_(visible, Ingredient.user_id == user_id)
+
+        stmt = (
+            select(Ingredient.id, Ingredient.name, Ingredient.user_id, similarity.label("score"))
+            .where(visible)
+            .where(or_(
+                is_prefix,
+                Ingredient.name.ilike(f"%{pattern}%", escape="\\"),
+                literal(query).op("<%")(Ingredient.name),
+            ))
+            .order_by(case((is_prefix, 0), else_=1), similarity.desc(), func.length(Ingredient.name))
+            .limit(limit)
+        )
+        return [
+            SearchHit(id=row.id, name=row.name, is_global=row.user_id is None, score=float(row.score))
+            for row in self.session.execute(stmt)
+        ]
+
+
+_index: IngredientSearchIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_search_index(session: Session) -> IngredientSearchIndex:
+    """Process-wide in-memory index, built on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = IngredientSearchIndex.from_session(session)
+    return _index
+
+
+def invalidate_search_index() -> None:
+    """Drop the in-memory index - it is rebuilt on the next search (e.g. after an import)."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def get_search_backend(session: Session) -> SearchBackend:
+    if settings.ingredient_search_backend == "pg_trgm":
+        return PgTrgmSearchBackend(session)
+    return get_search_index(session)
+
+
+# ---------------- Session hooks ----------------
+
+def _name_changed(ingredient: Ingredient) -> bool:
+    state = inspect(ingredient)
+    return state.attrs.name.history.has_changes() or state.attrs.user_id.history.has_changes()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_ingredient_changes(session, flush_context) -> None:
+    """id -> (name, user_id) of added / renamed ingredients, None for deleted ones."""
+    changes = None
+    for obj in session.new | session.dirty | session.deleted:
+        if not isinstance(obj, Ingredient):
+            continue
+        if obj in session.deleted:
+            entry = None
+        elif obj in session.new or _name_changed(obj):
+            entry = (obj.name, obj.user_id)
+        else:
+            continue
+        if changes is None:
+            changes = session.info.setdefault("ingredient_search_changes", {})
+        changes[obj.id] = entry
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_ingredient_changes(session) -> None:
+    changes = session.info.pop("ingredient_search_changes", None)
+    index = _index
+    if not changes or index is None:
+        return
+    for ingredient_id, entry in changes.items():
+        if entry is None:
+            index.remove(ingredient_id)
+        else:
+            index.add(ingredient_id, *entry)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_ingredient_changes(session) -> None:
+    session.info.pop("ingredient_search_changes", None)
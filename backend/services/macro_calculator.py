@@ -1,14 +1,269 @@
+"""
+Daily energy and macronutrient targets.
+
+`calculate_cohort` computes BMR, TDEE and macro grams for a whole cohort
+of users from columnar arrays in one vectorized pass - categorical
+inputs (sex, activity level, goal, diet type) are encoded to small
+integer codes once and every formula becomes a table lookup plus a few
+array operations. `Macronutrients` is the single-user wrapper over it.
+
+BMR is Mifflin-St Jeor, or Katch-McArdle where a body fat percentage is
+known; TDEE is BMR times the activity multiplier.
+"""
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+
+from services.meal_distribution import CALORIES, CARBS, FATS, PROTEIN, distribute
+
+
+SEX_CODES = {"male": 0, "m": 0, "female": 1, "f": 1}
+# Mifflin-St Jeor constant per sex code
+SEX_CONSTANT = np.array([5.0, -161.0])
+
+ACTIVITY_LEVELS = ("sedentary", "light", "moderate", "very", "super")
+# Last entry: no activity level given - TDEE equals BMR
+ACTIVITY_MULTIPLIERS = np.array([1.2, 1.375, 1.55, 1.725, 1.9, 1.0])
+NO_ACTIVITY = len(ACTIVITY_LEVELS)
+
+GOALS = ("maintain", "lose", "gain")
+GOAL_CALORIES = np.array([0.0, -500.0, 500.0])
+GOAL_PROTEIN_PER_KG = np.array([2.2, 2.5, 2.0])
+GOAL_FAT_SHARE = np.array([0.25, 0.30, 0.20])
+
+DIET_TYPES = ("keto", "paleo", "vegan", "vegetarian")
+# (protein, fat, carbs) share of calories per diet type
+DIET_SHARES = np.array([
+    [0.20, 0.70, 0.10],
+    [0.35, 0.35, 0.30],
+    [0.20, 0.30, 0.50],
+    [0.25, 0.30, 0.45],
+])
+NO_DIET = -1
+
+_ENERGY = np.array([4.0, 9.0, 4.0])  # kcal per gram of protein, fat, carbs
+
+
+def _encode(values, codes: dict[str, int], error: str, missing: int | None = None) -> np.ndarray:
+    """
+    Integer codes of a categorical column.
+
+    Integer arrays are taken as already encoded. Strings are looked up
+    case-insensitively once per distinct value (np.unique), then spread
+    back with the inverse indices; None maps to `missing`.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64)
+
+    encoded = np.empty(values.shape, dtype=np.int64)
+    present = np.not_equal(values, None) if values.dtype == object else np.ones(values.shape, dtype=bool)
+    if not present.all():
+        if missing is None:
+            raise ValueError(error)
+        encoded[~present] = missing
+
+    distinct, inverse = np.unique(values[present].astype(str), return_inverse=True)
+    lookup = [codes.get(value.lower()) for value in distinct.tolist()]
+    if None in lookup:
+        raise ValueError(error)
+    encoded[present] = np.array(lookup, dtype=np.int64)[inverse]
+    return encoded
+
+
+def encode_sex(values) -> np.ndarray:
+    return _encode(values, SEX_CODES, "Sex must be 'male' or 'female'.")
+
+
+def encode_activity(values) -> np.ndarray:
+    return _encode(
+        values,
+        {level: i for i, level in enumerate(ACTIVITY_LEVELS)},
+        "Invalid activity level. Choose from: sedentary, light, moderate, very, super.",
+        missing=NO_ACTIVITY,
+    )
+
+
+def encode_goal(values) -> np.ndarray:
+    return _encode(values, {goal: i for i, goal in enumerate(GOALS)}, "Goal must be 'maintain', 'lose', or 'gain'.")
+
+
+def encode_diet(values) -> np.ndarray:
+    return _encode(
+        values,
+        {diet: i for i, diet in enumerate(DIET_TYPES)},
+        "Diet type must be 'keto', 'paleo', 'vegan', or 'vegetarian'.",
+        missing=NO_DIET,
+    )
+
+
+@dataclass
+class CohortMacros:
+    """Per-user results of `calculate_cohort`, one array each (2 decimals)."""
+    bmr: np.ndarray
+    tdee: np.ndarray
+    calories: np.ndarray
+    protein_g: np.ndarray
+    fat_g: np.ndarray
+    carbs_g: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.calories)
+
+    def daily(self) -> np.ndarray:
+        """(users, 4) in the planner's (protein, carbs, fats, calories) order."""
+        return np.column_stack([self.protein_g, self.carbs_g, self.fat_g, self.calories])
+
+    def macros(self, i: int) -> dict:
+        """One user's result in the `Macronutrients.calculate_macros` shape."""
+        return {
+            "calories": float(self.calories[i]),
+            "protein_g": float(self.protein_g[i]),
+            "fat_g": float(self.fat_g[i]),
+            "carbs_g": float(self.carbs_g[i]),
+        }
+
+
+def round2(values) -> np.ndarray:
+    """
+    Elementwise round(x, 2) with the exact result of Python's round.
+
+    np.round scales by 100 first and misrounds values next to a half cent
+    (common with weights like 72.5 kg); those few go through round().
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 100
+    out = np.asarray(np.rint(scaled) / 100)
+    near = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near.any():
+        out[near] = [round(value, 2) for value in values[near].tolist()]
+    return out
+
+
+def meal_targets(daily, meals_per_day: int, strategy: str = "equal", params: tuple = ()) -> np.ndarray:
+    """
+    Per-meal targets of daily (protein, carbs, fats, calories) rows.
+
+    daily (..., 4) -> (..., meals_per_day, 4), one broadcast multiplication
+    by the strategy's cached ratio matrix, rounded to 2 decimals.
+    """
+    return round2(distribute(daily, strategy, meals_per_day, params))
+
+
+def meal_dicts(per_meal: np.ndarray) -> list[dict]:
+    """(meals, 4) per-meal targets in the `calculate_macros` key shape."""
+    return [
+        {
+            "calories": float(meal[CALORIES]),
+            "protein_g": float(meal[PROTEIN]),
+            "fat_g": float(meal[FATS]),
+            "carbs_g": float(meal[CARBS]),
+        }
+        for meal in per_meal
+    ]
+
+
+def calculate_bmr(sex, weight, height, age, body_fat=None) -> np.ndarray:
+    """
+    BMR per user: Katch-McArdle where `body_fat` (percent) is finite, Mifflin-St Jeor otherwise.
+
+    `sex` as strings or SEX_CODES codes; arrays broadcast.
+    """
+    weight = np.asarray(weight, dtype=np.float64)
+    bmr = 10 * weight + 6.25 * np.asarray(height, dtype=np.float64) - 5 * np.asarray(age, dtype=np.float64) \
+        + SEX_CONSTANT[encode_sex(sex)]
+    if body_fat is not None:
+        body_fat = np.asarray(body_fat, dtype=np.float64)
+        lean_mass = weight * (1 - body_fat / 100)
+        bmr = np.where(np.isfinite(body_fat), 370 + 21.6 * lean_mass, bmr)
+    return bmr
+
+
+def diet_split(calories, diet_type) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(protein, fat, carbs) grams of `calories` split by diet type codes / names."""
+    codes = encode_diet(diet_type)
+    grams = np.asarray(calories, dtype=np.float64)[..., None] * DIET_SHARES[codes] / _ENERGY
+    return grams[..., 0], grams[..., 1], grams[..., 2]
+
+
+def calculate_cohort(
+    sex: Sequence | np.ndarray,
+    weight: Sequence[float] | np.ndarray,
+    height: Sequence[float] | np.ndarray,
+    age: Sequence[float] | np.ndarray,
+    activity_level: Sequence | np.ndarray | None = None,
+    body_fat: Sequence[float] | np.ndarray | None = None,
+    goal: Sequence | np.ndarray | str = "maintain",
+    diet_type: Sequence | np.ndarray | str | None = None,
+) -> CohortMacros:
+    """
+    BMR, TDEE and daily macros of many users at once.
+
+    Parameters:
+    sex: 'male'/'female' (or 'm'/'f') per user, or SEX_CODES codes
+    weight, height, age: kg, cm, years
+    activity_level: ACTIVITY_LEVELS names or codes; None (per user or for all) = BMR only
+    body_fat: percent, NaN where unknown
+    goal: 'maintain', 'lose' or 'gain' - per user or one for all
+    diet_type: DIET_TYPES name per user or for all; None keeps the goal split
+
+    Returns:
+    CohortMacros: rounded like `Macronutrients` (TDEE to 2 decimals before the goal is applied)
+    """
+    weight = np.asarray(weight, dtype=np.float64)
+    bmr = calculate_bmr(sex, weight, height, age, body_fat)
+    activity = NO_ACTIVITY if activity_level is None else encode_activity(activity_level)
+    tdee = round2(bmr * ACTIVITY_MULTIPLIERS[activity])
+
+    goals = encode_goal(goal)
+    calories = tdee + GOAL_CALORIES[goals]
+    protein = weight * GOAL_PROTEIN_PER_KG[goals]
+    fat = GOAL_FAT_SHARE[goals] * calories / 9
+    carbs = (calories - (protein * 4 + fat * 9)) / 4
+
+    if diet_type is not None:
+        diets = encode_diet(diet_type)
+        adjusted = diets != NO_DIET
+        if np.any(adjusted):
+            diet_protein, diet_fat, diet_carbs = diet_split(round2(calories), np.where(adjusted, diets, 0))
+            protein = np.where(adjusted, diet_protein, protein)
+            fat = np.where(adjusted, diet_fat, fat)
+            carbs = np.where(adjusted, diet_carbs, carbs)
+
+    return CohortMacros(
+        bmr=round2(bmr),
+        tdee=tdee,
+        calories=round2(calories),
+        protein_g=round2(protein),
+        fat_g=round2(fat),
+        carbs_g=round2(carbs),
+    )
+
+
 class Macronutrients:
-    def __init__(self, sex:str, weight:int, height:int, age:int, activity_level = None) -> None:
-        self.sex = ""
-        self.weight:int = 0
-        self.height:int = 0
-        self.age:int = 0
-        self.activity_level = None 
-        bmr:int = 0  
+    """Single-user view of `calculate_cohort`."""
+
+    def __init__(self, sex:str, weight:int, height:int, age:int, activity_level = None, body_fat = None) -> None:
+        self.sex = sex
+        self.weight:int = weight
+        self.height:int = height
+        self.age:int = age
+        self.activity_level = activity_level
+        self.body_fat = body_fat
+
+    def _cohort(self, goal: str = "maintain", diet_type: str | None = None) -> CohortMacros:
+        return calculate_cohort(
+            [self.sex], [self.weight], [self.height], [self.age],
+            # An empty activity level means BMR only, as None does
+            [self.activity_level] if self.activity_level else None,
+            None if self.body_fat is None else [self.body_fat],
+            [goal], None if diet_type is None else [diet_type],
+        )
+
     def calculate_bmr(self):
         """
-        Calculate BMR using the Mifflin-St Jeor equation.
+        Calculate BMR using the Mifflin-St Jeor equation (Katch-McArdle with body_fat).
 
         Parameters:
         weight (float): Weight in kilograms
@@ -16,68 +271,25 @@ class Macronutrients:
         age (int): Age in years
         sex (str): 'male' or 'female'
         activity_level (str, optional): Choose from ['sedentary', 'light', 'moderate', 'very', 'super']
+        body_fat (float, optional): Body fat percentage
 
         Returns:
         float: BMR or TDEE (if activity_level provided)
         """
-        if self.sex.lower() == "male" or self.sex.lower() == "m":
-            bmr = 10 * self.weight + 6.25 * self.height - 5 * self.age + 5
-        elif self.sex.lower() =="female" or self.sex.lower() =="f":
-            bmr = 10 * self.weight + 6.25 * self.height - 5 * self.age - 161
-        else:
-            raise ValueError("Sex must be 'male' or 'female'.")
-
-        activity_multipliers = {
-        'sedentary': 1.2,
-        'light': 1.375,
-        'moderate': 1.55,
-        'very': 1.725,
-        'super': 1.9
-    }
-        if self.activity_level:
-            activity_level = self.activity_level.lower()
-            if activity_level in activity_multipliers:
-                return round(bmr * activity_multipliers[activity_level],2)
-            else:
-                raise ValueError("Invalid activity level. Choose from: sedentary, light, moderate, very, super.")
-        
-        return round(bmr, 2)
+        return float(self._cohort().tdee[0])
 
     def calculate_macros(self, goal:str):
         """
         Calculate macronutrient distribution based on goal.
 
         Parameters:
-        bmr (float): Basal Metabolic Rate
         goal (str): 'maintain', 'lose', or 'gain'
 
         Returns:
         dict: Macronutrient distribution in grams
         """
-        if goal.lower() == "maintain":
-            calories = self.calculate_bmr()
-            protein = self.weight * 2.2 # 2.2g per kg of body weight        
-            fat = (0.25 * calories) / 9 # 25% of calories from fat
-            carbs = (calories - (protein * 4 + fat * 9)) / 4 # Remaining calories from carbs
-        elif goal.lower() == "lose":
-            calories = self.calculate_bmr() - 500   # 500 calorie deficit for weight loss               
-            protein = self.weight * 2.5 # 2.5g per kg of body weight        
-            fat = (0.30 * calories) / 9 # 30% of calories from fat
-            carbs = (calories - (protein * 4 + fat * 9)) / 4 # Remaining calories from carbs
-        elif goal.lower() == "gain":                
-            calories = self.calculate_bmr() + 500                   # 500 calorie surplus for weight gain
-            protein = self.weight * 2.0 # 2.0g per kg of    body weight             
-            fat = (0.20 * calories) / 9 # 20% of calories from fat
-            carbs = (calories - (protein * 4 + fat * 9)) / 4 # Remaining calories from carbs
-        else:
-            raise ValueError("Goal must be 'maintain', 'lose', or 'gain'.")     
-        return {
-            "calories": round(calories, 2),
-            "protein_g": round(protein, 2),
-            "fat_g": round(fat, 2),
-            "carbs_g": round(carbs, 2)
-        }       
-        
+        return self._cohort(goal).macros(0)
+
     def adjust_macros_for_diet(self, diet_type:str, macros:dict):
         """
         Adjust macronutrient distribution based on diet type.
@@ -89,42 +301,17 @@ class Macronutrients:
         Returns:
         dict: Adjusted macronutrient distribution
         """
-        diet_type = diet_type.lower()
-        if diet_type == "keto":
-            # Keto: 70% fat, 20% protein, 10% carbs
-            total_calories = macros['calories']
-            fat = (0.70 * total_calories) / 9
-            protein = (0.20 * total_calories) / 4
-            carbs = (0.10 * total_calories) / 4
-        elif diet_type == "paleo":
-            # Paleo: 35% protein, 35% fat, 30% carbs
-            total_calories = macros['calories']
-            protein = (0.35 * total_calories) / 4
-            fat = (0.35 * total_calories) / 9
-            carbs = (0.30 * total_calories) / 4
-        elif diet_type == "vegan":
-            # Vegan: 20% protein, 30% fat, 50% carbs
-            total_calories = macros['calories']
-            protein = (0.20 * total_calories) / 4
-            fat = (0.30 * total_calories) / 9
-            carbs = (0.50 * total_calories) / 4
-        elif diet_type == "vegetarian":
-            # Vegetarian: 25% protein, 30% fat, 45% carbs
-            total_calories = macros['calories']
-            protein = (0.25 * total_calories) / 4
-            fat = (0.30 * total_calories) / 9
-            carbs = (0.45 * total_calories) / 4
-        else:
+        if diet_type is None:
             raise ValueError("Diet type must be 'keto', 'paleo', 'vegan', or 'vegetarian'.")
-        
+        total_calories = macros['calories']
+        protein, fat, carbs = diet_split([total_calories], [diet_type])
         return {
             "calories": round(total_calories, 2),
-            "protein_g": round(protein, 2),
-            "fat_g": round(fat, 2),
-            "carbs_g": round(carbs, 2)      
-        }       
-        
-        
+            "protein_g": round(float(protein[0]), 2),
+            "fat_g": round(float(fat[0]), 2),
+            "carbs_g": round(float(carbs[0]), 2)
+        }
+
     def macro_distribution_per_meal(self, macros:dict, meals_per_day:int):
         """
         Distribute macronutrients evenly across meals.
@@ -138,10 +325,26 @@ class Macronutrients:
         """
         if meals_per_day <= 0:
             raise ValueError("Meals per day must be a positive integer.")
-        
+
         return {
             "calories_per_meal": round(macros['calories'] / meals_per_day, 2),
             "protein_g_per_meal": round(macros['protein_g'] / meals_per_day, 2),
             "fat_g_per_meal": round(macros['fat_g'] / meals_per_day, 2),
             "carbs_g_per_meal": round(macros['carbs_g'] / meals_per_day, 2)
         }
+
+    def macro_targets_per_meal(self, macros:dict, meals_per_day:int, strategy:str = "equal", params:tuple = ()):
+        """
+        Distribute macronutrients across meals with a distribution strategy.
+
+        Parameters:
+        macros (dict): Macronutrient distribution
+        meals_per_day (int): Number of meals per day
+        strategy (str): services.meal_distribution strategy, e.g. 'equal', 'protein_priority', 'training_day'
+        params (tuple): Strategy parameters (e.g. per-meal weights for 'custom')
+
+        Returns:
+        list: Macronutrient targets per meal
+        """
+        daily = [macros['protein_g'], macros['carbs_g'], macros['fat_g'], macros['calories']]
+        return meal_dicts(meal_targets(daily, meals_per_day, strategy, params))
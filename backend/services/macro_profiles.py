@@ -0,0 +1,411 @@
+"""
+Per-user macro profile cache.
+
+A user's daily targets depend on their latest `PhysicalData`, their
+height, sex and age, and the goal / meal count of their active plan.
+Rather than loading the measurement history, computing the age and
+re-running the calculator on every request, `MacroProfileCache` keeps a
+`MacroProfile` per user - BMR, TDEE, daily macro grams and the per-meal
+split:
+
+    memory (LRU)  ->  user_macro_profiles table  ->  compute_profiles
+
+Misses are computed for all requested users at once (three queries and
+one `calculate_cohort` pass). With `persist`, computed profiles are
+written to `user_macro_profiles` so they survive restarts.
+
+Profiles are invalidated by the session hooks at the bottom: a new or
+deleted `PhysicalData` row, a change of the user's height, date of birth
+or gender, or of their plans' goal / meals_per_day / is_active deletes
+the persisted row in the same transaction and drops the memory entry on
+commit. Code writing those tables with Core statements (which the hooks
+don't see) calls `mark_profiles_changed` itself. Users without
+measurements, or with a sex the equations don't cover, have no profile.
+
+The age is baked into the BMR, so every profile carries `valid_until` -
+the user's next birthday - and is recomputed from that day on. Persisted
+rows are also checked against the latest measurement and active plan
+when loaded: a profile computed from data that changed meanwhile (and
+stored after the hook deleted the old row) is treated as a miss.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Callable, Iterable
+
+import numpy as np
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from config import settings
+from database import SessionLocal
+from models.diet import DietGoal, DietPlan
+from models.user import PhysicalData, User, UserMacroProfile
+from services.macro_calculator import SEX_CODES, calculate_cohort, meal_dicts, meal_targets
+from utils import log_error
+
+
+DEFAULT_MEALS_PER_DAY = 3
+# (goal, meals_per_day) of users without an active plan
+DEFAULT_GOAL = ("maintain", DEFAULT_MEALS_PER_DAY)
+# services.meal_distribution strategy of MacroProfile.per_meal
+DEFAULT_DISTRIBUTION = "equal"
+
+# DietPlan.goal -> calculate_cohort goal
+MACRO_GOALS = {
+    DietGoal.WEIGHT_LOSS: "lose",
+    DietGoal.MUSCLE_GAIN: "gain",
+    DietGoal.MAINTENANCE: "maintain",
+    DietGoal.HEALTH: "maintain",
+}
+
+# Columns whose change invalidates a profile
+PROFILE_USER_COLUMNS = ("height", "date_of_birth", "gender")
+PROFILE_PLAN_COLUMNS = ("goal", "meals_per_day", "is_active")
+
+
+@dataclass(frozen=True)
+class MacroProfile:
+    user_id: int
+    physical_data_id: int
+    goal: str
+    meals_per_day: int
+    bmr: float
+    tdee: float
+    calories: float
+    protein_g: float
+    fat_g: float
+    carbs_g: float
+    per_meal: tuple[dict, ...]  # {calories, protein_g, fat_g, carbs_g} per meal
+    valid_until: date  # next birthday - the age changes on that day
+
+    def macros(self) -> dict:
+        """Daily targets in the `Macronutrients.calculate_macros` shape."""
+        return {"calories": self.calories, "protein_g": self.protein_g, "fat_g": self.fat_g, "carbs_g": self.carbs_g}
+
+    def daily_target(self) -> tuple[float, float, float, float]:
+        """(protein, carbs, fats, calories) - the planner's target order."""
+        return self.protein_g, self.carbs_g, self.fat_g, self.calories
+
+    @classmethod
+    def from_row(cls, row: UserMacroProfile) -> "MacroProfile":
+        return cls(
+            user_id=row.user_id,
+            physical_data_id=row.physical_data_id,
+            goal=row.goal,
+            meals_per_day=row.meals_per_day,
+            bmr=row.bmr,
+            tdee=row.tdee,
+            calories=row.calories,
+            protein_g=row.protein_g,
+            fat_g=row.fat_g,
+            carbs_g=row.carbs_g,
+            per_meal=tuple(row.per_meal),
+            valid_until=row.valid_until,
+        )
+
+    def to_row(self) -> dict:
+        row = asdict(self)
+        row["per_meal"] = list(self.per_meal)
+        return row
+
+
+@dataclass
+class ProfileCacheStats:
+    hits: int = 0
+    loaded: int = 0  # read from user_macro_profiles
+    computed: int = 0
+    invalidations: int = 0
+    entries: int = 0
+
+
+# ---------------- Computation ----------------
+
+def age_on(date_of_birth: date, today: date) -> int:
+    """Same as `User.age`, for a given day."""
+    return today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+
+
+def next_birthday(date_of_birth: date, today: date) -> date:
+    """First day after `today` on which `age_on` changes (29 Feb -> 1 Mar in other years)."""
+    for year in (today.year, today.year + 1):
+        try:
+            birthday = date_of_birth.replace(year=year)
+        except ValueError:
+            birthday = date(year, 3, 1)
+        if birthday > today:
+            return birthday
+    raise AssertionError("unreachable")
+
+
+def active_plan_goals(session: Session, user_ids: Iterable[int]) -> dict[int, tuple[str, int]]:
+    """(macro goal, meals_per_day) of each user's newest active plan, as User.active_diet_plan."""
+    plans: dict[int, tuple[str, int]] = {}
+    for row in session.execute(
+        select(DietPlan.user_id, DietPlan.goal, DietPlan.meals_per_day)
+        .where(DietPlan.user_id.in_(list(user_ids)), DietPlan.is_active.is_(True))
+        .order_by(DietPlan.created_at.desc(), DietPlan.id.desc())
+    ):
+        plans.setdefault(row.user_id, (MACRO_GOALS[DietGoal(row.goal)], row.meals_per_day))
+    return plans
+
+
+def latest_physical_data(session: Session, user_ids: Iterable[int]) -> dict[int, PhysicalData]:
+    """Newest measurement per user in one query - without loading the history."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    ranked = (
+        select(
+            PhysicalData,
+            func.row_number().over(
+                partition_by=PhysicalData.user_id,
+                order_by=(PhysicalData.recorded_at.desc(), PhysicalData.id.desc()),
+            ).label("rank"),
+        )
+        .where(PhysicalData.user_id.in_(user_ids))
+        .subquery()
+    )
+    latest = aliased(PhysicalData, ranked)
+    return {row.user_id: row for row in session.scalars(select(latest).where(ranked.c.rank == 1))}
+
+
+def compute_profiles(
+    session: Session,
+    user_ids: Iterable[int],
+    today: date | None = None,
+    distribution: str = DEFAULT_DISTRIBUTION,
+) -> dict[int, MacroProfile]:
+    """Profiles of the given users: three queries, one calculator pass, one split per meal count."""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return {}
+    today = today or date.today()
+
+    users = session.execute(
+        select(User.id, User.gender, User.height, User.date_of_birth).where(User.id.in_(user_ids))
+    ).all()
+    physical = latest_physical_data(session, user_ids)
+    plans = active_plan_goals(session, user_ids)
+
+    users = [user for user in users if user.id in physical and str(user.gender).lower() in SEX_CODES]
+    if not users:
+        return {}
+    measurements = [physical[user.id] for user in users]
+    goals = [plans.get(user.id, DEFAULT_GOAL) for user in users]
+
+    cohort = calculate_cohort(
+        sex=[user.gender for user in users],
+        weight=[m.weight for m in measurements],
+        height=[user.height for user in users],
+        age=[age_on(user.date_of_birth, today) for user in users],
+        activity_level=[m.activity_level or None for m in measurements],
+        body_fat=[np.nan if m.body_fat_percentage is None else m.body_fat_percentage for m in measurements],
+        goal=[goal for goal, _ in goals],
+    )
+
+    meal_counts = np.array([meals_per_day for _, meals_per_day in goals])
+    daily = cohort.daily()
+    per_meal = [None] * len(users)
+    for meals_per_day in np.unique(meal_counts).tolist():
+        rows = np.flatnonzero(meal_counts == meals_per_day)
+        for row, targets in zip(rows.tolist(), meal_targets(daily[rows], meals_per_day, distribution)):
+            per_meal[row] = tuple(meal_dicts(targets))
+
+    profiles = {}
+    for i, user in enumerate(users):
+        macros = cohort.macros(i)
+        goal, meals_per_day = goals[i]
+        profiles[user.id] = MacroProfile(
+            user_id=user.id,
+            physical_data_id=measurements[i].id,
+            goal=goal,
+            meals_per_day=meals_per_day,
+            bmr=float(cohort.bmr[i]),
+            tdee=float(cohort.tdee[i]),
+            per_meal=per_meal[i],
+            valid_until=next_birthday(user.date_of_birth, today),
+            **macros,
+        )
+    return profiles
+
+
+# ---------------- Cache ----------------
+
+class MacroProfileCache:
+    """Thread-safe LRU of MacroProfiles, backed by user_macro_profiles."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        persist: bool = True,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        self.max_entries = max_entries
+        self.persist = persist
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self._profiles: OrderedDict[int, MacroProfile] = OrderedDict()
+        # Bumped by invalidate - a load that started before is not cached
+        self._generations: dict[int, int] = {}
+        self.stats = ProfileCacheStats()
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def get(self, user_id: int, session: Session | None = None, today: date | None = None) -> MacroProfile | None:
+        return self.get_many([user_id], session, today).get(user_id)
+
+    def get_many(
+        self,
+        user_ids: Iterable[int],
+        session: Session | None = None,
+        today: date | None = None,
+    ) -> dict[int, MacroProfile]:
+        """
+        Profiles of the given users (missing ones are absent).
+
+        `session` is only read from; persisting uses a session of its own.
+        """
+        today = today or date.today()
+        found: dict[int, MacroProfile] = {}
+        missing = []
+        with self._lock:
+            for user_id in dict.fromkeys(user_ids):
+                profile = self._profiles.get(user_id)
+                if profile is None or today >= profile.valid_until:
+                    missing.append(user_id)
+                else:
+                    self._profiles.move_to_end(user_id)
+                    found[user_id] = profile
+            self.stats.hits += len(found)
+            generations = {user_id: self._generations.get(user_id, 0) for user_id in missing}
+        if not missing:
+            return found
+
+        with nullcontext(session) if session is not None else self.session_factory() as read_session:
+            loaded = self._load(read_session, missing, today) if self.persist else {}
+            computed = compute_profiles(read_session, [user_id for user_id in missing if user_id not in loaded], today)
+        if computed and self.persist:
+            self._store(computed, generations)
+
+        with self._lock:
+            self.stats.loaded += len(loaded)
+            self.stats.computed += len(computed)
+            for user_id, profile in (loaded | computed).items():
+                found[user_id] = profile
+                if self._generations.get(user_id, 0) == generations[user_id]:
+                    self._profiles[user_id] = profile
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+            self.stats.entries = len(self._profiles)
+        return found
+
+    def _load(self, session: Session, user_ids: list[int], today: date) -> dict[int, MacroProfile]:
+        """Persisted profiles still matching the user's latest measurement, active plan and age."""
+        rows = session.scalars(select(UserMacroProfile).where(UserMacroProfile.user_id.in_(user_ids))).all()
+        rows = [row for row in rows if today < row.valid_until]
+        if not rows:
+            return {}
+        # A profile stored after the hook deleted its predecessor may come from older inputs
+        physical = latest_physical_data(session, [row.user_id for row in rows])
+        plans = active_plan_goals(session, [row.user_id for row in rows])
+        return {
+            row.user_id: MacroProfile.from_row(row) for row in rows
+            if row.user_id in physical
+            and physical[row.user_id].id == row.physical_data_id
+            and plans.get(row.user_id, DEFAULT_GOAL) == (row.goal, row.meals_per_day)
+        }
+
+    def _store(self, profiles: dict[int, MacroProfile], generations: dict[int, int]) -> None:
+        with self._lock:
+            # Invalidated while computing - the inputs may already be stale
+            rows = [
+                profile.to_row() for user_id, profile in profiles.items()
+                if self._generations.get(user_id, 0) == generations[user_id]
+            ]
+        if not rows:
+            return
+        try:
+            with self.session_factory() as session:
+                session.execute(delete(UserMacroProfile).where(UserMacroProfile.user_id.in_([r["user_id"] for r in rows])))
+                session.execute(UserMacroProfile.__table__.insert(), rows)
+                session.commit()
+        except IntegrityError:
+            # Another worker stored the same users first
+            pass
+        except Exception as e:
+            # The table is only a cache - serving the computed profile is enough
+            log_error(f"Storing macro profiles failed: {e}")
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        """Drop memory entries (the persisted rows are deleted by the session hooks)."""
+        with self._lock:
+            for user_id in user_ids:
+                self._profiles.pop(user_id, None)
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+                self.stats.invalidations += 1
+            self.stats.entries = len(self._profiles)
+
+    def clear(self) -> None:
+        with self._lock:
+            for user_id in self._profiles:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._profiles.clear()
+            self.stats.entries = 0
+
+
+macro_profile_cache = MacroProfileCache(settings.macro_profile_cache_size, settings.macro_profile_persist)
+
+
+# ---------------- Session hooks ----------------
+
+def _changed(obj, keys) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[key].history.has_changes() for key in keys)
+
+
+def mark_profiles_changed(session: Session, user_ids: Iterable[int]) -> None:
+    """
+    Invalidate the users' profiles with `session`'s transaction.
+
+    Deletes the persisted rows now and drops the memory entries on commit.
+    The ORM hooks call it; Core inserts / updates of the watched tables
+    must call it themselves.
+    """
+    user_ids = set(user_ids)
+    user_ids.discard(None)
+    if not user_ids:
+        return
+    # Persisted rows go in the same transaction as the change
+    session.connection().execute(delete(UserMacroProfile).where(UserMacroProfile.user_id.in_(user_ids)))
+    session.info.setdefault("macro_profile_users", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_profile_changes(session, flush_context) -> None:
+    user_ids = set()
+    for obj in session.new | session.deleted:
+        if isinstance(obj, (PhysicalData, DietPlan)):
+            user_ids.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, User) and _changed(obj, PROFILE_USER_COLUMNS):
+            user_ids.add(obj.id)
+        elif isinstance(obj, DietPlan) and _changed(obj, PROFILE_PLAN_COLUMNS):
+            user_ids.add(obj.user_id)
+    mark_profiles_changed(session, user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_profiles(session) -> None:
+    user_ids = session.info.pop("macro_profile_users", None)
+    if user_ids:
+        macro_profile_cache.invalidate(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_profile_changes(session) -> None:
+    session.info.pop("macro_profile_users", None)
@@ -0,0 +1,210 @@
+"""
+Per-meal macro distribution strategies.
+
+A strategy compiles `meals_per_day` into a (meals x macros) ratio matrix:
+row m, column j is the share of the day's macro j that meal m gets, in
+the planner's (protein, carbs, fats, calories) order, and every column
+sums to 1. Matrices are compiled once per (strategy, meals_per_day,
+params) and cached, so per-meal targets of one user or a whole cohort
+are a single broadcast multiplication:
+
+    ratio_matrix("protein_priority", 4)              -> (4, 4)
+    distribute(daily_targets, "protein_priority", 4)  -> (users, 4, 4)
+
+Meal calories follow the meal's macros: `distribute` (and the solver's
+slot shares) replace the calories column by each meal's share of the
+day's macro energy (4 / 4 / 9 kcal per gram), so a meal's calories are
+4p + 4c + 9f whenever the daily targets are, whatever the strategy does
+with protein, carbs and fats. The compiled calories column is only used
+for days without any macro target.
+
+`rebalance` is the remaining-budget step of the README: after a meal's
+dish is picked, the difference to that meal's target is spread over the
+later meals in proportion to their ratios, in place. The solver's greedy
+pass and branch-and-bound use it slot by slot.
+
+Built-in strategies (more via `register_strategy`):
+
+    equal             the same share of everything per meal
+    protein_priority  protein evenly across meals, the rest by meal size
+    training_day      more carbs / less fat in the meals around training
+    custom            per-meal weights passed as params
+"""
+from functools import lru_cache
+from typing import Callable
+
+import numpy as np
+
+
+# Column order - same as services.dish_index.FEATURES
+MACROS = ("protein", "carbs", "fats", "calories")
+PROTEIN, CARBS, FATS, CALORIES = range(len(MACROS))
+# kcal per gram of protein, carbs, fats
+ATWATER = np.array([4.0, 4.0, 9.0])
+
+# Default slot layout per DietPlan.meals_per_day
+DEFAULT_SLOTS = {
+    1: ("lunch",),
+    2: ("breakfast", "dinner"),
+    3: ("breakfast", "lunch", "dinner"),
+    4: ("breakfast", "lunch", "snack", "dinner"),
+    5: ("breakfast", "snack", "lunch", "snack", "dinner"),
+    6: ("breakfast", "snack", "lunch", "snack", "dinner", "snack"),
+}
+
+# Relative size of a snack next to a main meal
+SNACK_WEIGHT = 0.5
+# training_day multipliers for the meals around training
+TRAINING_CARBS = 2.0
+TRAINING_FATS = 0.5
+
+# meals_per_day, *params -> (meals,) weights for all macros or (meals, 4) ratios
+Strategy = Callable[..., np.ndarray]
+
+_strategies: dict[str, Strategy] = {}
+
+
+def register_strategy(name: str) -> Callable[[Strategy], Strategy]:
+    """Decorator registering a strategy under `name` (replacing one drops the compiled matrices)."""
+    def register(strategy: Strategy) -> Strategy:
+        _strategies[name] = strategy
+        ratio_matrix.cache_clear()
+        return strategy
+    return register
+
+
+def strategies() -> tuple[str, ...]:
+    return tuple(_strategies)
+
+
+@lru_cache(maxsize=256)
+def ratio_matrix(strategy: str, meals_per_day: int, params: tuple = ()) -> np.ndarray:
+    """
+    Compiled (meals_per_day, 4) ratios of `strategy`, columns summing to 1.
+
+    The array is shared between callers and read-only. `params` must be
+    hashable (tuples) - they are part of the cache key.
+    """
+    if meals_per_day <= 0:
+        raise ValueError("Meals per day must be a positive integer.")
+    compile_ = _strategies.get(strategy)
+    if compile_ is None:
+        raise ValueError(f"Unknown distribution strategy '{strategy}'. Choose from: {', '.join(_strategies)}.")
+
+    ratios = np.asarray(compile_(meals_per_day, *params), dtype=np.float64)
+    if ratios.ndim == 1:
+        ratios = np.repeat(ratios[:, None], len(MACROS), axis=1)
+    if ratios.shape != (meals_per_day, len(MACROS)):
+        raise ValueError(f"Strategy '{strategy}' must give one weight or one ratio row per meal.")
+    totals = ratios.sum(axis=0)
+    if np.any(ratios < 0) or np.any(totals <= 0):
+        raise ValueError(f"Strategy '{strategy}' needs non-negative ratios with a positive total per macro.")
+
+    matrix = ratios / totals
+    matrix.setflags(write=False)
+    return matrix
+
+
+def default_slots(meals_per_day: int) -> tuple[str, ...]:
+    """Slot categories of a day with `meals_per_day` meals (ValueError outside DEFAULT_SLOTS)."""
+    slots = DEFAULT_SLOTS.get(meals_per_day)
+    if slots is None:
+        raise ValueError(
+            f"No default meal slots for {meals_per_day} meals per day - "
+            f"choose {min(DEFAULT_SLOTS)}-{max(DEFAULT_SLOTS)} or pass the categories."
+        )
+    return slots
+
+
+def calorie_ratios(ratios: np.ndarray, daily) -> np.ndarray:
+    """
+    `ratios` (meals, 4) with the calories column set to each meal's share of
+    the macro energy of `daily` (..., 4); result (..., meals, 4).
+
+    Days whose macros are all 0 keep the compiled calories column.
+    """
+    daily = np.asarray(daily, dtype=np.float64)
+    energy = daily[..., None, :CALORIES] * ATWATER
+    meal_energy = (ratios[:, :CALORIES] * energy).sum(axis=-1)
+    total = energy.sum(axis=-1)
+    out = np.array(np.broadcast_to(ratios, meal_energy.shape + (len(MACROS),)))
+    np.divide(meal_energy, total, out=out[..., CALORIES], where=total > 0)
+    return out
+
+
+def distribute(daily, strategy: str = "equal", meals_per_day: int = 3, params: tuple = ()) -> np.ndarray:
+    """Per-meal targets: daily (..., 4) -> (..., meals_per_day, 4), calories following the macros."""
+    daily = np.asarray(daily, dtype=np.float64)
+    return daily[..., None, :] * calorie_ratios(ratio_matrix(strategy, meals_per_day, params), daily)
+
+
+def rebalance(targets: np.ndarray, ratios: np.ndarray, meal: int, actual) -> None:
+    """
+    In place: meal `meal` came out as `actual` instead of its target.
+
+    The difference is spread over the later meals by their ratios (per
+    macro), later targets are clipped at 0 and the meal's target becomes
+    `actual`. targets (..., meals, 4), actual (..., 4).
+    """
+    actual = np.asarray(actual, dtype=np.float64)
+    later = ratios[meal + 1:]
+    if len(later):
+        total = later.sum(axis=0)
+        weights = np.divide(later, total, out=np.zeros_like(later), where=total > 0)
+        rest = targets[..., meal + 1:, :]
+        rest += (targets[..., meal, :] - actual)[..., None, :] * weights
+        np.maximum(rest, 0.0, out=rest)
+    targets[..., meal, :] = actual
+
+
+def meal_weights(meals_per_day: int) -> np.ndarray:
+    """Relative meal sizes of the default slot layout (snacks smaller)."""
+    slots = DEFAULT_SLOTS.get(meals_per_day)
+    if slots is None:
+        return np.ones(meals_per_day)
+    return np.array([SNACK_WEIGHT if slot == "snack" else 1.0 for slot in slots])
+
+
+# ---------------- Strategies ----------------
+
+@register_strategy("equal")
+def equal(meals_per_day: int) -> np.ndarray:
+    return np.ones(meals_per_day)
+
+
+@register_strategy("protein_priority")
+def protein_priority(meals_per_day: int) -> np.ndarray:
+    """Protein evenly (a steady dose per meal), carbs / fats / calories by meal size."""
+    ratios = np.repeat(meal_weights(meals_per_day)[:, None], len(MACROS), axis=1)
+    ratios[:, PROTEIN] = 1.0
+    return ratios
+
+
+@register_strategy("training_day")
+def training_day(meals_per_day: int, training_meal: int | None = None) -> np.ndarray:
+    """
+    Carbs toward the meal before training (`training_meal`, default the
+    middle one) and the meal after it, fat away from them; protein evenly.
+    """
+    if training_meal is None:
+        training_meal = meals_per_day // 2
+    if not 0 <= training_meal < meals_per_day:
+        raise ValueError("Training meal must be one of the day's meals.")
+    around = np.zeros(meals_per_day, dtype=bool)
+    around[training_meal:training_meal + 2] = True
+
+    weights = meal_weights(meals_per_day)
+    ratios = np.repeat(weights[:, None], len(MACROS), axis=1)
+    ratios[:, PROTEIN] = 1.0
+    ratios[:, CARBS] *= np.where(around, TRAINING_CARBS, 1.0)
+    ratios[:, FATS] *= np.where(around, TRAINING_FATS, 1.0)
+    # Calories column (by meal size) is replaced by the macro energy when distributed
+    return ratios
+
+
+@register_strategy("custom")
+def custom(meals_per_day: int, *ratios) -> np.ndarray:
+    """`ratios`: one weight per meal, or one (protein, carbs, fats, calories) row per meal."""
+    if len(ratios) != meals_per_day:
+        raise ValueError("Custom ratios need one entry per meal.")
+    return np.asarray(ratios, dtype=np.float64)
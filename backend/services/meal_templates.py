@@ -0,0 +1,112 @@
+"""
+Set-based instantiation of MealTemplates into Meals.
+
+`instantiate_templates` turns any number of
+(template_id, daily_plan_id, meal_order, scale_factor) requests into rows
+of `meals` and `meal_ingredients` without building ORM objects:
+
+    1. one SELECT of the distinct templates (name + cached nutrition)
+    2. one multi-row INSERT ... RETURNING into `meals` with the template's
+       cached nutrition scaled by `scale_factor`
+    3. one INSERT ... SELECT copying `meal_template_ingredients` with
+       scaled quantities, joined on the new meals' `template_id`
+    4. the two aggregate UPDATEs of `recompute_daily_plans`
+
+so a 30-day plan costs the same handful of statements as a single day.
+Nothing is committed.
+"""
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from models.meal import Meal, MealIngredient, MealTemplate, MealTemplateIngredient
+from services.nutrition_recompute import CACHED_NUTRIENTS, recompute_daily_plans
+
+
+# Columns identifying a requested instance in the RETURNING rows
+INSTANCE_KEY = ("template_id", "daily_plan_id", "meal_order", "scale_factor")
+
+
+class TemplateInstance(NamedTuple):
+    template_id: int
+    daily_plan_id: int
+    meal_order: int
+    scale_factor: float = 1.0
+
+
+def instantiate_templates(
+    session: Session,
+    instances: Iterable[TemplateInstance | tuple],
+    rollup: bool = True,
+) -> list[int]:
+    """
+    Create one Meal (with its ingredients) per requested instance.
+
+    Returns:
+        list: new meal ids, in the order of `instances`
+    """
+    instances = [TemplateInstance(*instance) for instance in instances]
+    if not instances:
+        return []
+
+    template_ids = {instance.template_id for instance in instances}
+    templates = {
+        row.id: row
+        for row in session.execute(
+            select(MealTemplate.id, MealTemplate.name, *[getattr(MealTemplate, name) for name in CACHED_NUTRIENTS])
+            .where(MealTemplate.id.in_(template_ids))
+        )
+    }
+    missing = template_ids - templates.keys()
+    if missing:
+        raise ValueError(f"Meal templates not found: {sorted(missing)}")
+
+    meal_rows = []
+    for instance in instances:
+        template = templates[instance.template_id]
+        row = {
+            "daily_plan_id": instance.daily_plan_id,
+            "template_id": instance.template_id,
+            "name": template.name,
+            "meal_order": instance.meal_order,
+            "scale_factor": instance.scale_factor,
+            "is_eaten": False,
+        }
+        for name in CACHED_NUTRIENTS:
+            row[name] = (getattr(template, name) or 0.0) * instance.scale_factor
+        meal_rows.append(row)
+
+    # Unordered RETURNING keeps the multi-row batches on every backend; rows are
+    # matched back by their content (identical requests are interchangeable)
+    meals = Meal.__table__
+    returned: dict[tuple, list[int]] = {}
+    for row in session.execute(
+        insert(meals).returning(meals.c.id, *[meals.c[key] for key in INSTANCE_KEY]),
+        meal_rows,
+    ):
+        returned.setdefault(tuple(row[1:]), []).append(row.id)
+    meal_ids = [returned[tuple(meal_row[key] for key in INSTANCE_KEY)].pop(0) for meal_row in meal_rows]
+
+    # Ingredients of every new meal in one statement, scaled by the meal's own factor
+    items = MealTemplateIngredient.__table__
+    session.execute(
+        insert(MealIngredient.__table__).from_select(
+            ["meal_id", "ingredient_id", "quantity", "unit", "quantity_base", "base_multiplier"],
+            select(
+                meals.c.id,
+                items.c.ingredient_id,
+                items.c.quantity * meals.c.scale_factor,
+                items.c.unit,
+                items.c.quantity_base * meals.c.scale_factor,
+                items.c.base_multiplier * meals.c.scale_factor,
+            )
+            .join(items, items.c.template_id == meals.c.template_id)
+            .where(meals.c.id.in_(meal_ids))
+            .order_by(meals.c.id, items.c.id)
+        )
+    )
+
+    if rollup:
+        recompute_daily_plans(session, {instance.daily_plan_id for instance in instances})
+    return meal_ids
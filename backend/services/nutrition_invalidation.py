@@ -0,0 +1,247 @@
+"""
+Dependency-tracked invalidation of cached meal / template nutrition.
+
+When an ingredient's nutrients, base amount or unit conversions change,
+only the templates and meals that use it are stale. They are found
+through the reverse dependency `ingredient_id -> meal_template_ingredients /
+meal_ingredients` (both columns indexed) and recomputed with the
+set-based statements of `services.nutrition_recompute`, in batches.
+
+Changed ingredient ids are collected from ORM flushes (see the session
+hooks at the bottom) or pushed explicitly, e.g. from a catalog sync
+manifest, into a `DirtyQueue`. The queue is drained either synchronously
+inside the same transaction (`nutrition_invalidation_mode = "sync"`) or
+after commit by a background worker (`"background"`).
+"""
+import threading
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models.ingredient import Ingredient, IngredientUnit
+from models.meal import MealIngredient, MealTemplateIngredient, recompute_base_quantities
+from services.nutrition_recompute import recompute_meals, recompute_templates
+from utils import log_error, log_info
+
+
+# Ingredient columns the cached totals depend on
+TRACKED_INGREDIENT_COLUMNS = (
+    "calories", "protein", "fat", "carbs", "fiber", "sodium", "cholesterol",
+    "base_amount", "base_unit",
+)
+TRACKED_UNIT_COLUMNS = ("gram_equivalent", "unit_name", "ingredient_id")
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def find_dependents(session: Session, ingredient_ids: Iterable[int]) -> tuple[list[int], list[int]]:
+    """Ids of the templates and meals using any of the given ingredients."""
+    ingredient_ids = list(ingredient_ids)
+    if not ingredient_ids:
+        return [], []
+
+    template_ids = session.execute(
+        select(MealTemplateIngredient.template_id)
+        .where(MealTemplateIngredient.ingredient_id.in_(ingredient_ids))
+        .distinct()
+    ).scalars().all()
+    meal_ids = session.execute(
+        select(MealIngredient.meal_id)
+        .where(MealIngredient.ingredient_id.in_(ingredient_ids))
+        .distinct()
+    ).scalars().all()
+    return sorted(template_ids), sorted(meal_ids)
+
+
+@dataclass
+class InvalidationStats:
+    ingredients: int = 0
+    templates: int = 0
+    meals: int = 0
+
+    def __iadd__(self, other: "InvalidationStats") -> "InvalidationStats":
+        self.ingredients += other.ingredients
+        self.templates += other.templates
+        self.meals += other.meals
+        return self
+
+
+def _batches(ids: list[int], size: int):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def invalidate_ingredients(
+    session: Session,
+    ingredient_ids: Iterable[int],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    refresh_base_quantities: bool = True,
+) -> InvalidationStats:
+    """
+    Recompute everything depending on the given ingredients. Does not commit.
+
+    Base quantities are refreshed first, since a changed base amount or
+    unit conversion changes the multipliers the totals are built from
+    (flushes already do that themselves, bulk SQL edits do not).
+    """
+    ingredient_ids = sorted(set(ingredient_ids))
+    if not ingredient_ids:
+        return InvalidationStats()
+
+    if refresh_base_quantities:
+        recompute_base_quantities(session, ingredient_ids)
+    template_ids, meal_ids = find_dependents(session, ingredient_ids)
+
+    for batch in _batches(template_ids, batch_size):
+        recompute_templates(session, batch)
+    for batch in _batches(meal_ids, batch_size):
+        recompute_meals(session, batch)
+
+    return InvalidationStats(len(ingredient_ids), len(template_ids), len(meal_ids))
+
+
+class DirtyQueue:
+    """Thread-safe set of ingredient ids whose dependents still need a recompute."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: set[int] = set()
+        self._wakeup = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def mark(self, ingredient_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._pending.update(ingredient_ids)
+            if self._pending:
+                self._wakeup.set()
+
+    def pop_batch(self, size: int) -> list[int]:
+        with self._lock:
+            batch = sorted(self._pending)[:size]
+            self._pending.difference_update(batch)
+            if not self._pending:
+                self._wakeup.clear()
+            return batch
+
+    def drain(self, session: Session, batch_size: int = DEFAULT_BATCH_SIZE) -> InvalidationStats:
+        """Recompute everything pending within the caller's transaction."""
+        stats = InvalidationStats()
+        while batch := self.pop_batch(batch_size):
+            try:
+                stats += invalidate_ingredients(session, batch, batch_size)
+            except Exception:
+                self.mark(batch)
+                raise
+        return stats
+
+    def run_worker(self, stop: threading.Event, batch_size: int = DEFAULT_BATCH_SIZE, interval: float = 1.0) -> None:
+        """Drain with one transaction per batch until `stop` is set."""
+        while not stop.is_set():
+            if not self._wakeup.wait(interval):
+                continue
+            batch = self.pop_batch(batch_size)
+            if not batch:
+                continue
+            try:
+                with SessionLocal() as session:
+                    stats = invalidate_ingredients(session, batch, batch_size)
+                    session.commit()
+                log_info(
+                    f"Recomputed nutrition for {stats.ingredients} ingredients: "
+                    f"{stats.templates} templates, {stats.meals} meals"
+                )
+            except Exception as e:
+                self.mark(batch)
+                log_error(f"Nutrition invalidation failed: {e}")
+                stop.wait(interval)
+
+    def start_worker(self, batch_size: int = DEFAULT_BATCH_SIZE, interval: float = 1.0) -> threading.Event:
+        """Start a daemon worker thread; set the returned event to stop it."""
+        stop = threading.Event()
+        threading.Thread(
+            target=self.run_worker,
+            args=(stop, batch_size, interval),
+            name="nutrition-invalidation",
+            daemon=True,
+        ).start()
+        return stop
+
+
+dirty_queue = DirtyQueue()
+
+
+# ---------------- Session hooks ----------------
+
+def _changed(obj, keys) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[key].history.has_changes() for key in keys)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_nutrition_changes(session, flush_context, instances) -> None:
+    """Remember ingredients whose change makes dependent caches stale."""
+    changed: set = session.info.setdefault("nutrition_changes", set())
+
+    for obj in session.new | session.deleted:
+        if isinstance(obj, IngredientUnit):
+            changed.add(obj)
+
+    for obj in session.dirty:
+        if isinstance(obj, IngredientUnit) and _changed(obj, TRACKED_UNIT_COLUMNS):
+            changed.add(obj)
+            # Moving a unit to another ingredient affects the previous one too
+            changed.update(inspect(obj).attrs.ingredient_id.history.deleted)
+        elif isinstance(obj, Ingredient) and _changed(obj, TRACKED_INGREDIENT_COLUMNS):
+            changed.add(obj)
+
+
+def _ingredient_ids(changed) -> set[int]:
+    ids = set()
+    for obj in changed:
+        if isinstance(obj, IngredientUnit):
+            ids.add(obj.ingredient_id)
+        elif isinstance(obj, Ingredient):
+            ids.add(obj.id)
+        else:
+            ids.add(obj)
+    ids.discard(None)
+    return ids
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _invalidate_after_flush(session, flush_context) -> None:
+    changed = session.info.pop("nutrition_changes", None)
+    if not changed:
+        return
+
+    ingredient_ids = _ingredient_ids(changed)
+    if settings.nutrition_invalidation_mode == "sync":
+        # models.meal._recompute_unit_changes (registered first) has refreshed base quantities
+        invalidate_ingredients(
+            session,
+            ingredient_ids,
+            settings.nutrition_invalidation_batch_size,
+            refresh_base_quantities=False,
+        )
+    else:
+        # Queued only once the transaction commits
+        session.info.setdefault("nutrition_pending", set()).update(ingredient_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_after_commit(session) -> None:
+    pending = session.info.pop("nutrition_pending", None)
+    if pending:
+        dirty_queue.mark(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session) -> None:
+    session.info.pop("nutrition_changes", None)
+    session.info.pop("nutrition_pending", None)
@@ -0,0 +1,376 @@
+"""
+Set-based recomputation of cached nutrition totals.
+
+Instead of walking `meal_ingredients -> ingredient -> units` in Python,
+every function here issues a constant number of aggregate
+`UPDATE ... FROM (SELECT ... GROUP BY)` statements, whatever the number of
+meals, templates or days involved. Nothing is committed - callers decide
+the transaction boundary, so meals and their daily plans are updated
+atomically.
+
+Edits normally update the cached totals incrementally (see
+`Meal.apply_nutrition_delta`); `verify_nutrition` is the periodic full
+recompute that catches any drift:
+
+    python -m services.nutrition_recompute --verify [--interval 3600]
+"""
+import argparse
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from sqlalchemy import Integer, cast, exists, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.diet import DailyPlan
+from models.ingredient import Ingredient
+from models.meal import Meal, MealIngredient, MealTemplate, MealTemplateIngredient
+from services.dish_index import mark_templates_changed
+
+
+# Cached column -> Ingredient nutrient column
+CACHED_NUTRIENTS = {
+    "calories": Ingredient.calories,
+    "protein": Ingredient.protein,
+    "carbs": Ingredient.carbs,
+    "fats": Ingredient.fat,
+    "fiber": Ingredient.fiber,
+}
+
+
+def _multiplier(item_cls):
+    # Rows written before base quantities were stored fall back to the plain ratio
+    return func.coalesce(item_cls.base_multiplier, item_cls.quantity / Ingredient.base_amount)
+
+
+def _expire(session: Session, cls, ids: set[int], attrs: list[str]) -> None:
+    """Loaded objects were bypassed by the bulk UPDATE - reload them on next access."""
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, cls) and obj.id in ids:
+            session.expire(obj, attrs)
+
+
+def _recompute_items(session: Session, owner_cls, item_cls, owner_fk, ids: list[int], fixed=None) -> None:
+    """
+    Aggregate UPDATE of the cached columns of meals or templates.
+
+    Owners without any ingredient are reset to 0. `fixed` is an optional
+    condition selecting owners whose cached columns are entered directly -
+    those are left as they are.
+    """
+    kept = [~fixed] if fixed is not None else []
+    multiplier = _multiplier(item_cls)
+    totals = (
+        select(
+            owner_fk.label("owner_id"),
+            *[func.sum(column * multiplier).label(name) for name, column in CACHED_NUTRIENTS.items()],
+        )
+        .join(Ingredient, Ingredient.id == item_cls.ingredient_id)
+        .where(owner_fk.in_(ids))
+        .group_by(owner_fk)
+        .subquery()
+    )
+
+    session.execute(
+        update(owner_cls)
+        .where(owner_cls.id == totals.c.owner_id, *kept)
+        .values({name: totals.c[name] for name in CACHED_NUTRIENTS})
+        .execution_options(synchronize_session=False)
+    )
+    # Owners without any ingredient are not in the aggregate
+    session.execute(
+        update(owner_cls)
+        .where(owner_cls.id.in_(ids), ~exists().where(owner_fk == owner_cls.id), *kept)
+        .values({name: 0.0 for name in CACHED_NUTRIENTS})
+        .execution_options(synchronize_session=False)
+    )
+
+    _expire(session, owner_cls, set(ids), list(CACHED_NUTRIENTS))
+
+
+def recompute_templates(session: Session, template_ids: Iterable[int]) -> None:
+    """Refresh cached calories/protein/carbs/fats/fiber of the given templates."""
+    template_ids = sorted(set(template_ids))
+    if template_ids:
+        _recompute_items(
+            session, MealTemplate, MealTemplateIngredient, MealTemplateIngredient.template_id, template_ids
+        )
+        mark_templates_changed(session, template_ids)
+
+
+def recompute_meals(session: Session, meal_ids: Iterable[int], rollup: bool = True) -> set[int]:
+    """
+    Refresh cached nutrition of the given meals and (with `rollup`) the
+    `actual_*` totals of their daily plans.
+
+    Meals flagged `macros_only` (DietManager plans written by
+    services.plan_unit_of_work) have no ingredients - their cached columns
+    are the source of truth and are left unchanged. Any other meal without
+    ingredients is reset to 0.
+
+    Returns:
+        set: ids of the affected daily plans
+    """
+    meal_ids = sorted(set(meal_ids))
+    if not meal_ids:
+        return set()
+
+    _recompute_items(session, Meal, MealIngredient, MealIngredient.meal_id, meal_ids, fixed=Meal.macros_only)
+
+    daily_plan_ids = set(session.execute(
+        select(Meal.daily_plan_id).where(Meal.id.in_(meal_ids)).distinct()
+    ).scalars())
+    if rollup:
+        recompute_daily_plans(session, daily_plan_ids)
+    return daily_plan_ids
+
+
+def recompute_daily_plans(session: Session, daily_plan_ids: Iterable[int]) -> None:
+    """
+    Roll cached meal nutrition up into `DailyPlan.actual_*`.
+
+    Macros come from the meals' cached columns, sodium and cholesterol
+    (not cached on meals) straight from their ingredients. Days whose
+    meals have no ingredients at all keep their stored sodium and
+    cholesterol - nothing to recompute them from.
+    """
+    daily_plan_ids = sorted(set(daily_plan_ids))
+    if not daily_plan_ids:
+        return
+
+    macros = (
+        select(
+            Meal.daily_plan_id.label("daily_plan_id"),
+            func.sum(Meal.calories).label("calories"),
+            func.sum(Meal.protein).label("protein"),
+            func.sum(Meal.carbs).label("carbs"),
+            func.sum(Meal.fats).label("fats"),
+            func.sum(Meal.fiber).label("fiber"),
+        )
+        .where(Meal.daily_plan_id.in_(daily_plan_ids))
+        .group_by(Meal.daily_plan_id)
+        .subquery()
+    )
+    multiplier = _multiplier(MealIngredient)
+    micros = (
+        select(
+            Meal.daily_plan_id.label("daily_plan_id"),
+            func.sum(Ingredient.sodium * multiplier).label("sodium"),
+            func.sum(Ingredient.cholesterol * multiplier).label("cholesterol"),
+        )
+        .join(MealIngredient, MealIngredient.meal_id == Meal.id)
+        .join(Ingredient, Ingredient.id == MealIngredient.ingredient_id)
+        .where(Meal.daily_plan_id.in_(daily_plan_ids))
+        .group_by(Meal.daily_plan_id)
+        .subquery()
+    )
+    totals = (
+        select(macros, micros.c.sodium, micros.c.cholesterol)
+        .outerjoin(micros, micros.c.daily_plan_id == macros.c.daily_plan_id)
+        .subquery()
+    )
+
+    values = {
+        # Same rounding as DailyPlan.set_calories (models.diet.round_calories)
+        "actual_calories": cast(func.floor(totals.c.calories + 0.5), Integer),
+        "actual_calories_exact": totals.c.calories,
+        "actual_protein": totals.c.protein,
+        "actual_carbs": totals.c.carbs,
+        "actual_fats": totals.c.fats,
+        "actual_fiber": totals.c.fiber,
+        "actual_sodium": func.coalesce(totals.c.sodium, DailyPlan.actual_sodium, 0.0),
+        "actual_cholesterol": func.coalesce(totals.c.cholesterol, DailyPlan.actual_cholesterol, 0.0),
+    }
+    session.execute(
+        update(DailyPlan)
+        .where(DailyPlan.id == totals.c.daily_plan_id)
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
+    session.execute(
+        update(DailyPlan)
+        .where(DailyPlan.id.in_(daily_plan_ids), ~exists().where(Meal.daily_plan_id == DailyPlan.id))
+        .values({name: 0 for name in values})
+        .execution_options(synchronize_session=False)
+    )
+
+    _expire(session, DailyPlan, set(daily_plan_ids), list(values))
+
+
+def recompute_diet_plan(session: Session, diet_plan_id: int) -> None:
+    """Recompute every meal and day of one DietPlan - a fixed handful of statements."""
+    meal_ids = session.execute(
+        select(Meal.id)
+        .join(DailyPlan, DailyPlan.id == Meal.daily_plan_id)
+        .where(DailyPlan.diet_plan_id == diet_plan_id)
+    ).scalars().all()
+    daily_plan_ids = set(session.execute(
+        select(DailyPlan.id).where(DailyPlan.diet_plan_id == diet_plan_id)
+    ).scalars())
+
+    recompute_meals(session, meal_ids, rollup=False)
+    recompute_daily_plans(session, daily_plan_ids)
+
+
+# ---------------- Drift verification ----------------
+
+# Absolute difference (kcal / g) treated as drift; actual_calories is an int column
+# (rounded from actual_calories_exact, so at most 0.5 off the sum)
+DRIFT_TOLERANCE = 0.01
+CALORIES_DRIFT_TOLERANCE = 0.5 + DRIFT_TOLERANCE
+
+
+def _drifted(pairs, tolerance: float = DRIFT_TOLERANCE):
+    return or_(*[func.abs(func.coalesce(cached, 0.0) - fresh) > tolerance for cached, fresh in pairs])
+
+
+def find_drifted_meals(session: Session, meal_ids: Iterable[int] | None = None) -> list[int]:
+    """
+    Meals whose cached columns differ from the sum of their ingredients.
+
+    Meals without ingredients should be at 0; `macros_only` meals are
+    not checked (see `recompute_meals`).
+    """
+    multiplier = _multiplier(MealIngredient)
+    totals = (
+        select(
+            MealIngredient.meal_id.label("meal_id"),
+            *[func.sum(column * multiplier).label(name) for name, column in CACHED_NUTRIENTS.items()],
+        )
+        .join(Ingredient, Ingredient.id == MealIngredient.ingredient_id)
+        .group_by(MealIngredient.meal_id)
+        .subquery()
+    )
+    stmt = (
+        select(Meal.id)
+        .outerjoin(totals, totals.c.meal_id == Meal.id)
+        .where(~Meal.macros_only, _drifted([
+            (getattr(Meal, name), func.coalesce(totals.c[name], 0.0)) for name in CACHED_NUTRIENTS
+        ]))
+    )
+    if meal_ids is not None:
+        stmt = stmt.where(Meal.id.in_(list(meal_ids)))
+    return list(session.execute(stmt).scalars())
+
+
+def find_drifted_daily_plans(session: Session, daily_plan_ids: Iterable[int] | None = None) -> list[int]:
+    """Daily plans whose actual_* differ from the sum of their meals' cached columns."""
+    totals = (
+        select(
+            Meal.daily_plan_id.label("daily_plan_id"),
+            func.sum(Meal.calories).label("calories"),
+            func.sum(Meal.protein).label("protein"),
+            func.sum(Meal.carbs).label("carbs"),
+            func.sum(Meal.fats).label("fats"),
+            func.sum(Meal.fiber).label("fiber"),
+        )
+        .group_by(Meal.daily_plan_id)
+        .subquery()
+    )
+    stmt = (
+        select(DailyPlan.id)
+        .outerjoin(totals, totals.c.daily_plan_id == DailyPlan.id)
+        .where(or_(
+            _drifted(
+                [(DailyPlan.actual_calories, func.coalesce(totals.c.calories, 0.0))],
+                CALORIES_DRIFT_TOLERANCE,
+            ),
+            _drifted([
+                (DailyPlan.actual_calories_exact, func.coalesce(totals.c.calories, 0.0)),
+                (DailyPlan.actual_protein, func.coalesce(totals.c.protein, 0.0)),
+                (DailyPlan.actual_carbs, func.coalesce(totals.c.carbs, 0.0)),
+                (DailyPlan.actual_fats, func.coalesce(totals.c.fats, 0.0)),
+                (DailyPlan.actual_fiber, func.coalesce(totals.c.fiber, 0.0)),
+            ]),
+        ))
+    )
+    if daily_plan_ids is not None:
+        stmt = stmt.where(DailyPlan.id.in_(list(daily_plan_ids)))
+    return list(session.execute(stmt).scalars())
+
+
+@dataclass
+class DriftReport:
+    meal_ids: list[int] = field(default_factory=list)
+    daily_plan_ids: list[int] = field(default_factory=list)
+
+    @property
+    def has_drift(self) -> bool:
+        return bool(self.meal_ids or self.daily_plan_ids)
+
+
+def verify_nutrition(
+    session: Session,
+    daily_plan_ids: Iterable[int] | None = None,
+    fix: bool = True,
+) -> DriftReport:
+    """
+    Full-recompute check of the incrementally maintained totals.
+
+    Finds drifted meals and days (all of them, or within `daily_plan_ids`)
+    and, with `fix`, recomputes exactly those. Does not commit.
+    """
+    meal_scope = None
+    if daily_plan_ids is not None:
+        daily_plan_ids = list(daily_plan_ids)
+        meal_scope = session.execute(
+            select(Meal.id).where(Meal.daily_plan_id.in_(daily_plan_ids))
+        ).scalars().all()
+
+    report = DriftReport(meal_ids=find_drifted_meals(session, meal_scope))
+    if fix and report.meal_ids:
+        recompute_meals(session, report.meal_ids, rollup=False)
+
+    # After fixing meals their days may drift as well
+    report.daily_plan_ids = find_drifted_daily_plans(session, daily_plan_ids)
+    if fix and report.daily_plan_ids:
+        recompute_daily_plans(session, report.daily_plan_ids)
+
+    return report
+
+
+def run_verifier(interval: float, stop: threading.Event | None = None) -> None:
+    """Run `verify_nutrition` every `interval` seconds until `stop` is set."""
+    from utils import log_info
+
+    stop = stop or threading.Event()
+    while True:
+        with SessionLocal() as session:
+            report = verify_nutrition(session)
+            session.commit()
+        if report.has_drift:
+            log_info(
+                f"Fixed nutrition drift: {len(report.meal_ids)} meals, "
+                f"{len(report.daily_plan_ids)} daily plans"
+            )
+        if stop.wait(interval):
+            return
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute cached nutrition totals")
+    parser.add_argument("--verify", action="store_true", help="find and fix drifted meals / days")
+    parser.add_argument("--interval", type=float, help="repeat every N seconds")
+    parser.add_argument("--diet-plan", type=int, help="recompute a whole diet plan")
+    args = parser.parse_args()
+
+    if args.diet_plan is not None:
+        with SessionLocal() as session:
+            recompute_diet_plan(session, args.diet_plan)
+            session.commit()
+
+    if args.verify:
+        if args.interval:
+            run_verifier(args.interval)
+        else:
+            from utils import log_info
+
+            with SessionLocal() as session:
+                report = verify_nutrition(session)
+                session.commit()
+            log_info(f"Drifted: {len(report.meal_ids)} meals, {len(report.daily_plan_ids)} daily plans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Memoized planner results for users with near-identical targets.
+
+Many users share practically the same daily targets and meal split, and
+the solver is deterministic for a given (target, slots, catalog, seed).
+`PlanCache` therefore keys whole `solve_plan_days` results on
+
+    (quantized target, categories, shares, visible private templates,
+     solver settings, catalog version, seed, days)
+
+Targets are rounded to `quantum` (grams / kcal) and the plan is solved
+for the rounded target, so every user mapped to a key gets exactly what
+a fresh solve would have returned. The catalog version is
+`DishIndex.version`, which changes with every template update (including
+cached nutrition recomputed by bulk SQL, see `dish_index.mark_templates_changed`);
+on a version change all entries are dropped.
+
+Solutions are copied on the way in and out, so callers never share the
+cached objects.
+
+Results cut short by the solver's `time_budget` (`DaySolution.truncated`)
+depend on machine speed and are never stored.
+
+Entries are evicted least-recently-used once their estimated size passes
+`max_bytes`.
+"""
+import copy
+import threading
+from collections import OrderedDict
+from dataclasses import astuple, dataclass
+from typing import Callable, Hashable, Sequence
+
+import numpy as np
+
+from config import settings
+from services.plan_solver import DaySolution, SolverConfig
+
+
+# Rounding step per (protein, carbs, fats, calories)
+DEFAULT_QUANTUM = (1.0, 1.0, 1.0, 10.0)
+
+# Rough per-object sizes of a cached result (CPython, dataclass instances with dicts)
+SOLUTION_BYTES = 600
+CHOICE_BYTES = 250
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def quantize(target: Sequence[float], quantum: Sequence[float] = DEFAULT_QUANTUM) -> tuple[float, ...]:
+    """Round each target component to its step."""
+    quantum = np.asarray(quantum, dtype=np.float64)
+    return tuple((np.round(np.asarray(target, dtype=np.float64) / quantum) * quantum).tolist())
+
+
+def config_key(config: SolverConfig) -> tuple:
+    return tuple(tuple(value.tolist()) if isinstance(value, np.ndarray) else value for value in astuple(config))
+
+
+def _size(solutions: list[DaySolution]) -> int:
+    return sum(SOLUTION_BYTES + CHOICE_BYTES * len(solution.choices) for solution in solutions)
+
+
+class PlanCache:
+    """Thread-safe LRU of planner results with a memory cap."""
+
+    def __init__(self, max_bytes: int, quantum: Sequence[float] = DEFAULT_QUANTUM) -> None:
+        self.max_bytes = max_bytes
+        self.quantum = tuple(quantum)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[list[DaySolution], int]] = OrderedDict()
+        self._bytes = 0
+        self._version: int | None = None
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def quantize(self, target: Sequence[float]) -> tuple[float, ...]:
+        return quantize(target, self.quantum)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        self.stats.invalidations += 1
+        self._sync_stats()
+
+    def _sync_stats(self) -> None:
+        self.stats.entries = len(self._entries)
+        self.stats.bytes = self._bytes
+
+    def _check_version(self, version: int) -> None:
+        if version != self._version:
+            if self._entries:
+                self._clear()
+            self._version = version
+
+    def get(self, key: Hashable, version: int) -> list[DaySolution] | None:
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            solutions = entry[0]
+        return copy.deepcopy(solutions)
+
+    def put(self, key: Hashable, version: int, solutions: list[DaySolution]) -> None:
+        size = _size(solutions)
+        if size > self.max_bytes or any(solution.truncated for solution in solutions):
+            return
+        solutions = copy.deepcopy(solutions)
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (solutions, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.stats.evictions += 1
+            self._sync_stats()
+
+    def get_or_solve(
+        self,
+        key: Hashable,
+        version: int,
+        solve: Callable[[], list[DaySolution]],
+    ) -> list[DaySolution]:
+        """
+        Cached result for `key`, or `solve()` stored under it.
+
+        Concurrent misses of the same key may both solve; untruncated
+        results are identical, so the second put is harmless.
+        """
+        solutions = self.get(key, version)
+        if solutions is None:
+            solutions = solve()
+            self.put(key, version, solutions)
+        return solutions
+
+
+plan_cache = PlanCache(settings.plan_cache_max_mb * 2**20)
@@ -0,0 +1,568 @@
+"""
+Multi-day DietPlan generation across a process pool.
+
+Days are solved independently by `services.plan_solver`, so a 28-90 day
+plan fans out as week-sized chunks to a `ProcessPoolExecutor`:
+
+    1. the parent extracts the templates visible to the user from the dish
+       index (ids, features per category) once
+    2. a pool of `workers` processes is started once per process and
+       kept - spawning workers costs more than solving a whole plan
+       serially. Each chunk carries the payload (templates and feature
+       weights); a worker rebuilds its index only when the payload key
+       (index version, user, weights) differs from the one it already holds
+    3. a chunk solves its days in order, excluding templates used in the
+       previous `variety_window` days of the same chunk
+    4. the parent merges the chunks in date order and re-solves the few
+       days whose templates clash with the end of the previous chunk
+    5. all DailyPlans, Meals and MealIngredients are written in one
+       transaction (`instantiate_templates`, a handful of statements)
+
+With a `PlanCache`, steps 1-4 are skipped for targets already solved
+(quantized) against the same catalog version.
+
+`stream_daily_plans` is the incremental variant for the streaming
+endpoint: days are solved in order in-process, reported as soon as each
+is solved and persisted every `batch_days` days, so a cancelled stream
+keeps what was saved and a new one resumes after it.
+
+Both write under a lock on the DietPlan row and check first that the days
+are not saved yet; the unique (diet_plan_id, date) constraint backs this
+up where the database has no row locks.
+
+Every day's seed is derived from the plan seed and the day offset, so the
+result does not depend on the number of workers (as long as no day is cut
+short by the solver's `time_budget`).
+"""
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from collections import deque
+from datetime import timedelta
+from typing import Any, Iterator, Sequence
+
+import numpy as np
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.diet import DailyPlan, DietPlan
+from models.meal import Meal, MealTemplate
+from services.dish_index import FEATURE_WEIGHTS, DishIndex, get_dish_index
+from services.dish_sampler import DishSampler
+from services.meal_distribution import default_slots
+from services.meal_templates import instantiate_templates
+from services.plan_cache import PlanCache, config_key, plan_cache
+from services.plan_solver import DaySolution, SolverConfig, sampled_slot_candidates, slot_candidates, solve_day
+
+
+DEFAULT_CHUNK_DAYS = 7
+DEFAULT_VARIETY_WINDOW = 2
+
+
+def _shares_key(shares) -> tuple | None:
+    """Hashable form of per-slot shares or of a ratio matrix."""
+    if shares is None:
+        return None
+    shares = np.asarray(shares, dtype=np.float64)
+    return tuple(map(tuple, shares.tolist())) if shares.ndim == 2 else tuple(shares.tolist())
+
+
+@dataclass
+class ChunkTask:
+    day_offsets: list[int]
+    target: np.ndarray  # (protein, carbs, fats, calories)
+    categories: tuple[str, ...]
+    shares: tuple | None  # per slot, or per slot and macro (ratio matrix rows)
+    config: SolverConfig
+    seed: int
+    variety_window: int
+    # "nearest" (k closest templates) or "sampled" (k drawn from the slot's calorie band)
+    candidate_source: str = "nearest"
+
+
+def _index_payload(index: DishIndex, user_id: int | None) -> dict[str, tuple]:
+    """(ids, features) of the templates visible to `user_id`, per category."""
+    return index.visible(user_id)[1]
+
+
+def _index_from_payload(payload: dict[str, tuple], weights: np.ndarray = FEATURE_WEIGHTS) -> DishIndex:
+    """Index of already filtered templates - all stored as global, no owner masking needed."""
+    index = DishIndex(weights)
+    for category, (ids, features) in payload.items():
+        index._category(category).extend(ids, [None] * len(ids), features)
+        index._category_of.update((int(i), category) for i in ids)
+    return index.freeze()
+
+
+# Copy of the global templates per shared index, rebuilt when its version moves on
+_global_snapshots: "weakref.WeakKeyDictionary[DishIndex, tuple[int, DishIndex]]" = weakref.WeakKeyDictionary()
+
+
+def _visible_index(index: DishIndex, user_id: int | None) -> DishIndex:
+    """
+    Private copy of the templates `user_id` can see.
+
+    The shared index is changed in place by template edits from other
+    requests; a copy never is. Users without own templates all get the
+    same copy of the global ones, built once per index version (and with
+    it, its sampler buckets).
+    """
+    if index.has_private(user_id):
+        return _index_from_payload(_index_payload(index, user_id), index.weights)
+    cached = _global_snapshots.get(index)
+    if cached is None or cached[0] != index.version:
+        version, payload = index.visible(None)
+        cached = _global_snapshots[index] = (version, _index_from_payload(payload, index.weights))
+    return cached[1]
+
+
+# Pool worker state: the index of the last payload key seen (never used in the parent)
+_worker_key: tuple | None = None
+_worker_index: DishIndex | None = None
+
+# Long-lived spawn pools shared by all plans of the process, one per worker count
+_pools: dict[int, ProcessPoolExecutor] = {}
+_pool_lock = threading.Lock()
+# (index version, sampler buckets) per index, built on first "sampled" use
+_samplers: "weakref.WeakKeyDictionary[DishIndex, tuple[int, DishSampler]]" = weakref.WeakKeyDictionary()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """The process pool with `workers` processes, started on first use."""
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return pool
+
+
+def shutdown_pool() -> None:
+    """Stop the worker processes (e.g. on application shutdown); the next parallel plan starts a new pool."""
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+def _sampler(index: DishIndex) -> DishSampler:
+    """Sampler of `index`, rebuilt whenever upsert / remove / refresh moved its version on."""
+    cached = _samplers.get(index)
+    version = index.version
+    if cached is None or cached[0] != version:
+        cached = _samplers[index] = (version, DishSampler.from_index(index))
+    return cached[1]
+
+
+def _day_seed(seed: int, day_offset: int) -> int:
+    return (seed * 1_000_003 + day_offset) & 0xFFFFFFFF
+
+
+def _candidates(index: DishIndex, task: ChunkTask, day_offset: int, exclude: set[int]):
+    k = task.config.candidates_per_slot
+    if task.candidate_source == "sampled":
+        rng = np.random.default_rng(_day_seed(task.seed, day_offset))
+        return sampled_slot_candidates(_sampler(index), index, task.target, task.categories, task.shares, k, rng, exclude)
+    return slot_candidates(index, task.target, task.categories, task.shares, None, k, exclude)
+
+
+def _solve_one(
+    index: DishIndex,
+    task: ChunkTask,
+    day_offset: int,
+    exclude: set[int],
+) -> DaySolution:
+    slots = _candidates(index, task, day_offset, exclude)
+    if exclude and any(len(slot.template_ids) == 0 for slot in slots):
+        # Variety is a preference - never leave a slot without any dish
+        slots = _candidates(index, task, day_offset, set())
+    return solve_day(task.target, slots, task.config, _day_seed(task.seed, day_offset))
+
+
+def _recent_templates(solutions: Sequence[DaySolution], window: int) -> set[int]:
+    return {choice.template_id for solution in solutions[-window:] for choice in solution.choices} if window else set()
+
+
+def _solve_chunk(task: ChunkTask, index: DishIndex) -> list[DaySolution]:
+    """Solve consecutive days with in-chunk variety."""
+    solutions: list[DaySolution] = []
+    for day_offset in task.day_offsets:
+        exclude = _recent_templates(solutions, task.variety_window)
+        solutions.append(_solve_one(index, task, day_offset, exclude))
+    return solutions
+
+
+def _solve_chunk_in_worker(
+    key: tuple,
+    payload: dict[str, tuple],
+    weights: np.ndarray,
+    task: ChunkTask,
+) -> list[DaySolution]:
+    """Pool entry point: `_solve_chunk` on the index of `payload`, reused while `key` stays the same."""
+    global _worker_key, _worker_index
+    if key != _worker_key:
+        _worker_index = _index_from_payload(payload, weights)
+        _worker_key = key
+    return _solve_chunk(task, _worker_index)
+
+
+def _merge(index: DishIndex, tasks: list[ChunkTask], results: list[list[DaySolution]]) -> list[DaySolution]:
+    """Concatenate chunks in date order, re-solving days that break variety across a boundary."""
+    merged: list[DaySolution] = []
+    for task, solutions in zip(tasks, results):
+        for day_offset, solution in zip(task.day_offsets, solutions):
+            recent = _recent_templates(merged, task.variety_window)
+            if recent & {choice.template_id for choice in solution.choices}:
+                solution = _solve_one(index, task, day_offset, recent)
+            merged.append(solution)
+    return merged
+
+
+def solve_plan_days(
+    index: DishIndex,
+    target: Sequence[float],
+    n_days: int,
+    categories: Sequence[str],
+    user_id: int | None = None,
+    shares: Sequence | np.ndarray | None = None,
+    config: SolverConfig | None = None,
+    seed: int = 0,
+    workers: int | None = None,
+    chunk_days: int = DEFAULT_CHUNK_DAYS,
+    variety_window: int = DEFAULT_VARIETY_WINDOW,
+    candidate_source: str = "nearest",
+    cache: PlanCache | None = None,
+) -> list[DaySolution]:
+    """
+    Solve `n_days` days; `workers=1` runs in-process (same results).
+
+    `target` is (protein, carbs, fats, calories) for every day. With
+    `cache` it is quantized first and the result memoized.
+    """
+    config = config or SolverConfig()
+    if cache is not None:
+        target = cache.quantize(target)
+        key = (
+            target,
+            tuple(categories),
+            _shares_key(shares),
+            # Users without own templates share results
+            user_id if index.has_private(user_id) else None,
+            config_key(config),
+            seed,
+            n_days,
+            chunk_days,
+            variety_window,
+            candidate_source,
+        )
+        return cache.get_or_solve(key, index.version, lambda: solve_plan_days(
+            index, target, n_days, categories, user_id, shares, config, seed, workers, chunk_days, variety_window,
+            candidate_source,
+        ))
+
+    workers = workers or os.cpu_count() or 1
+    local_index = _visible_index(index, user_id)
+
+    tasks = [
+        ChunkTask(
+            day_offsets=list(range(start, min(start + chunk_days, n_days))),
+            target=np.asarray(target, dtype=np.float64),
+            categories=tuple(categories),
+            shares=_shares_key(shares),
+            config=config,
+            seed=seed,
+            variety_window=variety_window,
+            candidate_source=candidate_source,
+        )
+        for start in range(0, n_days, chunk_days)
+    ]
+
+    if workers == 1 or len(tasks) == 1:
+        results = [_solve_chunk(task, local_index) for task in tasks]
+    else:
+        # The copy never changes, so its version identifies the payload
+        key = (local_index.version, user_id, tuple(local_index.weights.tolist()))
+        payload = _index_payload(local_index, None)
+        pool = _get_pool(workers)
+        futures = [pool.submit(_solve_chunk_in_worker, key, payload, local_index.weights, task) for task in tasks]
+        results = [future.result() for future in futures]
+
+    return _merge(local_index, tasks, results)
+
+
+def _persist_days(
+    session: Session,
+    diet_plan: DietPlan,
+    target: Sequence[float],
+    day_offsets: Sequence[int],
+    solutions: Sequence[DaySolution],
+) -> list[int]:
+    """Insert the DailyPlans of the given days and their meals (a handful of statements). Does not commit."""
+    target_protein, target_carbs, target_fats = target[:3]
+    day_rows = [
+        {
+            "diet_plan_id": diet_plan.id,
+            "date": diet_plan.date_from + timedelta(days=offset),
+            "target_calories": diet_plan.target_calories,
+            "target_protein": target_protein,
+            "target_carbs": target_carbs,
+            "target_fats": target_fats,
+            "actual_calories": 0,
+            "actual_calories_exact": 0.0,
+            "actual_protein": 0.0,
+            "actual_carbs": 0.0,
+            "actual_fats": 0.0,
+            "is_completed": False,
+        }
+        for offset in day_offsets
+    ]
+    days = DailyPlan.__table__
+    returned = {
+        row.date: row.id
+        for row in session.execute(insert(days).returning(days.c.id, days.c.date), day_rows)
+    }
+    daily_plan_ids = [returned[row["date"]] for row in day_rows]
+
+    instantiate_templates(session, [
+        instance
+        for daily_plan_id, solution in zip(daily_plan_ids, solutions)
+        for instance in solution.instances(daily_plan_id)
+    ])
+    return daily_plan_ids
+
+
+def _lock_days(session: Session, diet_plan: DietPlan, from_offset: int) -> bool:
+    """Lock the DietPlan row (SELECT ... FOR UPDATE) and tell whether day `from_offset` or a later one is saved."""
+    session.execute(select(DietPlan.id).where(DietPlan.id == diet_plan.id).with_for_update())
+    return session.execute(
+        select(DailyPlan.id)
+        .where(
+            DailyPlan.diet_plan_id == diet_plan.id,
+            DailyPlan.date >= diet_plan.date_from + timedelta(days=from_offset),
+        )
+        .limit(1)
+    ).first() is not None
+
+
+def generate_daily_plans(
+    session: Session,
+    diet_plan: DietPlan,
+    target_protein: float,
+    target_carbs: float,
+    target_fats: float,
+    categories: Sequence[str] | None = None,
+    shares: Sequence | np.ndarray | None = None,
+    config: SolverConfig | None = None,
+    seed: int = 0,
+    workers: int | None = None,
+    chunk_days: int = DEFAULT_CHUNK_DAYS,
+    variety_window: int = DEFAULT_VARIETY_WINDOW,
+    candidate_source: str = "nearest",
+) -> list[int]:
+    """
+    Fill every day of `diet_plan` with solved meals in one transaction.
+
+    Returns the new DailyPlan ids. Commits. Raises ValueError if the plan
+    already has days.
+    """
+    categories = categories or default_slots(diet_plan.meals_per_day)
+    target = (target_protein, target_carbs, target_fats, diet_plan.target_calories)
+    n_days = diet_plan.duration_in_days
+    # Held until the commit - a concurrent call waits, then sees the days
+    if _lock_days(session, diet_plan, 0):
+        session.rollback()
+        raise ValueError("Diet plan already has days")
+
+    solutions = solve_plan_days(
+        get_dish_index(session),
+        target,
+        n_days,
+        categories,
+        user_id=diet_plan.user_id,
+        shares=shares,
+        config=config,
+        seed=seed,
+        workers=workers,
+        chunk_days=chunk_days,
+        variety_window=variety_window,
+        candidate_source=candidate_source,
+        cache=plan_cache if settings.plan_cache_enabled else None,
+    )
+
+    try:
+        daily_plan_ids = _persist_days(session, diet_plan, target, list(range(n_days)), solutions)
+    except IntegrityError:
+        session.rollback()
+        raise ValueError("Diet plan already has days")
+    session.commit()
+    return daily_plan_ids
+
+
+# ---------------- Streaming ----------------
+
+def iter_plan_days(
+    index: DishIndex,
+    target: Sequence[float],
+    n_days: int,
+    categories: Sequence[str],
+    user_id: int | None = None,
+    shares: Sequence | np.ndarray | None = None,
+    config: SolverConfig | None = None,
+    seed: int = 0,
+    variety_window: int = DEFAULT_VARIETY_WINDOW,
+    candidate_source: str = "nearest",
+    start: int = 0,
+    recent_days: Sequence[set[int]] = (),
+) -> Iterator[tuple[int, DaySolution]]:
+    """
+    Solve days `start`..`n_days - 1` one by one, in order, in-process.
+
+    `recent_days` are the template ids of the days before `start`
+    (oldest first), so a resumed plan keeps its variety window.
+    """
+    config = config or SolverConfig()
+    local_index = _visible_index(index, user_id)
+    task = ChunkTask(
+        day_offsets=[],
+        target=np.asarray(target, dtype=np.float64),
+        categories=tuple(categories),
+        shares=_shares_key(shares),
+        config=config,
+        seed=seed,
+        variety_window=variety_window,
+        candidate_source=candidate_source,
+    )
+    recent: deque[set[int]] = deque(recent_days, maxlen=variety_window or None)
+    for day_offset in range(start, n_days):
+        exclude = set().union(*recent) if variety_window else set()
+        solution = _solve_one(local_index, task, day_offset, exclude)
+        if variety_window:
+            recent.append({choice.template_id for choice in solution.choices})
+        yield day_offset, solution
+
+
+def _resume_point(session: Session, diet_plan: DietPlan, variety_window: int) -> tuple[int, list[set[int]]]:
+    """Offset of the first day not saved yet and the templates of the days before it."""
+    last = session.execute(
+        select(func.max(DailyPlan.date)).where(DailyPlan.diet_plan_id == diet_plan.id)
+    ).scalar()
+    if last is None:
+        return 0, []
+
+    start = (last - diet_plan.date_from).days + 1
+    rows = session.execute(
+        select(DailyPlan.date, Meal.template_id)
+        .join(Meal, Meal.daily_plan_id == DailyPlan.id)
+        .where(
+            DailyPlan.diet_plan_id == diet_plan.id,
+            DailyPlan.date > last - timedelta(days=variety_window),
+            Meal.template_id.is_not(None),
+        )
+    ).all()
+    by_date: dict = {}
+    for row in rows:
+        by_date.setdefault(row.date, set()).add(row.template_id)
+    return start, [by_date[day] for day in sorted(by_date)]
+
+
+def stream_daily_plans(
+    session: Session,
+    diet_plan: DietPlan,
+    target_protein: float,
+    target_carbs: float,
+    target_fats: float,
+    categories: Sequence[str] | None = None,
+    shares: Sequence | np.ndarray | None = None,
+    config: SolverConfig | None = None,
+    seed: int = 0,
+    variety_window: int = DEFAULT_VARIETY_WINDOW,
+    candidate_source: str = "nearest",
+    batch_days: int = DEFAULT_CHUNK_DAYS,
+) -> Iterator[dict[str, Any]]:
+    """
+    Generate the missing days of `diet_plan`, yielding JSON-ready events:
+
+        start  {diet_plan_id, days, resumed_from}  - before any solving
+        day    {day, date, meals, totals, deviation} - as soon as the day is solved
+        saved  {daily_plan_ids: {date: id}}          - after each committed batch
+        done   {days}
+        conflict {detail}                            - another generation saved
+                                                       these days first; ends the stream
+
+    Closing the generator (client disconnect) drops the unsaved batch;
+    committed days stay and the next stream resumes after them.
+    """
+    categories = categories or default_slots(diet_plan.meals_per_day)
+    target = (target_protein, target_carbs, target_fats, diet_plan.target_calories)
+    n_days = diet_plan.duration_in_days
+    _lock_days(session, diet_plan, 0)
+    start, recent_days = _resume_point(session, diet_plan, variety_window)
+    yield {"event": "start", "diet_plan_id": diet_plan.id, "days": n_days, "resumed_from": start}
+
+    names: dict[int, str] = {}
+    offsets: list[int] = []
+    solutions: list[DaySolution] = []
+
+    def flush() -> dict[str, Any]:
+        conflict = {"event": "conflict", "detail": "Days already generated by another request"}
+        if _lock_days(session, diet_plan, offsets[0]):
+            return conflict
+        try:
+            ids = _persist_days(session, diet_plan, target, offsets, solutions)
+        except IntegrityError:
+            return conflict
+        session.commit()
+        saved = {
+            (diet_plan.date_from + timedelta(days=offset)).isoformat(): daily_plan_id
+            for offset, daily_plan_id in zip(offsets, ids)
+        }
+        offsets.clear()
+        solutions.clear()
+        return {"event": "saved", "daily_plan_ids": saved}
+
+    try:
+        for day_offset, solution in iter_plan_days(
+            get_dish_index(session), target, n_days, categories, diet_plan.user_id, shares, config, seed,
+            variety_window, candidate_source, start, recent_days,
+        ):
+            missing = {choice.template_id for choice in solution.choices} - names.keys()
+            if missing:
+                names.update(session.execute(
+                    select(MealTemplate.id, MealTemplate.name).where(MealTemplate.id.in_(missing))
+                ).tuples().all())
+            yield {
+                "event": "day",
+                "day": day_offset,
+                "date": (diet_plan.date_from + timedelta(days=day_offset)).isoformat(),
+                "meals": [
+                    {
+                        "template_id": choice.template_id,
+                        "name": names.get(choice.template_id),
+                        "category": choice.category,
+                        "scale": round(choice.scale, 4),
+                    }
+                    for choice in solution.choices
+                ],
+                "totals": {key: round(value, 2) for key, value in solution.totals.items()},
+                "deviation": round(solution.deviation, 2),
+            }
+            offsets.append(day_offset)
+            solutions.append(solution)
+            if len(offsets) >= batch_days or day_offset == n_days - 1:
+                event = flush()
+                yield event
+                if event["event"] == "conflict":
+                    return
+    finally:
+        # Cancelled mid-batch - nothing of it was written
+        session.rollback()
+
+    yield {"event": "done", "days": n_days - start}
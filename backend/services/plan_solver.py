@@ -0,0 +1,454 @@
+"""
+Daily plan solver: one template and one portion scale per meal slot.
+
+Picks, for slots such as breakfast / lunch / dinner, template i with
+scale x_i in [min_scale, max_scale] so that
+
+    || W (sum_i x_i * macros_i - target) ||^2
+
+plus `portion_penalty * sum_i (x_i - 1)^2` is minimal, where macros are
+(protein, carbs, fats, calories) and W the dish index weights (everything
+in kcal). The penalty keeps portions near the recipe when several scale
+combinations hit the target equally well. The search is:
+
+    1. candidates    k nearest templates per slot from the dish index
+    2. greedy        slot by slot, best single-scale fit to the slot's
+                     target; the miss is spread over the later slots
+                     (`meal_distribution.rebalance`) - the incumbent
+    3. branch&bound  depth-first over slots, `branch_width` best
+                     candidates per level, pruned by a lower bound (the
+                     overshoot the minimal portions already cause), joint
+                     scales at the leaves by bounded least squares
+    4. polish        coordinate descent: swap one slot's template for the
+                     best candidate given the others, re-fit the scales
+
+The B&B is limited by a node count, so a given seed gives the same
+result on any machine; the seed only jitters candidate order (variety
+between days). `time_budget` additionally caps the wall-clock time per
+day: when it runs out first, the best solution found so far is polished
+and returned with `truncated` set. Such a result depends on machine
+speed, so services.plan_cache does not keep it.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Container, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models.diet import DailyPlan
+from services.dish_index import FEATURE_WEIGHTS, FEATURES, DishIndex, get_dish_index
+from services.meal_distribution import calorie_ratios, rebalance
+from services.meal_templates import TemplateInstance
+
+if TYPE_CHECKING:
+    from services.dish_sampler import DishSampler
+
+
+@dataclass
+class SolverConfig:
+    min_scale: float = 0.5
+    max_scale: float = 2.0
+    candidates_per_slot: int = 40
+    branch_width: int = 3
+    node_limit: int = 60
+    polish_rounds: int = 3
+    portion_penalty: float = 100.0  # kcal^2 per (scale - 1)^2
+    good_enough: float = 5.0  # weighted deviation (kcal) that ends the search early
+    time_budget: float | None = 0.05  # seconds per day, None = node_limit only
+    weights: np.ndarray = field(default_factory=lambda: FEATURE_WEIGHTS.copy())
+
+
+@dataclass
+class SlotCandidates:
+    """Candidate templates of one slot: ids (n,) and features (n, 4)."""
+    category: str
+    template_ids: np.ndarray
+    features: np.ndarray
+    share: float | np.ndarray = 1.0  # of the day, one for all macros or per macro (4,)
+
+
+@dataclass
+class SlotChoice:
+    category: str
+    template_id: int
+    scale: float
+
+
+@dataclass
+class DaySolution:
+    choices: list[SlotChoice]
+    totals: dict[str, float]
+    deviation: float
+    method: str  # "branch_and_bound" | "greedy" (no node searched, e.g. node_limit=0)
+    nodes: int = 0
+    truncated: bool = False  # time_budget ended the search before node_limit
+
+    def instances(self, daily_plan_id: int) -> list[TemplateInstance]:
+        """Rows for `services.meal_templates.instantiate_templates`."""
+        return [
+            TemplateInstance(choice.template_id, daily_plan_id, order, choice.scale)
+            for order, choice in enumerate(self.choices)
+        ]
+
+
+def bounded_lstsq(
+    A: np.ndarray,
+    b: np.ndarray,
+    lo: float | np.ndarray,
+    hi: float | np.ndarray,
+    ridge: float = 0.0,
+    prior: float = 1.0,
+) -> np.ndarray:
+    """
+    min ||A x - b||^2 + ridge * ||x - prior||^2 subject to lo <= x <= hi.
+
+    `A` may be a stack of problems, shape (k, m, n), solved together; the
+    result then has shape (k, n). `b` is (m,) or one row per problem
+    (k, m); `lo` / `hi` are scalars or broadcast to (k, n).
+
+    Primal active-set on the normal equations, warm-started from the
+    clipped unconstrained optimum: solve for the free variables (pinned
+    ones become identity rows, so the whole stack is one batched solve),
+    step toward that solution until the first bound is hit and pin it,
+    release pinned ones whose gradient points back inside.
+    """
+    single = A.ndim == 2
+    if single:
+        A = A[None]
+    k, _, n = A.shape
+
+    At = A.transpose(0, 2, 1)
+    eye = np.eye(n)
+    # A tiny ridge keeps rank-deficient stacks (more slots than macros) solvable
+    G = At @ A + max(ridge, 1e-9) * eye
+    c = (At @ b if b.ndim == 1 else (At @ b[:, :, None])[:, :, 0]) + ridge * prior
+    # Warm start: the unconstrained optimum clipped to the box, its violators pinned
+    unconstrained = np.linalg.solve(G, c[:, :, None])[:, :, 0]
+    x = np.clip(unconstrained, lo, hi)
+    free = (unconstrained > lo) & (unconstrained < hi)
+
+    lo = np.broadcast_to(lo, (k, n))
+    hi = np.broadcast_to(hi, (k, n))
+    # Problems still changing - converged ones drop out of the batch
+    active = np.arange(k)
+    for _ in range(4 * n + 4):
+        Ga, ca, xa, fa = G[active], c[active], x[active], free[active]
+        la, ha = lo[active], hi[active]
+
+        both_free = fa[:, :, None] & fa[:, None, :]
+        M = np.where(both_free, Ga, 0.0) + np.where(~fa[:, :, None], eye, 0.0)
+        pinned_part = (np.where(~fa[:, None, :], Ga, 0.0) @ xa[:, :, None])[:, :, 0]
+        rhs = np.where(fa, ca - pinned_part, xa)
+        solved = np.linalg.solve(M, rhs[:, :, None])[:, :, 0]
+
+        # Step from the feasible x toward the solution until the first bound is hit
+        violated = fa & ((solved < la - 1e-12) | (solved > ha + 1e-12))
+        step = solved - xa
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(solved > ha, (ha - xa) / step, np.where(solved < la, (la - xa) / step, np.inf))
+        ratio = np.where(violated, ratio, np.inf)
+        alpha = np.minimum(ratio.min(axis=1), 1.0)[:, None]
+        xa = np.where(fa, np.clip(xa + alpha * step, la, ha), xa)
+        pinned = violated & (ratio <= alpha + 1e-12)
+        xa = np.where(pinned, np.where(solved > ha, ha, la), xa)
+        fa &= ~pinned
+
+        grad = (Ga @ xa[:, :, None])[:, :, 0] - ca
+        release = ~fa & (((xa <= la) & (grad < -1e-9)) | ((xa >= ha) & (grad > 1e-9)))
+        release &= ~violated.any(axis=1)[:, None]
+        rows = np.flatnonzero(release.any(axis=1))
+        if len(rows):
+            fa[rows, np.argmax(np.where(release[rows], np.abs(grad[rows]), -1.0), axis=1)] = True
+
+        x[active], free[active] = xa, fa
+        active = active[violated.any(axis=1) | release.any(axis=1)]
+        if not len(active):
+            break
+
+    return x[0] if single else x
+
+
+class _Problem:
+    """Weighted candidate data shared by the search phases."""
+
+    def __init__(self, target: np.ndarray, slots: Sequence[SlotCandidates], config: SolverConfig, seed: int) -> None:
+        self.config = config
+        self.slots = slots
+        self.target = np.asarray(target, dtype=np.float64) * config.weights
+        self.vectors = [np.asarray(slot.features, dtype=np.float64) * config.weights for slot in slots]
+        self.norms = [np.einsum("ij,ij->i", v, v) for v in self.vectors]
+
+        self.shares = slot_shares([np.broadcast_to(slot.share, len(FEATURES)) for slot in slots], len(slots))
+
+        # Seeded jitter only breaks near-ties in candidate order
+        rng = np.random.default_rng(seed)
+        self.jitter = [rng.random(len(v)) * 1e-6 for v in self.vectors]
+
+    def fit_scales(self, picks: Sequence[int]) -> tuple[np.ndarray, float]:
+        """Joint portion scales of a full assignment and its penalized objective."""
+        config = self.config
+        A = np.stack([self.vectors[s][p] for s, p in enumerate(picks)], axis=1)
+        scales = bounded_lstsq(A, self.target, config.min_scale, config.max_scale, config.portion_penalty)
+        residual = A @ scales - self.target
+        return scales, float(residual @ residual + config.portion_penalty * np.sum((scales - 1.0) ** 2))
+
+    def best_in_slot(self, picks: list[int], slot: int, bound: float) -> tuple[list[int], np.ndarray, float] | None:
+        """
+        Best candidate for `slot` with the other picks fixed, joint scales
+        for all - every candidate in one batched bounded least squares.
+        Returns None if nothing beats `bound`.
+        """
+        config = self.config
+        candidates = self.vectors[slot]
+        A = np.empty((len(candidates), len(self.target), len(picks)))
+        for s, p in enumerate(picks):
+            if s != slot:
+                A[:, :, s] = self.vectors[s][p]
+        A[:, :, slot] = candidates
+
+        x = bounded_lstsq(A, self.target, config.min_scale, config.max_scale, config.portion_penalty)
+        residual = np.einsum("kij,kj->ki", A, x) - self.target
+        values = np.einsum("ki,ki->k", residual, residual) + config.portion_penalty * np.sum((x - 1.0) ** 2, axis=1)
+
+        k = int(np.argmin(values + self.jitter[slot]))
+        if values[k] >= bound:
+            return None
+        return picks[:slot] + [k] + picks[slot + 1:], x[k], float(values[k])
+
+    def ranked(self, slot: int, want: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Candidates of `slot` ordered by their best single-scale fit to `want`.
+
+        Returns (order, scales, errors) - all candidates, best first.
+        """
+        vectors, norms = self.vectors[slot], self.norms[slot]
+        safe = np.where(norms > 0, norms, 1.0)
+        scales = np.clip(vectors @ want / safe, self.config.min_scale, self.config.max_scale)
+        residual = vectors * scales[:, None] - want
+        errors = np.einsum("ij,ij->i", residual, residual) + self.jitter[slot]
+        order = np.argsort(errors, kind="stable")
+        return order, scales, errors
+
+    def slot_targets(self) -> np.ndarray:
+        """(slots, 4) weighted per-slot targets before anything is picked."""
+        return self.shares * self.target
+
+    def picked(self, wants: np.ndarray, slot: int, actual: np.ndarray) -> np.ndarray:
+        """Copy of `wants` with `slot`'s miss spread over the later slots."""
+        wants = wants.copy()
+        rebalance(wants, self.shares, slot, actual)
+        return wants
+
+
+def _greedy(problem: _Problem) -> tuple[list[int], np.ndarray, float]:
+    picks = []
+    wants = problem.slot_targets()
+    for slot in range(len(problem.slots)):
+        order, scales, _ = problem.ranked(slot, wants[slot])
+        best = int(order[0])
+        picks.append(best)
+        rebalance(wants, problem.shares, slot, scales[best] * problem.vectors[slot][best])
+    scales, value = problem.fit_scales(picks)
+    return picks, scales, value
+
+
+def _overshoot_bound(problem: _Problem, minimal: np.ndarray) -> float:
+    """Macros are non-negative, so overshoot at minimal portions can't be undone."""
+    over = np.maximum(minimal - problem.target, 0.0)
+    return float(over @ over)
+
+
+def _branch_and_bound(
+    problem: _Problem,
+    incumbent: tuple[list[int], np.ndarray, float],
+    deadline: float | None = None,
+) -> tuple[tuple[list[int], np.ndarray, float], int, bool]:
+    """Depth-first B&B of at most `node_limit` nodes; returns (best, nodes, truncated)."""
+    config = problem.config
+    n_slots = len(problem.slots)
+    best = incumbent
+    nodes = 0
+    good_enough = config.good_enough ** 2
+
+    # (slot, picks, per-slot targets after the picks so far, partial sum at minimal scales)
+    stack = [(0, [], problem.slot_targets(), np.zeros_like(problem.target))]
+    while stack:
+        if nodes >= config.node_limit or best[2] <= good_enough:
+            break
+        if deadline is not None and nodes % 16 == 0 and time.perf_counter() > deadline:
+            return best, nodes, True
+        nodes += 1
+
+        slot, picks, wants, minimal = stack.pop()
+        if slot == n_slots - 1:
+            # Last slot: every candidate at once instead of one leaf each
+            found = problem.best_in_slot(picks + [0], slot, best[2])
+            if found is not None:
+                best = found
+            continue
+
+        order, scales, _ = problem.ranked(slot, wants[slot])
+        children = []
+        for candidate in order[:config.branch_width].tolist():
+            vector = problem.vectors[slot][candidate]
+            child_minimal = minimal + config.min_scale * vector
+            if _overshoot_bound(problem, child_minimal) >= best[2]:
+                continue
+            child_wants = problem.picked(wants, slot, scales[candidate] * vector)
+            children.append((slot + 1, picks + [candidate], child_wants, child_minimal))
+        # Best child on top of the stack
+        stack.extend(reversed(children))
+
+    return best, nodes, False
+
+
+def _polish(problem: _Problem, solution: tuple[list[int], np.ndarray, float]) -> tuple[list[int], np.ndarray, float]:
+    """Coordinate descent: re-pick one slot at a time against all its candidates."""
+    best = (list(solution[0]), solution[1], solution[2])
+    for _ in range(problem.config.polish_rounds):
+        improved = False
+        for slot in range(len(best[0])):
+            found = problem.best_in_slot(best[0], slot, best[2] - 1e-9)
+            if found is not None:
+                best, improved = found, True
+        if not improved:
+            break
+    return best
+
+
+def solve_day(
+    target: Sequence[float],
+    slots: Sequence[SlotCandidates],
+    config: SolverConfig | None = None,
+    seed: int = 0,
+) -> DaySolution:
+    """
+    Choose a template and a portion scale for every slot.
+
+    `target` is (protein, carbs, fats, calories). Slots without any
+    candidate raise ValueError.
+    """
+    config = config or SolverConfig()
+    deadline = None if config.time_budget is None else time.perf_counter() + config.time_budget
+
+    empty = [slot.category for slot in slots if len(slot.template_ids) == 0]
+    if empty:
+        raise ValueError(f"No candidate templates for slots: {empty}")
+
+    problem = _Problem(np.asarray(target, dtype=np.float64), slots, config, seed)
+    greedy = _greedy(problem)
+
+    best, nodes, truncated = _branch_and_bound(problem, greedy, deadline)
+    best = _polish(problem, best)
+    method = "branch_and_bound" if nodes else "greedy"
+
+    picks, scales, _ = best
+    raw = sum(scale * slot.features[p] for slot, p, scale in zip(slots, picks, scales))
+    return DaySolution(
+        choices=[
+            SlotChoice(slot.category, int(slot.template_ids[p]), round(float(scale), 3))
+            for slot, p, scale in zip(slots, picks, scales)
+        ],
+        totals=dict(zip(FEATURES, np.asarray(raw, dtype=np.float64).tolist())),
+        deviation=float(np.linalg.norm((raw - np.asarray(target, dtype=np.float64)) * config.weights)),
+        method=method,
+        nodes=nodes,
+        truncated=truncated,
+    )
+
+
+# ---------------- Daily plans ----------------
+
+def daily_plan_target(daily_plan: DailyPlan) -> np.ndarray:
+    """(protein, carbs, fats, calories) targets of a DailyPlan."""
+    return np.array([
+        daily_plan.target_protein,
+        daily_plan.target_carbs,
+        daily_plan.target_fats,
+        daily_plan.target_calories,
+    ], dtype=np.float64)
+
+
+def slot_shares(
+    shares: Sequence | np.ndarray | None,
+    n_slots: int,
+    target: Sequence[float] | np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    (n_slots, 4) shares of the day per slot and macro, columns summing to 1.
+
+    `shares` is one weight per slot (the same for every macro), a
+    (slots x macros) ratio matrix (services.meal_distribution), or None
+    for an even split. With the day's `target`, each slot's calorie share
+    is its share of the target's macro energy, as in `distribute`.
+    """
+    shares = np.asarray(shares if shares is not None else [1.0] * n_slots, dtype=np.float64)
+    if shares.ndim == 1:
+        shares = np.repeat(shares[:, None], len(FEATURES), axis=1)
+    totals = shares.sum(axis=0)
+    shares = np.divide(shares, totals, out=np.full_like(shares, 1.0 / n_slots), where=totals > 0)
+    return shares if target is None else calorie_ratios(shares, target)
+
+
+def slot_candidates(
+    index: DishIndex,
+    target: np.ndarray,
+    categories: Sequence[str],
+    shares: Sequence | np.ndarray | None = None,
+    user_id: int | None = None,
+    k: int = SolverConfig.candidates_per_slot,
+    exclude: Sequence[int] = (),
+) -> list[SlotCandidates]:
+    """k nearest templates per slot to the slot's share of the day's target."""
+    slots = []
+    for category, share in zip(categories, slot_shares(shares, len(categories), target)):
+        ids, _ = index.nearest_many(category, [target * share], k, user_id, exclude)
+        ids = ids[0]
+        features = index.features(category, ids) if len(ids) else np.zeros((0, len(FEATURES)))
+        # Templates without computed nutrition can't be scaled toward anything
+        usable = features.any(axis=1)
+        slots.append(SlotCandidates(category, ids[usable], features[usable], share))
+    return slots
+
+
+def sampled_slot_candidates(
+    sampler: "DishSampler",
+    index: DishIndex,
+    target: np.ndarray,
+    categories: Sequence[str],
+    shares: Sequence | np.ndarray | None = None,
+    k: int = SolverConfig.candidates_per_slot,
+    rng: np.random.Generator | None = None,
+    recent: Container[int] = (),
+) -> list[SlotCandidates]:
+    """
+    k templates per slot drawn from the calorie band of the slot's share -
+    a varied pool at O(k) per slot, independent of catalog size.
+    """
+    rng = rng or np.random.default_rng()
+    slots = []
+    for category, share in zip(categories, slot_shares(shares, len(categories), target)):
+        ids = np.array(sampler.sample_many(category, target[3] * share[3], k, rng, recent), dtype=np.int64)
+        features = index.features(category, ids) if len(ids) else np.zeros((0, len(FEATURES)))
+        slots.append(SlotCandidates(category, ids, features, share))
+    return slots
+
+
+def solve_daily_plan(
+    session: Session,
+    daily_plan: DailyPlan,
+    categories: Sequence[str],
+    user_id: int | None = None,
+    shares: Sequence | np.ndarray | None = None,
+    config: SolverConfig | None = None,
+    seed: int = 0,
+    exclude: Sequence[int] = (),
+) -> DaySolution:
+    """Solve one DailyPlan against the process-wide dish index."""
+    config = config or SolverConfig()
+    target = daily_plan_target(daily_plan)
+    slots = slot_candidates(
+        get_dish_index(session), target, categories, shares, user_id, config.candidates_per_slot, exclude
+    )
+    return solve_day(target, slots, config, seed)
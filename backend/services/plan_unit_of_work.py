@@ -0,0 +1,438 @@
+"""
+Write-behind persistence of DietManager plans into the ORM plan tables.
+
+`DietManager` edits a compact in-memory plan (`diet_planner.PlanState`).
+Writing every `add_meal` / `update_meal` through to the database would
+cost one transaction per click. `PlanUnitOfWork` is attached to the
+manager as its change listener instead and only records *what* changed,
+coalesced per row:
+
+    insert + update*   -> insert          (values are read at flush)
+    update + update    -> update
+    update + delete    -> delete
+    insert + delete    -> nothing         (never reaches the database)
+
+`flush()` turns the log into one transaction with a constant number of
+statements: bulk inserts with RETURNING for new days and meals, one
+executemany UPDATE for changed meals, one DELETE for removed ones and
+one executemany UPDATE for the `actual_*` totals of the touched days.
+It runs on `commit()`, on leaving the `with` block, or once a change is
+recorded after `max_delay` seconds / `max_pending` changes since the
+first unflushed change. The limits are only checked when a change is
+recorded - there is no background timer (DietManager itself is not
+thread-safe), so a lone edit followed by silence stays pending until
+`commit()` or the end of the `with` block.
+
+Database ids of new rows are only taken over once the transaction has
+committed; a failed flush leaves the unit of work as it was, with the
+changes still pending.
+
+Meals are stored by their macros alone, without ingredients, and flagged
+`Meal.macros_only` so that services.nutrition_recompute leaves their
+cached columns as they are. Sodium and cholesterol are not stored per meal. Days keep the values
+they were loaded with, plus whatever the in-memory meals carry.
+
+    manager = DietManager(user)
+    with PlanUnitOfWork(manager) as uow:         # new plan
+        manager.create_diet("lose", "2026-01-01", 30, 4)
+        ...
+
+    uow = PlanUnitOfWork.load(manager, diet_plan_id)   # edit a stored plan
+"""
+import time
+from array import array
+from datetime import date, timedelta
+from typing import Callable
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.diet import DailyPlan, DietGoal, DietPlan, round_calories
+from models.meal import Meal, MealIngredient
+from services.diet_planner import DayPlan, DietManager, NUTRIENTS, PlanState, PlannedMeal
+from services.macro_profiles import mark_profiles_changed
+from utils import log_info
+
+
+DEFAULT_MAX_DELAY = 5.0
+DEFAULT_MAX_PENDING = 500
+
+INSERT, UPDATE, DELETE = "insert", "update", "delete"
+
+# DietManager goal strings (as used by Macronutrients) -> DietPlan.goal
+GOAL_ALIASES = {
+    "lose": DietGoal.WEIGHT_LOSS,
+    "gain": DietGoal.MUSCLE_GAIN,
+    "maintain": DietGoal.MAINTENANCE,
+}
+
+# NUTRIENTS column of each Meal / DailyPlan macro
+_CALORIES, _FATS, _CHOLESTEROL, _SODIUM, _CARBS, _PROTEIN = (
+    NUTRIENTS.index(key) for key in ("calories", "total fat", "cholesterol", "sodium", "carbohydrates", "protein")
+)
+
+
+def _goal(goal) -> DietGoal:
+    return GOAL_ALIASES.get(goal) or DietGoal(goal)
+
+
+def _date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def _values(calories, protein, carbs, fats, sodium=None, cholesterol=None) -> array:
+    """NUTRIENTS-ordered values from the macro columns (sodium / cholesterol only for days)."""
+    values = array("d", bytes(8 * len(NUTRIENTS)))
+    values[_CALORIES], values[_PROTEIN], values[_CARBS], values[_FATS] = (
+        calories or 0.0, protein or 0.0, carbs or 0.0, fats or 0.0,
+    )
+    values[_SODIUM], values[_CHOLESTEROL] = sodium or 0.0, cholesterol or 0.0
+    return values
+
+
+def _meal_row(meal: PlannedMeal) -> dict:
+    values = meal.values
+    return {
+        "name": meal.name,
+        "meal_order": meal.order,
+        "calories": values[_CALORIES],
+        "protein": values[_PROTEIN],
+        "carbs": values[_CARBS],
+        "fats": values[_FATS],
+    }
+
+
+class _Written:
+    """Ids produced by one flush, applied to the unit of work after commit."""
+    __slots__ = ("plan_id", "day_ids", "meal_ids", "removed")
+
+    def __init__(self, plan_id: int | None) -> None:
+        self.plan_id = plan_id
+        self.day_ids: dict = {}
+        self.meal_ids: dict[tuple, int] = {}
+        self.removed: list[tuple] = []
+
+
+class PlanUnitOfWork:
+    """Coalescing change log of one DietManager plan, flushed in batches."""
+
+    def __init__(
+        self,
+        manager: DietManager,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ) -> None:
+        self.manager = manager
+        self.session_factory = session_factory
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        manager.changes = self
+
+        self.plan: PlanState | None = manager.user.diet_plan if isinstance(manager.user.diet_plan, PlanState) else None
+        # Database ids of what is already persisted
+        self.plan_id: int | None = None
+        self.day_ids: dict = {}  # date -> DailyPlan.id
+        self.meal_ids: dict[tuple, int] = {}  # (date, order) -> Meal.id
+        # date -> stored (sodium, cholesterol) of loaded days - not derivable from the meals
+        self.day_micros: dict = {}
+
+        self._reset()
+        # Statistics: recorded changes vs flushes
+        self.recorded = 0
+        self.flushes = 0
+
+    def _reset(self) -> None:
+        self._plan_op: str | None = None
+        self._finish = False
+        self._days: dict = {}  # date -> (day, initial totals as targets)
+        self._meals: dict[tuple, tuple[str, DayPlan, PlannedMeal]] = {}
+        self._first_change: float | None = None
+
+    @property
+    def pending(self) -> int:
+        return (self._plan_op is not None) + self._finish + len(self._days) + len(self._meals)
+
+    # ---------------- Loading ----------------
+    @classmethod
+    def load(cls, manager: DietManager, diet_plan_id: int, **kwargs) -> "PlanUnitOfWork":
+        """Load a stored plan into `manager` (three queries) and track it."""
+        uow = cls(manager, **kwargs)
+        with uow.session_factory() as session:
+            plan = session.get(DietPlan, diet_plan_id)
+            if plan is None:
+                raise ValueError("Diet plan not found")
+            state = PlanState(
+                goal=plan.goal.value,
+                date_from=plan.date_from.isoformat(),
+                date_to=plan.date_to.isoformat(),
+                duration_in_days=plan.duration_in_days,
+                meals_per_day=plan.meals_per_day,
+            )
+            days = session.execute(
+                select(
+                    DailyPlan.id, DailyPlan.date, DailyPlan.actual_calories_exact, DailyPlan.actual_protein,
+                    DailyPlan.actual_carbs, DailyPlan.actual_fats, DailyPlan.actual_sodium,
+                    DailyPlan.actual_cholesterol,
+                )
+                .where(DailyPlan.diet_plan_id == diet_plan_id)
+                .order_by(DailyPlan.date, DailyPlan.id)
+            ).all()
+            meals = session.execute(
+                select(
+                    Meal.id, Meal.daily_plan_id, Meal.name, Meal.meal_order,
+                    Meal.calories, Meal.protein, Meal.carbs, Meal.fats,
+                )
+                .join(DailyPlan, DailyPlan.id == Meal.daily_plan_id)
+                .where(DailyPlan.diet_plan_id == diet_plan_id)
+                .order_by(Meal.daily_plan_id, Meal.meal_order, Meal.id)
+            ).all()
+
+        by_id: dict[int, DayPlan] = {}
+        for row in days:
+            key = row.date.isoformat()
+            by_id[row.id] = state.add_day(
+                key,
+                _values(
+                    row.actual_calories_exact, row.actual_protein, row.actual_carbs, row.actual_fats,
+                    row.actual_sodium, row.actual_cholesterol,
+                ),
+            )
+            uow.day_ids[key] = row.id
+            uow.day_micros[key] = (row.actual_sodium or 0.0, row.actual_cholesterol or 0.0)
+        for row in meals:
+            day = by_id[row.daily_plan_id]
+            # Keep the stored meal_order (bumped past duplicates) so new meals append after it
+            order = max(row.meal_order, day.next_order)
+            meal = PlannedMeal(row.name, order, _values(row.calories, row.protein, row.carbs, row.fats))
+            day.add(meal)
+            uow.meal_ids[(day.date, meal.order)] = row.id
+
+        manager.user.diet_plan = uow.plan = state
+        uow.plan_id = diet_plan_id
+        return uow
+
+    # ---------------- DietManager listener ----------------
+    def _record(self) -> None:
+        self.recorded += 1
+        now = time.monotonic()
+        if self._first_change is None:
+            self._first_change = now
+        if self.pending >= self.max_pending or now - self._first_change >= self.max_delay:
+            self.flush()
+
+    def plan_created(self, plan: PlanState) -> None:
+        # A new plan replaces whatever this unit of work tracked
+        self._reset()
+        self.plan, self.plan_id = plan, None
+        self.day_ids.clear()
+        self.meal_ids.clear()
+        self.day_micros.clear()
+        self._plan_op = INSERT
+        self._record()
+
+    def plan_finished(self) -> None:
+        self._finish = True
+        self._record()
+
+    def plan_deleted(self) -> None:
+        self._days.clear()
+        self._meals.clear()
+        self._finish = False
+        self._plan_op = DELETE if self.plan_id is not None else None
+        if self._plan_op is None:
+            self.plan = None
+        self._record()
+
+    def day_added(self, day: DayPlan, values) -> None:
+        if day.date not in self.day_ids:
+            self._days[day.date] = (day, array("d", values))
+            self._record()
+
+    def meal_added(self, day: DayPlan, meal: PlannedMeal) -> None:
+        self._meals[(day.date, meal.order)] = (INSERT, day, meal)
+        self._record()
+
+    def meal_updated(self, day: DayPlan, meal: PlannedMeal) -> None:
+        key = (day.date, meal.order)
+        if key not in self._meals:
+            self._meals[key] = (UPDATE, day, meal)
+        self._record()
+
+    def meal_removed(self, day: DayPlan, meal: PlannedMeal) -> None:
+        key = (day.date, meal.order)
+        op = self._meals.pop(key, (None,))[0]
+        if op != INSERT:
+            self._meals[key] = (DELETE, day, meal)
+        self._record()
+
+    # ---------------- Flush ----------------
+    def flush(self) -> None:
+        """
+        Write all recorded changes in one transaction.
+
+        New ids are applied only after the commit; if it fails, the
+        recorded changes and id maps are left untouched.
+        """
+        if not self.pending:
+            return
+        with self.session_factory() as session:
+            if self._plan_op == DELETE:
+                plan = session.get(DietPlan, self.plan_id)
+                if plan is not None:
+                    session.delete(plan)  # cascades to days, meals and their ingredients
+                written = None
+            else:
+                written = self._write(session)
+            session.commit()
+
+        if written is None:
+            self.plan, self.plan_id = None, None
+            self.day_ids.clear()
+            self.meal_ids.clear()
+            self.day_micros.clear()
+        else:
+            self.plan_id = written.plan_id
+            self.day_ids.update(written.day_ids)
+            for key in written.removed:
+                del self.meal_ids[key]
+            self.meal_ids.update(written.meal_ids)
+        log_info(f"Flushed diet plan {self.plan_id}: {self.pending} changes from {self.recorded} edits")
+        self.flushes += 1
+        self._reset()
+
+    commit = flush
+
+    def _write(self, session: Session) -> "_Written":
+        """Issue the statements; the returned ids are the caller's to apply after commit."""
+        plan = self.plan
+        written = _Written(self.plan_id)
+        if written.plan_id is None:
+            targets = [int(round(values[_CALORIES])) for _, values in self._days.values()]
+            written.plan_id = session.execute(
+                insert(DietPlan).returning(DietPlan.id),
+                {
+                    "user_id": self.manager.user.id,
+                    "name": f"Plan {plan.date_from}",
+                    "goal": _goal(plan.goal),
+                    "date_from": _date(plan.date_from),
+                    # DietPlan.date_to is inclusive
+                    "date_to": _date(plan.date_from) + timedelta(days=max(plan.duration_in_days - 1, 0)),
+                    "meals_per_day": plan.meals_per_day,
+                    "target_calories": int(round(sum(targets) / len(targets))) if targets else 0,
+                },
+            ).scalar_one()
+        if self._finish:
+            session.execute(
+                update(DietPlan).where(DietPlan.id == written.plan_id).values(is_completed=True, is_active=False)
+            )
+        if self.plan_id is None or self._finish:
+            # Core statements bypass the ORM hooks - the active plan changed
+            mark_profiles_changed(session, [self.manager.user.id])
+
+        # RETURNING rows are matched back by natural key (date, meal order) rather than
+        # by parameter order - sorted RETURNING is row-at-a-time on SQLite
+        if self._days:
+            keys = {_date(key): key for key in self._days}
+            rows = session.execute(
+                insert(DailyPlan).returning(DailyPlan.id, DailyPlan.date),
+                [
+                    {
+                        "diet_plan_id": written.plan_id,
+                        "date": _date(key),
+                        "target_calories": int(round(values[_CALORIES])),
+                        "target_protein": float(values[_PROTEIN]),
+                        "target_carbs": float(values[_CARBS]),
+                        "target_fats": float(values[_FATS]),
+                    }
+                    for key, (_, values) in self._days.items()
+                ],
+            ).all()
+            written.day_ids.update((keys[row.date], row.id) for row in rows)
+        day_ids = self.day_ids | written.day_ids
+
+        by_op: dict[str, list] = {INSERT: [], UPDATE: [], DELETE: []}
+        for key, (op, day, meal) in self._meals.items():
+            by_op[op].append((key, day, meal))
+
+        written.removed = [key for key, _, _ in by_op[DELETE] if key in self.meal_ids]
+        if written.removed:
+            removed = [self.meal_ids[key] for key in written.removed]
+            session.execute(delete(MealIngredient).where(MealIngredient.meal_id.in_(removed)))
+            session.execute(delete(Meal).where(Meal.id.in_(removed)))
+
+        if by_op[INSERT]:
+            keys = {(day_ids[day.date], meal.order): key for key, day, meal in by_op[INSERT]}
+            rows = session.execute(
+                insert(Meal).returning(Meal.id, Meal.daily_plan_id, Meal.meal_order),
+                [
+                    {"daily_plan_id": day_ids[day.date], "macros_only": True, **_meal_row(meal)}
+                    for _, day, meal in by_op[INSERT]
+                ],
+            ).all()
+            written.meal_ids.update((keys[(row.daily_plan_id, row.meal_order)], row.id) for row in rows)
+
+        if by_op[UPDATE]:
+            meals = Meal.__table__
+            session.execute(
+                update(meals)
+                .where(meals.c.id == bindparam("b_id"))
+                .values(
+                    name=bindparam("b_name"),
+                    calories=bindparam("b_calories"),
+                    protein=bindparam("b_protein"),
+                    carbs=bindparam("b_carbs"),
+                    fats=bindparam("b_fats"),
+                ),
+                [
+                    {f"b_{k}": v for k, v in _meal_row(meal).items() if k != "meal_order"} | {"b_id": self.meal_ids[key]}
+                    for key, _, meal in by_op[UPDATE]
+                ],
+            )
+
+        # Day totals straight from the in-memory meals
+        touched = {day.date: day for _, day, _ in self._meals.values()}
+        touched.update((key, day) for key, (day, _) in self._days.items())
+        if touched:
+            days = DailyPlan.__table__
+            session.execute(
+                update(days)
+                .where(days.c.id == bindparam("b_id"))
+                .values(
+                    actual_calories=bindparam("b_calories"),
+                    actual_calories_exact=bindparam("b_calories_exact"),
+                    actual_protein=bindparam("b_protein"),
+                    actual_carbs=bindparam("b_carbs"),
+                    actual_fats=bindparam("b_fats"),
+                    actual_sodium=bindparam("b_sodium"),
+                    actual_cholesterol=bindparam("b_cholesterol"),
+                ),
+                [self._day_totals(day_ids[key], key, day) for key, day in touched.items()],
+            )
+        return written
+
+    def _day_totals(self, day_id: int, key, day: DayPlan) -> dict:
+        totals = self.manager._recalculate_totals(day)
+        sodium, cholesterol = self.day_micros.get(key, (0.0, 0.0))
+        return {
+            "b_id": day_id,
+            "b_calories": round_calories(totals[_CALORIES]),
+            "b_calories_exact": float(totals[_CALORIES]),
+            "b_protein": float(totals[_PROTEIN]),
+            "b_carbs": float(totals[_CARBS]),
+            "b_fats": float(totals[_FATS]),
+            "b_sodium": sodium + float(totals[_SODIUM]),
+            "b_cholesterol": cholesterol + float(totals[_CHOLESTEROL]),
+        }
+
+    # ---------------- Context manager ----------------
+    def __enter__(self) -> "PlanUnitOfWork":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+        else:
+            # Keep the database as it was; the in-memory plan is the caller's to discard
+            self._reset()
@@ -0,0 +1,312 @@
+"""
+Planner benchmark on seeded synthetic catalogs.
+
+Builds an in-memory catalog shaped like the real tables - ingredients
+with per-100 g macros drawn around a few archetypes (protein, starch,
+fat, vegetable, fruit), templates made of 3-6 of them with realistic
+quantities - and a cohort of users whose daily targets come from
+`calculate_cohort`, then plans every user with every strategy:
+
+    nearest   k nearest templates per slot + full search (the default)
+    sampled   k templates drawn from the slot's calorie band + full search
+    greedy    nearest candidates, greedy only (no branch & bound / polish)
+    cached    nearest, through a shared PlanCache (cohort reuse)
+
+and reports per strategy and catalog size:
+
+    day_latency_ms / plan_latency_ms   p50, p90, p99, max
+    peak_memory_mb                     tracemalloc peak of a separate short run
+    deviation_kcal                     weighted distance of each day to its target
+    macro_error_pct                    mean |actual - target| / target per macro
+    greedy_days                        days the search never branched (greedy kept)
+    truncated_days                     days the solver's time budget cut short
+    distinct_templates
+
+Everything is seeded, so two runs on the same machine plan the same
+days (unless `truncated_days` is non-zero); the JSON output is meant to
+be diffed between releases:
+
+    python -m services.planner_benchmark --sizes 1000 10000 100000 --output bench.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Sequence
+
+import numpy as np
+
+from services.dish_index import FEATURES, DishIndex
+from services.macro_calculator import ACTIVITY_LEVELS, GOALS, calculate_cohort
+from services.plan_cache import PlanCache
+from services.plan_generation import DEFAULT_VARIETY_WINDOW, iter_plan_days, solve_plan_days
+from services.plan_solver import DaySolution, SolverConfig
+
+
+CATEGORIES = ("breakfast", "lunch", "dinner", "snack")
+CATEGORY_WEIGHTS = (0.25, 0.3, 0.3, 0.15)
+SLOTS = ("breakfast", "lunch", "snack", "dinner")
+SHARES = (0.25, 0.35, 0.1, 0.3)
+
+# Archetype -> mean (protein, carbs, fat) per 100 g and typical quantity range (g)
+ARCHETYPES = {
+    "protein": ((22.0, 1.0, 6.0), (80, 200)),
+    "starch": ((8.0, 70.0, 2.0), (40, 120)),
+    "fat": ((2.0, 2.0, 80.0), (5, 20)),
+    "vegetable": ((2.0, 6.0, 0.3), (50, 200)),
+    "fruit": ((0.8, 13.0, 0.3), (80, 180)),
+    "dairy": ((8.0, 5.0, 4.0), (100, 250)),
+}
+
+STRATEGIES = ("nearest", "sampled", "greedy", "cached")
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class SyntheticCatalog:
+    """Arrays mirroring the ingredients / meal_templates columns the planner reads."""
+    ingredient_macros: np.ndarray  # (I, 3) protein, carbs, fat per 100 g
+    template_ids: np.ndarray
+    template_categories: np.ndarray  # index into CATEGORIES
+    template_features: np.ndarray  # (T, 4) protein, carbs, fats, calories
+
+    def index(self) -> DishIndex:
+        index = DishIndex()
+        for c, category in enumerate(CATEGORIES):
+            rows = self.template_categories == c
+            ids = self.template_ids[rows]
+            index._category(category).extend(ids, [None] * len(ids), self.template_features[rows])
+            index._category_of.update((int(i), category) for i in ids)
+        return index
+
+
+def synthetic_catalog(n_templates: int, seed: int = 0, n_ingredients: int | None = None) -> SyntheticCatalog:
+    rng = np.random.default_rng(seed)
+    n_ingredients = n_ingredients or max(200, n_templates // 20)
+    names = list(ARCHETYPES)
+
+    kinds = rng.integers(len(names), size=n_ingredients)
+    means = np.array([ARCHETYPES[name][0] for name in names])[kinds]
+    macros = np.clip(means * rng.lognormal(0.0, 0.3, size=means.shape), 0.0, 100.0)
+    quantity_range = np.array([ARCHETYPES[name][1] for name in names], dtype=np.float64)[kinds]
+
+    # Templates as CSR-like (template, ingredient, grams) triples
+    sizes = rng.integers(3, 7, size=n_templates)
+    owners = np.repeat(np.arange(n_templates), sizes)
+    items = rng.integers(n_ingredients, size=len(owners))
+    low, high = quantity_range[items, 0], quantity_range[items, 1]
+    grams = low + rng.random(len(items)) * (high - low)
+
+    per_item = macros[items] * (grams / 100.0)[:, None]
+    totals = np.zeros((n_templates, 3))
+    np.add.at(totals, owners, per_item)
+    calories = totals @ np.array([4.0, 4.0, 9.0])
+
+    return SyntheticCatalog(
+        ingredient_macros=macros,
+        template_ids=np.arange(1, n_templates + 1, dtype=np.int64),
+        template_categories=rng.choice(len(CATEGORIES), size=n_templates, p=CATEGORY_WEIGHTS),
+        template_features=np.column_stack([totals, calories]),
+    )
+
+
+def synthetic_targets(n_users: int, seed: int = 0, profiles: int | None = None) -> np.ndarray:
+    """
+    Daily (protein, carbs, fats, calories) of a synthetic cohort, from `calculate_cohort`.
+
+    With `profiles`, users are drawn from that many base profiles plus a
+    jitter below the plan cache quantum - a coaching cohort on shared targets.
+    """
+    rng = np.random.default_rng(seed + 1)
+    if profiles:
+        base = synthetic_targets(profiles, seed)
+        jitter = rng.uniform(-0.2, 0.2, size=(n_users, len(FEATURES))) * [1.0, 1.0, 1.0, 2.0]
+        return base[rng.integers(profiles, size=n_users)] + jitter
+
+    male = rng.random(n_users) < 0.5
+    height = rng.normal(np.where(male, 178, 165), 7)
+    weight = np.clip(rng.normal(22.5, 3.5, n_users) * (height / 100) ** 2, 45, 150)
+    macros = calculate_cohort(
+        sex=np.where(male, 0, 1),
+        weight=weight,
+        height=height,
+        age=rng.integers(18, 70, n_users),
+        activity_level=rng.integers(len(ACTIVITY_LEVELS), size=n_users),
+        goal=rng.integers(len(GOALS), size=n_users),
+    )
+    return np.column_stack([macros.protein_g, macros.carbs_g, macros.fat_g, macros.calories])
+
+
+# ---------------- Strategies ----------------
+
+# (index, target, days, seed, cache) -> [(solution, seconds)]
+Strategy = Callable[[DishIndex, np.ndarray, int, int, PlanCache | None], list[tuple[DaySolution, float]]]
+
+
+def _timed_days(index: DishIndex, target: np.ndarray, days: int, seed: int, **kwargs) -> list[tuple[DaySolution, float]]:
+    results = []
+    iterator = iter_plan_days(index, target, days, SLOTS, shares=SHARES, seed=seed, **kwargs)
+    while True:
+        started = time.perf_counter()
+        try:
+            _, solution = next(iterator)
+        except StopIteration:
+            return results
+        results.append((solution, time.perf_counter() - started))
+
+
+def _cached(index: DishIndex, target: np.ndarray, days: int, seed: int, cache: PlanCache | None):
+    started = time.perf_counter()
+    solutions = solve_plan_days(
+        index, target, days, SLOTS, shares=SHARES, seed=seed, workers=1, chunk_days=days, cache=cache,
+    )
+    per_day = (time.perf_counter() - started) / max(len(solutions), 1)
+    return [(solution, per_day) for solution in solutions]
+
+
+STRATEGY_FUNCTIONS: dict[str, Strategy] = {
+    "nearest": lambda index, target, days, seed, cache: _timed_days(index, target, days, seed),
+    "sampled": lambda index, target, days, seed, cache: _timed_days(
+        index, target, days, seed, candidate_source="sampled"
+    ),
+    "greedy": lambda index, target, days, seed, cache: _timed_days(
+        index, target, days, seed, config=SolverConfig(node_limit=0, polish_rounds=0)
+    ),
+    "cached": _cached,
+}
+
+
+# ---------------- Metrics ----------------
+
+def _percentiles(values: Sequence[float], scale: float = 1.0) -> dict[str, float]:
+    values = np.asarray(values, dtype=np.float64) * scale
+    if not len(values):
+        return {}
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 4) for p in PERCENTILES}
+    summary["max"] = round(float(values.max()), 4)
+    summary["mean"] = round(float(values.mean()), 4)
+    return summary
+
+
+def run_strategy(
+    name: str,
+    index: DishIndex,
+    targets: np.ndarray,
+    days: int,
+    seed: int,
+) -> dict:
+    strategy = STRATEGY_FUNCTIONS[name]
+    cache = PlanCache(256 * 2**20) if name == "cached" else None
+
+    day_latency, plan_latency, deviation, greedy_days, truncated_days = [], [], [], 0, 0
+    errors = np.zeros(len(FEATURES))
+    used: set[int] = set()
+    total_days = 0
+    for user, target in enumerate(targets):
+        # Cohort users share the plan seed, as generate_daily_plans callers do by default
+        results = strategy(index, target, days, seed, cache)
+        plan_latency.append(sum(seconds for _, seconds in results))
+        for solution, seconds in results:
+            day_latency.append(seconds)
+            deviation.append(solution.deviation)
+            greedy_days += solution.method == "greedy"
+            truncated_days += solution.truncated
+            totals = np.array([solution.totals[feature] for feature in FEATURES])
+            errors += np.abs(totals - target) / target
+            used.update(choice.template_id for choice in solution.choices)
+            total_days += 1
+
+    report = {
+        "day_latency_ms": _percentiles(day_latency, 1000.0),
+        "plan_latency_ms": _percentiles(plan_latency, 1000.0),
+        "deviation_kcal": _percentiles(deviation),
+        "macro_error_pct": {
+            feature: round(float(value / max(total_days, 1) * 100), 3) for feature, value in zip(FEATURES, errors)
+        },
+        "greedy_days": greedy_days,
+        "truncated_days": truncated_days,
+        "distinct_templates": len(used),
+        "days": total_days,
+    }
+    if cache is not None:
+        report["cache"] = {"hits": cache.stats.hits, "misses": cache.stats.misses}
+    return report
+
+
+def peak_memory_mb(name: str, index: DishIndex, targets: np.ndarray, days: int, seed: int) -> float:
+    """tracemalloc peak of planning a few users - separate run, tracing slows the timed one."""
+    tracemalloc.start()
+    try:
+        run_strategy(name, index, targets, days, seed)
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(
+    sizes: Sequence[int],
+    strategies: Sequence[str] = STRATEGIES,
+    users: int = 50,
+    days: int = 7,
+    seed: int = 0,
+    profiles: int | None = None,
+    memory_users: int = 3,
+) -> dict:
+    targets = synthetic_targets(users, seed, profiles)
+    results = {
+        "meta": {
+            "seed": seed,
+            "users": users,
+            "profiles": profiles,
+            "days": days,
+            "slots": list(SLOTS),
+            "variety_window": DEFAULT_VARIETY_WINDOW,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+        },
+        "catalogs": [],
+    }
+    for size in sizes:
+        started = time.perf_counter()
+        catalog = synthetic_catalog(size, seed)
+        index = catalog.index()
+        entry = {
+            "templates": size,
+            "ingredients": len(catalog.ingredient_macros),
+            "build_ms": round((time.perf_counter() - started) * 1000, 2),
+            "strategies": {},
+        }
+        for name in strategies:
+            report = run_strategy(name, index, targets, days, seed)
+            report["peak_memory_mb"] = peak_memory_mb(name, index, targets[:memory_users], days, seed)
+            entry["strategies"][name] = report
+        results["catalogs"].append(entry)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark plan generation strategies on synthetic catalogs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profiles", type=int, help="draw users from this many shared target profiles")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.strategies, args.users, args.days, args.seed, args.profiles)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Background recalculation of a user's plans after their macros change.
+
+A new `PhysicalData` row changes the user's daily macro targets, and per
+the README "Recalculation Method" every future day of the active diet
+plans has to follow. For a 90 day plan that is hundreds of meals, so the
+write request only enqueues a job (see the session hooks at the bottom)
+and returns:
+
+    1. `RecalculationQueue` keeps at most one queued job per user -
+       repeated changes before it starts are coalesced into it
+    2. worker threads take jobs; one user is never processed by two
+       workers at once
+    3. a job writes the new targets to the plans and their future,
+       not completed days, then refits the portions of the uneaten meals
+       of those days (eaten meals stay as they are), `batch_days` days
+       per transaction
+
+Portions are refitted per day with the batched `bounded_lstsq` of the
+plan solver: one scale per uneaten meal, kept within the solver's
+portion range relative to the template. Ingredient quantities are
+scaled in place and the cached totals recomputed set-based.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Iterable
+
+import numpy as np
+from sqlalchemy import bindparam, event, select, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models.diet import DailyPlan, DietGoal, DietPlan
+from models.meal import Meal, MealIngredient
+from models.user import PhysicalData, User
+from services.macro_calculator import Macronutrients
+from services.macro_profiles import MACRO_GOALS, latest_physical_data
+from services.nutrition_recompute import recompute_daily_plans, recompute_meals
+from services.plan_solver import SolverConfig, bounded_lstsq
+from utils import log_error, log_info
+
+
+DEFAULT_BATCH_DAYS = 50
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+@dataclass
+class RecalculationJob:
+    id: int
+    user_id: int
+    status: str = QUEUED
+    # Triggers coalesced into this job
+    requests: int = 1
+    requested_at: datetime = field(default_factory=datetime.now)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    days: int = 0
+    meals: int = 0
+    error: str | None = None
+
+
+# ---------------- Recalculation ----------------
+
+def daily_targets(user: User, physical: PhysicalData, goal: DietGoal) -> tuple[float, float, float, float]:
+    """(protein, carbs, fats, calories) per day from the user's latest measurements."""
+    calculator = Macronutrients(
+        user.gender, physical.weight, user.height, user.age, physical.activity_level, physical.body_fat_percentage
+    )
+    macros = calculator.calculate_macros(MACRO_GOALS[DietGoal(goal)])
+    return macros["protein_g"], macros["carbs_g"], macros["fat_g"], macros["calories"]
+
+
+def refit_days(
+    session: Session,
+    targets: dict[int, tuple[float, float, float, float]],
+    config: SolverConfig | None = None,
+) -> int:
+    """
+    Set new targets on the given days and rescale their uneaten meals.
+
+    `targets` maps daily_plan_id -> (protein, carbs, fats, calories).
+    Returns the number of rescaled meals. Does not commit.
+    """
+    config = config or SolverConfig()
+    if not targets:
+        return 0
+
+    session.execute(
+        update(DailyPlan.__table__)
+        .where(DailyPlan.__table__.c.id == bindparam("b_id"))
+        .values(
+            target_protein=bindparam("b_protein"),
+            target_carbs=bindparam("b_carbs"),
+            target_fats=bindparam("b_fats"),
+            target_calories=bindparam("b_calories"),
+        ),
+        [
+            {"b_id": day_id, "b_protein": p, "b_carbs": c, "b_fats": f, "b_calories": int(round(kcal))}
+            for day_id, (p, c, f, kcal) in targets.items()
+        ],
+    )
+
+    rows = session.execute(
+        select(
+            Meal.id, Meal.daily_plan_id, Meal.scale_factor, Meal.is_eaten,
+            Meal.protein, Meal.carbs, Meal.fats, Meal.calories,
+        )
+        .where(Meal.daily_plan_id.in_(list(targets)))
+        .order_by(Meal.daily_plan_id, Meal.meal_order)
+    ).all()
+
+    # One bounded least-squares problem per day, padded to the largest day
+    by_day: dict[int, list] = {}
+    remaining = {day_id: np.asarray(target, dtype=np.float64) for day_id, target in targets.items()}
+    for row in rows:
+        values = np.array(row[4:], dtype=np.float64)
+        if row.is_eaten:
+            remaining[row.daily_plan_id] -= values
+        else:
+            by_day.setdefault(row.daily_plan_id, []).append((row.id, row.scale_factor or 1.0, values))
+    if not by_day:
+        return 0
+
+    day_ids = list(by_day)
+    n = max(len(meals) for meals in by_day.values())
+    A = np.zeros((len(day_ids), 4, n))
+    lo = np.ones((len(day_ids), n))
+    hi = np.ones((len(day_ids), n))
+    for d, day_id in enumerate(day_ids):
+        for m, (_, scale, values) in enumerate(by_day[day_id]):
+            A[d, :, m] = values * config.weights
+            # Ratio to the current portion, keeping the portion within the template range
+            lo[d, m], hi[d, m] = config.min_scale / scale, config.max_scale / scale
+    lo = np.minimum(lo, 1.0)
+    hi = np.maximum(hi, 1.0)
+    b = np.stack([remaining[day_id] for day_id in day_ids]) * config.weights
+
+    ratios = bounded_lstsq(A, b, lo, hi, config.portion_penalty)
+
+    changed = [
+        {"b_meal_id": meal_id, "b_ratio": float(ratios[d, m])}
+        for d, day_id in enumerate(day_ids)
+        for m, (meal_id, _, _) in enumerate(by_day[day_id])
+        if abs(ratios[d, m] - 1.0) > 1e-6
+    ]
+    if changed:
+        items = MealIngredient.__table__
+        session.execute(
+            update(items)
+            .where(items.c.meal_id == bindparam("b_meal_id"))
+            .values(
+                quantity=items.c.quantity * bindparam("b_ratio"),
+                quantity_base=items.c.quantity_base * bindparam("b_ratio"),
+                base_multiplier=items.c.base_multiplier * bindparam("b_ratio"),
+            ),
+            changed,
+        )
+        meals = Meal.__table__
+        session.execute(
+            update(meals)
+            .where(meals.c.id == bindparam("b_meal_id"))
+            .values(scale_factor=meals.c.scale_factor * bindparam("b_ratio")),
+            changed,
+        )
+        recompute_meals(session, [row["b_meal_id"] for row in changed], rollup=False)
+    recompute_daily_plans(session, list(targets))
+    return len(changed)
+
+
+def recalculate_user(user_id: int, batch_days: int = DEFAULT_BATCH_DAYS, job: RecalculationJob | None = None) -> None:
+    """
+    Push the user's current macro targets into every active plan.
+
+    Days from today on that are not completed are refitted, `batch_days`
+    per transaction; progress is recorded on `job`.
+    """
+    today = date.today()
+    with SessionLocal() as session:
+        user = session.get(User, user_id)
+        physical = latest_physical_data(session, [user_id]).get(user_id) if user else None
+        if physical is None:
+            return
+
+        plans = session.execute(
+            select(DietPlan).where(
+                DietPlan.user_id == user_id,
+                DietPlan.is_active.is_(True),
+                DietPlan.is_completed.is_(False),
+                DietPlan.date_to >= today,
+            )
+        ).scalars().all()
+        plan_targets = {plan.id: daily_targets(user, physical, plan.goal) for plan in plans}
+        for plan in plans:
+            plan.target_calories = int(round(plan_targets[plan.id][3]))
+        session.commit()
+
+        days = session.execute(
+            select(DailyPlan.id, DailyPlan.diet_plan_id)
+            .where(
+                DailyPlan.diet_plan_id.in_(list(plan_targets)),
+                DailyPlan.date >= today,
+                DailyPlan.is_completed.is_(False),
+            )
+            .order_by(DailyPlan.date, DailyPlan.id)
+        ).all()
+
+    for start in range(0, len(days), batch_days):
+        batch = days[start:start + batch_days]
+        with SessionLocal() as session:
+            meals = refit_days(session, {day.id: plan_targets[day.diet_plan_id] for day in batch})
+            session.commit()
+        if job is not None:
+            job.days += len(batch)
+            job.meals += meals
+
+
+# ---------------- Job queue ----------------
+
+class RecalculationQueue:
+    """Per-user coalescing job queue drained by worker threads."""
+
+    def __init__(self, batch_days: int = DEFAULT_BATCH_DAYS) -> None:
+        self.batch_days = batch_days
+        self._condition = threading.Condition()
+        self._queued: OrderedDict[int, RecalculationJob] = OrderedDict()
+        self._running: dict[int, RecalculationJob] = {}
+        self._latest: dict[int, RecalculationJob] = {}
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def submit(self, user_id: int) -> RecalculationJob:
+        """Queue a recalculation, or join the user's job that has not started yet."""
+        with self._condition:
+            job = self._queued.get(user_id)
+            if job is not None:
+                job.requests += 1
+                return job
+            job = RecalculationJob(next(self._ids), user_id)
+            self._queued[user_id] = job
+            self._latest[user_id] = job
+            self._condition.notify()
+            return job
+
+    def submit_many(self, user_ids: Iterable[int]) -> None:
+        for user_id in user_ids:
+            self.submit(user_id)
+
+    def status(self, user_id: int) -> RecalculationJob | None:
+        """The user's most recent job (queued, running or finished)."""
+        return self._latest.get(user_id)
+
+    def _take(self) -> RecalculationJob | None:
+        """Oldest queued job of a user no other worker is processing."""
+        for user_id in self._queued:
+            if user_id not in self._running:
+                job = self._queued.pop(user_id)
+                self._running[user_id] = job
+                return job
+        return None
+
+    def run_job(self, job: RecalculationJob) -> None:
+        job.status, job.started_at = RUNNING, datetime.now()
+        try:
+            recalculate_user(job.user_id, self.batch_days, job)
+            job.status = DONE
+            log_info(f"Recalculated plans of user {job.user_id}: {job.days} days, {job.meals} meals")
+        except Exception as e:
+            job.status, job.error = FAILED, str(e)
+            log_error(f"Recalculation of user {job.user_id} failed: {e}")
+        finally:
+            job.finished_at = datetime.now()
+            with self._condition:
+                self._running.pop(job.user_id, None)
+                self._condition.notify_all()
+
+    def run_worker(self, stop: threading.Event, interval: float = 1.0) -> None:
+        while not stop.is_set():
+            with self._condition:
+                job = self._take()
+                if job is None:
+                    self._condition.wait(interval)
+                    continue
+            self.run_job(job)
+
+    def start_workers(self, workers: int = 1, interval: float = 1.0) -> threading.Event:
+        """Start daemon worker threads; set the returned event to stop them."""
+        stop = threading.Event()
+        for number in range(workers):
+            threading.Thread(
+                target=self.run_worker,
+                args=(stop, interval),
+                name=f"recalculation-{number}",
+                daemon=True,
+            ).start()
+        return stop
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until nothing is queued or running; False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queued and not self._running, timeout)
+
+
+recalculation_queue = RecalculationQueue(settings.recalculation_batch_days)
+
+
+# ---------------- Session hooks ----------------
+
+@event.listens_for(Session, "after_flush")
+def _collect_new_measurements(session, flush_context) -> None:
+    user_ids = {obj.user_id for obj in session.new if isinstance(obj, PhysicalData)}
+    if user_ids:
+        session.info.setdefault("recalculation_users", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_recalculation(session) -> None:
+    user_ids = session.info.pop("recalculation_users", None)
+    if user_ids:
+        recalculation_queue.submit_many(sorted(user_ids))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_recalculation(session) -> None:
+    session.info.pop("recalculation_users", None)
@@ -0,0 +1,255 @@
+"""
+Batch recipe scaling: personalize every MealTemplate for many users at once.
+
+For user u and template t with ingredients j, find per-ingredient scale
+factors s_j in [min_j, max_j] minimizing
+
+    || W (sum_j s_j * n_tj - target_u) ||^2 + shape_penalty * ||s - 1||^2
+
+where n_tj are the (protein, carbs, fats, calories) the ingredient adds at
+its template quantity and W the dish index weights (kcal). The penalty
+keeps the recipe recognisable when several ingredient mixes hit the
+target.
+
+The normal matrix only depends on the template, so its inverse is
+computed once per template and the unconstrained optimum for all users
+is a single einsum. Only (user, template) pairs whose optimum leaves the
+per-ingredient box go through the batched active-set `bounded_lstsq`.
+Templates are padded to the same ingredient count (padding columns are
+zero and pinned at 1).
+"""
+from dataclasses import dataclass
+from typing import Mapping, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.meal import MealTemplate, MealTemplateIngredient
+from services.catalog_snapshot import load_ingredient_matrix
+from services.dish_index import FEATURE_WEIGHTS, FEATURES
+from services.ingredient_matrix import NUTRIENT_INDEX
+from services.plan_solver import bounded_lstsq
+
+
+DEFAULT_MIN_SCALE = 0.5
+DEFAULT_MAX_SCALE = 2.0
+DEFAULT_SHAPE_PENALTY = 100.0
+# Users per einsum pass - bounds memory at users * templates * ingredients
+DEFAULT_USER_CHUNK = 512
+
+# IngredientMatrix columns in FEATURES order (protein, carbs, fats, calories)
+FEATURE_COLUMNS = [NUTRIENT_INDEX[name] for name in ("protein", "carbs", "fat", "calories")]
+
+
+class RecipeBook:
+    """Padded per-template ingredient contribution matrices."""
+
+    def __init__(
+        self,
+        template_ids: np.ndarray,
+        categories: Sequence[str],
+        ingredient_ids: np.ndarray,
+        quantities: np.ndarray,
+        units: list[list[str]],
+        contributions: np.ndarray,
+        min_scale: np.ndarray,
+        max_scale: np.ndarray,
+    ) -> None:
+        """
+        Parameters:
+        template_ids (np.ndarray): shape (T,)
+        categories (list): MealTemplate.category per template
+        ingredient_ids (np.ndarray): shape (T, J), 0 = padding
+        quantities (np.ndarray): template quantities, shape (T, J)
+        units (list): unit names, T lists
+        contributions (np.ndarray): macros per ingredient at its quantity, shape (T, J, 4)
+        min_scale, max_scale (np.ndarray): per-ingredient bounds, shape (T, J)
+        """
+        self.template_ids = np.asarray(template_ids, dtype=np.int64)
+        self.categories = list(categories)
+        self.ingredient_ids = ingredient_ids
+        self.quantities = quantities
+        self.units = units
+        self.contributions = contributions
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self._positions = {int(t): i for i, t in enumerate(self.template_ids.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.template_ids)
+
+    def position(self, template_id: int) -> int:
+        return self._positions[template_id]
+
+    @classmethod
+    def from_session(
+        cls,
+        session: Session,
+        template_ids: Sequence[int] | None = None,
+        limits: Mapping[tuple[int, int], tuple[float, float]] | None = None,
+        min_scale: float = DEFAULT_MIN_SCALE,
+        max_scale: float = DEFAULT_MAX_SCALE,
+    ) -> "RecipeBook":
+        """
+        Load template rows with one column query; the macros come from
+        `load_ingredient_matrix`, i.e. the catalog snapshot when it is current.
+
+        `limits` overrides the scale range per (template_id, ingredient_id),
+        e.g. (1.0, 1.0) for a spice that must not change.
+        """
+        limits = limits or {}
+        stmt = (
+            select(
+                MealTemplate.id,
+                MealTemplate.category,
+                MealTemplateIngredient.ingredient_id,
+                MealTemplateIngredient.quantity,
+                MealTemplateIngredient.unit,
+                MealTemplateIngredient.quantity_base,
+            )
+            .join(MealTemplateIngredient, MealTemplateIngredient.template_id == MealTemplate.id)
+            .order_by(MealTemplate.id, MealTemplateIngredient.id)
+        )
+        if template_ids is not None:
+            stmt = stmt.where(MealTemplate.id.in_(list(template_ids)))
+        rows = session.execute(stmt).all()
+
+        grouped: dict[int, list] = {}
+        categories: dict[int, str] = {}
+        for row in rows:
+            grouped.setdefault(row[0], []).append(row)
+            categories[row[0]] = row[1]
+
+        ids = list(grouped)
+        T, J = len(ids), max((len(items) for items in grouped.values()), default=0)
+        ingredient_ids = np.zeros((T, J), dtype=np.int64)
+        quantities = np.zeros((T, J), dtype=np.float64)
+        contributions = np.zeros((T, J, len(FEATURES)), dtype=np.float64)
+        lo = np.ones((T, J), dtype=np.float64)
+        hi = np.ones((T, J), dtype=np.float64)
+        units = []
+
+        t_index, j_index, flat_units, base_quantities = [], [], [], []
+        for t, template_id in enumerate(ids):
+            items = grouped[template_id]
+            units.append([row[4] for row in items])
+            for j, row in enumerate(items):
+                ingredient_ids[t, j] = row[2]
+                quantities[t, j] = row[3]
+                lo[t, j], hi[t, j] = limits.get((template_id, row[2]), (min_scale, max_scale))
+                t_index.append(t)
+                j_index.append(j)
+                flat_units.append(row[4])
+                base_quantities.append(np.nan if row[5] is None else row[5])
+
+        if rows:
+            # Macros per base unit from the shared catalog matrix (snapshot-backed in workers);
+            # rows without a stored base quantity fall back to quantity + unit conversion
+            matrix = load_ingredient_matrix(session)
+            flat_ids = ingredient_ids[t_index, j_index]
+            base_qty = np.asarray(base_quantities, dtype=np.float64)
+            missing = np.isnan(base_qty)
+            if missing.any():
+                base_qty[missing] = matrix.base_quantities(
+                    flat_ids[missing],
+                    quantities[t_index, j_index][missing],
+                    [unit for unit, m in zip(flat_units, missing) if m],
+                )
+            per_unit = matrix.values[matrix.positions(flat_ids)][:, FEATURE_COLUMNS]
+            contributions[t_index, j_index] = per_unit * base_qty[:, None]
+
+        return cls(np.array(ids), [categories[i] for i in ids], ingredient_ids, quantities, units, contributions, lo, hi)
+
+
+@dataclass
+class ScaledRecipes:
+    """
+    Per-user scale factors for every template, float32 to keep 10k users
+    x hundreds of templates in memory.
+    """
+    book: RecipeBook
+    user_ids: np.ndarray
+    scales: np.ndarray  # (U, T, J)
+    totals: np.ndarray  # (U, T, 4) macros of the scaled recipe
+    deviation: np.ndarray  # (U, T) weighted distance to the target (kcal)
+
+    def _user(self, user_id: int) -> int:
+        matches = np.flatnonzero(self.user_ids == user_id)
+        if not len(matches):
+            raise KeyError(user_id)
+        return int(matches[0])
+
+    def recipe(self, user_id: int, template_id: int) -> list[tuple[int, float, str]]:
+        """(ingredient_id, quantity, unit) of one user's version of a template."""
+        u, t = self._user(user_id), self.book.position(template_id)
+        units = self.book.units[t]
+        return [
+            (int(self.book.ingredient_ids[t, j]), float(self.book.quantities[t, j] * self.scales[u, t, j]), units[j])
+            for j in range(len(units))
+        ]
+
+    def nutrition(self, user_id: int, template_id: int) -> dict[str, float]:
+        u, t = self._user(user_id), self.book.position(template_id)
+        return dict(zip(FEATURES, self.totals[u, t].tolist()))
+
+
+def _targets_per_template(
+    book: RecipeBook,
+    targets: np.ndarray | Mapping[str, np.ndarray],
+    n_users: int,
+) -> np.ndarray:
+    """Broadcast per-meal targets to (U, T, 4) - one row for all, or one per category."""
+    if isinstance(targets, Mapping):
+        out = np.zeros((n_users, len(book), len(FEATURES)), dtype=np.float64)
+        for t, category in enumerate(book.categories):
+            out[:, t] = np.asarray(targets[category], dtype=np.float64)
+        return out
+    targets = np.asarray(targets, dtype=np.float64)
+    return np.broadcast_to(targets[:, None, :], (n_users, len(book), len(FEATURES)))
+
+
+def scale_recipes(
+    book: RecipeBook,
+    user_ids: Sequence[int],
+    targets: np.ndarray | Mapping[str, np.ndarray],
+    shape_penalty: float = DEFAULT_SHAPE_PENALTY,
+    weights: np.ndarray = FEATURE_WEIGHTS,
+    user_chunk: int = DEFAULT_USER_CHUNK,
+) -> ScaledRecipes:
+    """
+    Scale every template of `book` for every user.
+
+    `targets` are per-meal (protein, carbs, fats, calories): shape (U, 4)
+    for all templates, or {category: (U, 4)}.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    U, T = len(user_ids), len(book)
+    J = book.ingredient_ids.shape[1]
+
+    # A[t] is (4, J): weighted macro contributions as columns
+    A = (book.contributions * weights).transpose(0, 2, 1)
+    G = A.transpose(0, 2, 1) @ A + max(shape_penalty, 1e-9) * np.eye(J)
+    G_inv = np.linalg.inv(G)
+    lo, hi = book.min_scale, book.max_scale
+
+    all_targets = _targets_per_template(book, targets, U)
+    scales = np.empty((U, T, J), dtype=np.float32)
+    for start in range(0, U, user_chunk):
+        stop = min(start + user_chunk, U)
+        target = all_targets[start:stop] * weights  # (u, T, 4)
+
+        c = np.einsum("tmj,utm->utj", A, target) + shape_penalty
+        x = np.einsum("tij,utj->uti", G_inv, c)
+
+        outside = np.any((x < lo - 1e-12) | (x > hi + 1e-12), axis=2)
+        if outside.any():
+            users, templates = np.nonzero(outside)
+            x[users, templates] = bounded_lstsq(
+                A[templates], target[users, templates], lo[templates], hi[templates], shape_penalty
+            )
+        scales[start:stop] = x
+
+    totals = np.einsum("utj,tjm->utm", scales.astype(np.float64), book.contributions)
+    deviation = np.linalg.norm((totals - all_targets) * weights, axis=2)
+    return ScaledRecipes(book, user_ids, scales, totals.astype(np.float32), deviation.astype(np.float32))
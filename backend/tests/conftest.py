@@ -0,0 +1,72 @@
+"""Wspólne fixture testów - SQLite w katalogu tymczasowym, świeży schemat na każdy test."""
+import os
+import tempfile
+from datetime import date
+
+# Przed importem config/database - testy nigdy nie dotykają bazy z .env
+_DB_DIR = tempfile.mkdtemp(prefix="diet-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.sqlite"
+os.environ.setdefault("SECRET_KEY", "test")
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from auth import get_current_user
+from database import Base, SessionLocal, engine, get_db
+from models import Ingredient, IngredientCategory, User
+from routers import diet_router
+
+
+@pytest.fixture
+def db():
+    """Sesja na pustej bazie."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def user(db) -> User:
+    user = User(
+        username="ann",
+        email="ann@example.com",
+        hashed_password="x",
+        date_of_birth=date(1990, 1, 1),
+        gender="female",
+        height=170,
+    )
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def ingredients(db) -> dict[str, Ingredient]:
+    """Kilka globalnych składników (wartości na 100 g)."""
+    category = IngredientCategory(name="test")
+    rows = {
+        "chicken": Ingredient(name="Chicken breast", category=category, calories=165, protein=31, fat=3.6,
+                              sodium=74, cholesterol=85),
+        "rice": Ingredient(name="Brown rice", category=category, calories=111, protein=2.6, fat=0.9, carbs=23,
+                           fiber=1.8, sodium=5),
+        "oil": Ingredient(name="Olive oil", category=category, calories=884, fat=100),
+    }
+    db.add_all(rows.values())
+    db.commit()
+    return rows
+
+
+@pytest.fixture
+def client(db, user) -> TestClient:
+    """Router planów bez main.py (bez wątków w tle), zalogowany jako `user`."""
+    app = FastAPI()
+    app.include_router(diet_router)
+
+    def override_db():
+        yield db
+
+    app.dependency_overrides[get_db] = override_db
+    app.dependency_overrides[get_current_user] = lambda: user
+    return TestClient(app)
@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from models import Ingredient, IngredientUnit, MealTemplate, MealTemplateIngredient
+
+
+@pytest.fixture
+def item(db, ingredients) -> MealTemplateIngredient:
+    ingredients["rice"].units.append(IngredientUnit(unit_name="cup", gram_equivalent=195))
+    template = MealTemplate(name="Rice bowl", category="lunch")
+    item = MealTemplateIngredient(ingredient=ingredients["rice"], quantity=1, unit="cup")
+    template.template_ingredients.append(item)
+    db.add(template)
+    db.commit()
+    assert item.quantity_base == 195
+    return item
+
+
+def test_reassigned_ingredient_recomputes_base_quantity(db, ingredients, item):
+    item.ingredient = ingredients["chicken"]
+    db.commit()
+
+    # Chicken has no "cup" unit - the quantity is taken as is
+    assert item.quantity_base == 1
+    assert item.base_multiplier == pytest.approx(0.01)
+
+
+def test_changed_ingredient_id_uses_the_new_ingredient(db, ingredients, item):
+    assert item.ingredient is ingredients["rice"]
+    item.ingredient_id = ingredients["oil"].id
+    db.commit()
+
+    assert item.quantity_base == 1
+
+
+def test_failed_flush_drops_collected_unit_changes(db, ingredients, item):
+    ingredients["rice"].units[0].gram_equivalent = 200
+    db.add(Ingredient(name="No category", calories=1))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+    assert "base_quantity_changes" not in db.info
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from config import settings
+from models import Ingredient, IngredientUnit
+from services import catalog_snapshot
+from services.catalog_snapshot import get_catalog_snapshot, load_ingredient_matrix, write_snapshot
+from services.ingredient_matrix import NUTRIENT_INDEX, IngredientMatrix
+from services.ingredient_search import IngredientSearchIndex
+
+
+@pytest.fixture
+def snapshot_path(db, ingredients, tmp_path, monkeypatch):
+    ingredients["rice"].units.append(IngredientUnit(unit_name="cup", gram_equivalent=195))
+    db.commit()
+    path = tmp_path / "catalog.bin"
+    write_snapshot(db, path)
+    monkeypatch.setattr(settings, "catalog_snapshot_path", str(path))
+    return path
+
+
+def _private(db, user, category, name="Grandma's soup") -> Ingredient:
+    ingredient = Ingredient(name=name, category=category, user_id=user.id, calories=60, protein=3, fat=2, carbs=7)
+    db.add(ingredient)
+    db.commit()
+    return ingredient
+
+
+def _assert_same(matrix: IngredientMatrix, expected: IngredientMatrix) -> None:
+    np.testing.assert_array_equal(matrix.ids, expected.ids)
+    np.testing.assert_allclose(matrix.values, expected.values)
+    assert matrix.unit_factors == expected.unit_factors
+
+
+def test_matrix_uses_snapshot_for_global_ingredients(db, user, ingredients, snapshot_path):
+    matrix = load_ingredient_matrix(db)
+    # No private ingredients - the mapped arrays are used as they are
+    assert matrix.values.base is not None and not matrix.values.flags.writeable
+    _assert_same(matrix, IngredientMatrix.from_session(db))
+
+    private = _private(db, user, ingredients["rice"].category)
+    matrix = load_ingredient_matrix(db)
+    assert private.id in matrix.ids.tolist()
+    _assert_same(matrix, IngredientMatrix.from_session(db))
+
+
+def test_stale_snapshot_is_ignored(db, ingredients, snapshot_path):
+    added = Ingredient(name="Tofu", category=ingredients["rice"].category, calories=76, protein=8, fat=4.8, carbs=1.9)
+    db.add(added)
+    db.commit()
+
+    assert added.id in load_ingredient_matrix(db).ids.tolist()
+    assert [hit.id for hit in IngredientSearchIndex.from_session(db).search("tofu", None)] == [added.id]
+
+
+def test_replaced_snapshot_file_is_reopened(db, ingredients, snapshot_path):
+    before = get_catalog_snapshot()
+    db.add(Ingredient(name="Tofu", category=ingredients["rice"].category, calories=76, protein=8, fat=4.8, carbs=1.9))
+    db.commit()
+    write_snapshot(db, snapshot_path)
+
+    after = get_catalog_snapshot()
+    assert after is not before
+    assert len(after) == len(before) + 1
+
+
+def test_search_index_reads_global_names_from_snapshot(db, user, ingredients, snapshot_path):
+    private = _private(db, user, ingredients["rice"].category, "Chicken soup")
+
+    index = IngredientSearchIndex.from_session(db)
+
+    assert {hit.id for hit in index.search("chicken", user.id)} == {ingredients["chicken"].id, private.id}
+    assert [hit.id for hit in index.search("chicken", None)] == [ingredients["chicken"].id]
+
+
+def test_committed_edits_rewrite_snapshot(db, ingredients, snapshot_path):
+    before = get_catalog_snapshot()
+    ingredients["rice"].calories = 999
+    ingredients["chicken"].name = "Turkey"
+    db.commit()
+
+    after = get_catalog_snapshot()
+    assert after is not before
+    matrix = load_ingredient_matrix(db)
+    rice = matrix.positions([ingredients["rice"].id])[0]
+    assert matrix.values[rice, NUTRIENT_INDEX["calories"]] == pytest.approx(9.99)
+    hits = IngredientSearchIndex.from_session(db).search("turkey", None)
+    assert [hit.id for hit in hits] == [ingredients["chicken"].id]
+
+
+def test_private_edits_keep_snapshot(db, user, ingredients, snapshot_path):
+    private = _private(db, user, ingredients["rice"].category)
+    before = get_catalog_snapshot()
+    private.calories = 80
+    db.commit()
+
+    assert get_catalog_snapshot() is before
+
+
+def test_snapshot_is_dropped_when_refresh_fails(db, ingredients, snapshot_path, monkeypatch):
+    assert get_catalog_snapshot() is not None
+
+    def fail(session, path):
+        raise OSError("read-only file system")
+
+    monkeypatch.setattr(catalog_snapshot, "write_snapshot", fail)
+    monkeypatch.setattr(catalog_snapshot, "_stale_file_id", None)
+    ingredients["rice"].calories = 999
+    db.commit()
+
+    assert get_catalog_snapshot() is None
+    matrix = load_ingredient_matrix(db)
+    rice = matrix.positions([ingredients["rice"].id])[0]
+    assert matrix.values[rice, NUTRIENT_INDEX["calories"]] == pytest.approx(9.99)
@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+
+from models import DailyPlan, DietGoal, DietPlan, Meal
+from services.nutrition_recompute import recompute_daily_plans, verify_nutrition
+
+
+@pytest.fixture
+def day(db, user) -> DailyPlan:
+    plan = DietPlan(
+        user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=date(2026, 3, 1),
+        date_to=date(2026, 3, 1), meals_per_day=3, target_calories=2000,
+    )
+    day = DailyPlan(date=date(2026, 3, 1), target_calories=2000, target_protein=100, target_carbs=200, target_fats=60)
+    plan.daily_plans.append(day)
+    db.add(plan)
+    db.commit()
+    return day
+
+
+@pytest.mark.parametrize("calories, expected", [(100.4, 1004), (100.07, 1001), (99.96, 1000)])
+def test_incremental_and_recomputed_calories_agree(db, day, calories, expected):
+    for order in range(10):
+        day.add_meal(Meal(name=f"meal {order}", meal_order=order, calories=calories, macros_only=True))
+    db.commit()
+    incremental = day.actual_calories
+
+    recompute_daily_plans(db, [day.id])
+    db.commit()
+    db.refresh(day)
+
+    assert incremental == day.actual_calories == expected
+    assert day.actual_calories_exact == pytest.approx(10 * calories)
+    assert not verify_nutrition(db).has_drift
+
+
+def test_removing_meals_returns_to_zero(db, day):
+    meals = [Meal(name=f"meal {order}", meal_order=order, calories=33.3) for order in range(3)]
+    for meal in meals:
+        day.add_meal(meal)
+    for meal in meals:
+        day.remove_meal(meal)
+
+    assert day.actual_calories == 0
+    assert day.actual_calories_exact == pytest.approx(0.0)
@@ -0,0 +1,79 @@
+import pytest
+
+from services.diet_planner import DietManager, PlanState
+
+
+class PlanUser:
+    """Minimal user object DietManager works on."""
+
+    def __init__(self) -> None:
+        self.id = 1
+        self.diet_plan = None
+        self.finished_diet_plans = None
+
+
+class Listener:
+    def __init__(self) -> None:
+        self.days = []
+
+    def plan_created(self, plan) -> None:
+        pass
+
+    def day_added(self, day, values) -> None:
+        self.days.append(day.date)
+
+
+MACROS = {"protein": 100, "carbohydrates": 200, "total fat": 50}
+
+
+def test_repeated_date_is_rejected():
+    listener = Listener()
+    manager = DietManager(PlanUser(), listener)
+    manager.create_diet("lose", "2026-03-01", 3, 3)
+    manager.add_day_plan("2026-03-01", 1800, MACROS)
+
+    with pytest.raises(ValueError):
+        manager.add_day_plan("2026-03-01", 2500, MACROS)
+    manager.add_day_plan("2026-03-02", 2000, MACROS)
+
+    assert listener.days == ["2026-03-01", "2026-03-02"]
+    plan = manager.to_dict()["plans_per_day"]
+    assert [(day["date"], day["calories"]) for day in plan] == [("2026-03-01", 1800), ("2026-03-02", 2000)]
+
+
+def test_stored_plan_with_repeated_date_keeps_the_first():
+    stored = {
+        "goal": "lose", "date_from": "2026-03-01", "date_to": "2026-03-03", "duration_in_days": 2, "meals_per_day": 3,
+        "plans_per_day": [
+            {"date": "2026-03-01", "calories": 1800, "macros": MACROS, "meals": []},
+            {"date": "2026-03-01", "calories": 2500, "macros": MACROS, "meals": []},
+            {"date": "2026-03-02", "calories": 2000, "macros": MACROS, "meals": []},
+        ],
+    }
+
+    state = PlanState.from_dict(stored)
+
+    assert {date: state.totals[day.row][0] for date, day in state.days.items()} == {
+        "2026-03-01": 1800, "2026-03-02": 2000,
+    }
+
+
+def test_meal_changes_keep_day_totals_and_dict_shape():
+    user = PlanUser()
+    manager = DietManager(user)
+    manager.create_diet("lose", "2026-03-01", 3, 3)
+    manager.add_day_plan("2026-03-01")
+    for name, calories, protein in (("Owsianka", 400, 15), ("Obiad", 700, 45), ("Owsianka", 300, 10)):
+        manager.add_meal("2026-03-01", {"name": name, "calories": calories, "macros": {"protein": protein}})
+    manager.update_meal("2026-03-01", "Obiad", {"name": "Kolacja", "calories": 650})
+    manager.remove_meal("2026-03-01", "Owsianka")
+
+    assert manager.verify_totals() == []
+    day = manager.to_dict()["plans_per_day"][0]
+    assert (day["calories"], day["macros"]["protein"]) == (650, 45)
+    assert [meal["name"] for meal in day["meals"]] == ["Kolacja"]
+
+    # Zapis w kształcie słownika wczytuje się z powrotem bez zmian
+    stored = manager.to_dict()
+    user.diet_plan = stored
+    assert DietManager(user).to_dict() == stored
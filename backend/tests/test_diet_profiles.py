@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+from typing import Any, Callable
+
+import pytest
+from sqlalchemy.orm import Session
+
+from cruds.diet import get_daily_plan, get_diet_plan
+from database import count_queries
+from models import DailyPlan, DietGoal, DietPlan, Meal, MealIngredient, User
+
+
+# Oczekiwana liczba zapytań na profil (niezależna od liczby dni / posiłków)
+PROFILE_QUERY_COUNTS = {
+    "summary": 2,
+    "full_plan": 4,
+    "full_day": 3,
+}
+
+
+def _walk(obj: Any, profile: str) -> None:
+    """Dotknij wszystkich relacji objętych profilem (wykryje dodatkowe lazy loady)."""
+    if profile == "summary":
+        for day in obj.daily_plans:
+            day.date
+        return
+
+    days = obj.daily_plans if profile == "full_plan" else [obj]
+    for day in days:
+        for meal in day.meals:
+            for item in meal.meal_ingredients:
+                item.ingredient.name
+                item.total_calories
+
+
+def profile_query_count(db: Session, profile: str, load: Callable[[], Any]) -> tuple[Any, list[str]]:
+    """Załaduj obiekt przez profil, przejdź cały graf; zwraca obiekt i wykonane zapytania."""
+    db.expunge_all()  # pusta mapa tożsamości - liczymy prawdziwe zapytania
+
+    with count_queries(db.get_bind()) as counter:
+        obj = load()
+        if obj is not None:
+            _walk(obj, profile)
+    return obj, counter.statements
+
+
+@pytest.fixture
+def plan(db, user, ingredients) -> DietPlan:
+    """Plan na 3 dni, 2 posiłki dziennie po 2 składniki."""
+    plan = DietPlan(
+        user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=date(2026, 3, 1),
+        date_to=date(2026, 3, 3), meals_per_day=2, target_calories=2000,
+    )
+    for offset in range(3):
+        day = DailyPlan(
+            date=plan.date_from + timedelta(days=offset), target_calories=2000, target_protein=100,
+            target_carbs=200, target_fats=60,
+        )
+        for order, names in enumerate((("chicken", "rice"), ("rice", "oil"))):
+            meal = Meal(name=f"Meal {order}", meal_order=order)
+            for name in names:
+                meal.meal_ingredients.append(MealIngredient(ingredient_id=ingredients[name].id, quantity=100))
+            day.meals.append(meal)
+        plan.daily_plans.append(day)
+    db.add(plan)
+    db.commit()
+    return plan
+
+
+@pytest.mark.parametrize("profile", ["summary", "full_plan"])
+def test_diet_plan_profile_query_count(db, plan, profile):
+    plan_id = plan.id
+    loaded, statements = profile_query_count(db, profile, lambda: get_diet_plan(db, plan_id, profile))
+
+    assert len(loaded.daily_plans) == 3
+    assert len(statements) == PROFILE_QUERY_COUNTS[profile], "\n".join(statements)
+
+
+def test_daily_plan_profile_query_count(db, plan):
+    plan_id = plan.id
+    loaded, statements = profile_query_count(db, "full_day", lambda: get_daily_plan(db, plan_id, date(2026, 3, 2)))
+
+    assert len(loaded.meals) == 2
+    assert len(statements) == PROFILE_QUERY_COUNTS["full_day"], "\n".join(statements)
+
+
+def test_day_of_another_users_plan_is_not_found(db, client, plan):
+    assert client.get(f"/diet-plans/{plan.id}/days/2026-03-02").status_code == 200
+
+    other = User(
+        username="bob", email="bob@example.com", hashed_password="x", date_of_birth=date(1990, 1, 1),
+        gender="male", height=180,
+    )
+    db.add(other)
+    db.commit()
+    plan.user_id = other.id
+    db.commit()
+
+    assert client.get(f"/diet-plans/{plan.id}/days/2026-03-02").status_code == 404
+    assert client.get("/diet-plans/999/days/2026-03-02").status_code == 404
@@ -0,0 +1,63 @@
+import threading
+
+import numpy as np
+import pytest
+
+from services.dish_index import DishIndex, get_dish_index, invalidate_dish_index
+
+
+def _vector(template_id: int) -> tuple[float, float, float, float]:
+    # Protein carries the id, so a row torn between two templates shows up
+    return float(template_id), 10.0, 5.0, 4.0 * template_id + 85.0
+
+
+def test_reads_are_consistent_during_updates():
+    index = DishIndex()
+    for template_id in range(1, 201):
+        index.upsert(template_id, "lunch", None, _vector(template_id))
+
+    stop = threading.Event()
+
+    def churn() -> None:
+        rng = np.random.default_rng(0)
+        while not stop.is_set():
+            template_id = int(rng.integers(1, 201))
+            index.remove(template_id)
+            index.upsert(template_id, "lunch", None, _vector(template_id))
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    try:
+        for _ in range(300):
+            _, templates = index.visible(None)
+            ids, features = templates["lunch"]
+            np.testing.assert_array_equal(features[:, 0], ids)
+
+            found, _ = index.nearest_many("lunch", [_vector(100)], k=5)
+            assert len(set(found[0].tolist())) == len(found[0])
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_frozen_index_rejects_updates():
+    index = DishIndex()
+    index.upsert(1, "lunch", None, _vector(1))
+    index.freeze()
+
+    with pytest.raises(RuntimeError):
+        index.upsert(2, "lunch", None, _vector(2))
+    with pytest.raises(RuntimeError):
+        index.remove(1)
+    assert [match.template_id for match in index.nearest("lunch", _vector(1))] == [1]
+
+
+def test_index_invalidated_during_refresh_is_still_returned(monkeypatch):
+    class InvalidatedOnRefresh(DishIndex):
+        def refresh(self, session) -> None:
+            invalidate_dish_index()
+
+    monkeypatch.setattr(DishIndex, "from_session", classmethod(lambda cls, session: InvalidatedOnRefresh()))
+    invalidate_dish_index()
+
+    assert isinstance(get_dish_index(None), InvalidatedOnRefresh)
@@ -0,0 +1,149 @@
+from datetime import date
+
+from database import SessionLocal
+from models import (
+    DailyPlan, DietGoal, DietPlan, Ingredient, IngredientCategory, Meal, MealIngredient, MealTemplate, MealTemplateIngredient,
+)
+from services.import_data import import_ciqual, sync_ciqual
+
+
+HEADER = (
+    "alim_code;alim_nom_eng;alim_ssgrp_nom_eng;Energy, N x Jones' factor, with fibres (kcal/100g);"
+    "Protein (g/100g);Fat (g/100g);Carbohydrate (g/100g);Fibres (g/100g);Sugars (g/100g);"
+    "Sodium (mg/100g);Cholesterol (mg/100g)\n"
+)
+
+
+def _rows(*rows: str) -> str:
+    return HEADER + "".join(row + "\n" for row in rows)
+
+
+def test_chunked_import_resolves_categories_and_updates_in_place(db, tmp_path):
+    csv = tmp_path / "ciqual.csv"
+    csv.write_text(_rows(
+        "1001;Apple;fruit;52;0,3;0,2;14;2,4;10;1;0",
+        "1002;Pear;fruit;57;0,4;traces;15;-;10;< 0,5;0",
+        "1003;Rice;;130;2,7;0,3;28;0,4;0;1;0",
+        "abc;Broken row;fruit;1;1;1;1;1;1;1;1",
+        "1004;Oat;cereal;389;16,9;6,9;66;10,6;1;2;0",
+    ), encoding="utf-8")
+
+    # Porcje po 2 wiersze - kilka partii, kategorie rozwiązane raz
+    assert import_ciqual(db, str(csv), chunk_size=2, use_copy=False) == 4
+    db.commit()
+
+    categories = {category.name for category in db.query(IngredientCategory)}
+    assert categories == {"fruit", "cereal", "Other"}
+    pear = db.get(Ingredient, 1002)
+    assert (pear.category.name, pear.protein, pear.fat, pear.fiber, pear.sodium) == ("fruit", 0.4, 0.0, 0.0, 0.5)
+    assert db.get(Ingredient, 1003).category.name == "Other"
+
+    # Ponowny import aktualizuje istniejące wiersze zamiast dodawać nowe
+    csv.write_text(_rows("1002;Pear;fruit;60;0,4;0;15;3;10;1;0"), encoding="utf-8")
+    assert import_ciqual(db, str(csv), chunk_size=2, use_copy=False) == 1
+    db.commit()
+    db.expire_all()
+    assert db.get(Ingredient, 1002).calories == 60
+    assert db.query(Ingredient).count() == 4
+    assert db.query(IngredientCategory).count() == 3
+
+
+def test_full_import_recomputes_dependents(db, user, ingredients, tmp_path):
+    chicken = ingredients["chicken"]
+    template = MealTemplate(name="Chicken", category="lunch")
+    template.template_ingredients.append(MealTemplateIngredient(ingredient_id=chicken.id, quantity=100))
+    plan = DietPlan(
+        user_id=user.id, name="p", goal=DietGoal.MAINTENANCE, date_from=date(2026, 1, 1),
+        date_to=date(2026, 1, 1), meals_per_day=1, target_calories=2000,
+    )
+    day = DailyPlan(date=date(2026, 1, 1), target_calories=2000, target_protein=100, target_carbs=200, target_fats=60)
+    meal = Meal(name="Chicken", meal_order=0, calories=330.0, protein=62.0, fats=7.2)
+    meal.meal_ingredients.append(MealIngredient(ingredient_id=chicken.id, quantity=200))
+    day.meals.append(meal)
+    day.actual_calories, day.actual_protein = 330, 62.0
+    plan.daily_plans.append(day)
+    template.calories = 165.0
+    db.add_all([template, plan])
+    db.commit()
+
+    csv = tmp_path / "ciqual.csv"
+    csv.write_text(HEADER + f"{chicken.id};Chicken breast;meat;120;25;2;0;0;0;70;80\n", encoding="utf-8")
+    import_ciqual(db, str(csv), use_copy=False)
+
+    db.expire_all()
+    assert db.get(MealTemplate, template.id).calories == 120
+    assert db.get(Meal, meal.id).calories == 240
+    assert db.get(DailyPlan, day.id).actual_calories == 240
+
+    # Same file again - nothing changed, nothing recomputed
+    db.get(MealTemplate, template.id).calories = 1.0
+    db.commit()
+    import_ciqual(db, str(csv), use_copy=False)
+    db.expire_all()
+    assert db.get(MealTemplate, template.id).calories == 1.0
+
+
+def test_sync_writes_only_changed_rows(db, tmp_path):
+    csv = tmp_path / "ciqual.csv"
+    csv.write_text(_rows(
+        "1001;Apple;fruit;52;0,3;0,2;14;2,4;10;1;0",
+        "1002;Pear;fruit;57;0,4;0,1;15;3,1;10;1;0",
+        "1003;Plum;fruit;46;0,7;0,3;11;1,4;10;0;0",
+    ), encoding="utf-8")
+    first = sync_ciqual(db, str(csv))
+    assert first.inserted == [1001, 1002, 1003]
+    assert first.updated == first.deleted == [] and first.unchanged == 0
+
+    # Ten sam plik - hashe się zgadzają, nic nie jest zapisywane
+    again = sync_ciqual(db, str(csv))
+    assert again.inserted == again.updated == again.deleted == []
+    assert again.unchanged == 3
+
+    csv.write_text(_rows(
+        "1001;Apple;fruit;52;0,3;0,2;14;2,4;10;1;0",
+        "1002;Pear;fruit;60;0,4;0,1;15;3,1;10;1;0",
+    ), encoding="utf-8")
+    changed = sync_ciqual(db, str(csv))
+    assert changed.to_dict() == {
+        "inserted": [],
+        "updated": [1002],
+        "deleted": [1003],
+        "retained": [],
+        "unchanged": 1,
+        "recomputed_templates": 0,
+        "recomputed_meals": 0,
+        "stale_ingredient_ids": [1002, 1003],
+    }
+    db.expire_all()
+    assert db.get(Ingredient, 1002).calories == 60
+    assert db.get(Ingredient, 1003) is None
+
+
+def test_sync_keeps_referenced_rows_and_recomputes_dependents(db, user, tmp_path):
+    csv = tmp_path / "ciqual.csv"
+    csv.write_text(_rows(
+        "1001;Apple;fruit;52;0,3;0,2;14;2,4;10;1;0",
+        "1002;Pear;fruit;57;0,4;0,1;15;3,1;10;1;0",
+    ), encoding="utf-8")
+    sync_ciqual(db, str(csv))
+
+    template = MealTemplate(name="Fruit", category="snack")
+    template.template_ingredients.append(MealTemplateIngredient(ingredient_id=1001, quantity=200))
+    template.template_ingredients.append(MealTemplateIngredient(ingredient_id=1002, quantity=100))
+    db.add(template)
+    db.commit()
+    template.calculate_nutrition()
+    db.commit()
+    assert template.calories == 161
+
+    # Gruszka znika ze źródła, ale szablon jej używa - zostaje
+    csv.write_text(_rows("1001;Apple;fruit;50;0,3;0,2;14;2,4;10;1;0"), encoding="utf-8")
+    manifest = sync_ciqual(db, str(csv))
+
+    assert manifest.updated == [1001]
+    assert manifest.deleted == [] and manifest.retained == [1002]
+    assert manifest.stale_ingredient_ids == [1001]
+    assert manifest.recomputed_templates == 1
+    # Przeliczone przed jedynym commitem - nowa sesja widzi nowe sumy
+    with SessionLocal() as other:
+        assert other.get(MealTemplate, template.id).calories == 157
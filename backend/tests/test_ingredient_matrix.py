@@ -0,0 +1,75 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from models import (
+    DailyPlan, DietGoal, DietPlan, IngredientUnit, Meal, MealIngredient, MealTemplate, MealTemplateIngredient,
+)
+from services.ingredient_matrix import NUTRIENT_INDEX, IngredientMatrix
+
+
+@pytest.fixture
+def day(db, user, ingredients) -> DailyPlan:
+    """Dzień z dwoma posiłkami, ryż podany w szklankach (przeliczenie jednostek)."""
+    ingredients["rice"].units.append(IngredientUnit(unit_name="cup", gram_equivalent=195))
+    day = DailyPlan(date=date(2026, 3, 1), target_calories=2000, target_protein=100, target_carbs=200,
+                    target_fats=60)
+    for order, items in enumerate(((("chicken", 150, "g"), ("rice", 1, "cup")), (("oil", 10, "g"), ("rice", 80, "g")))):
+        meal = Meal(name=f"Meal {order}", meal_order=order)
+        for name, quantity, unit in items:
+            meal.meal_ingredients.append(MealIngredient(ingredient=ingredients[name], quantity=quantity, unit=unit))
+        day.meals.append(meal)
+    plan = DietPlan(user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=day.date, date_to=day.date,
+                    meals_per_day=2, target_calories=2000)
+    plan.daily_plans.append(day)
+    db.add(plan)
+    db.commit()
+    return day
+
+
+def test_meal_totals_match_orm(db, day):
+    matrix = IngredientMatrix.from_session(db)
+    for meal in day.meals:
+        expected = {
+            "calories": sum(mi.total_calories for mi in meal.meal_ingredients),
+            "protein": sum(mi.total_protein for mi in meal.meal_ingredients),
+            "carbs": sum(mi.total_carbs for mi in meal.meal_ingredients),
+            "fats": sum(mi.total_fat for mi in meal.meal_ingredients),
+            "fiber": sum(mi.total_fiber for mi in meal.meal_ingredients),
+        }
+        meal.calculate_nutrition(matrix)
+        assert {column: getattr(meal, column) for column in expected} == pytest.approx(expected)
+
+
+def test_daily_plan_totals_fill_micronutrients(db, ingredients, day):
+    day.calculate_totals(IngredientMatrix.from_session(db))
+
+    # 150 g kurczaka, 195 g + 80 g ryżu
+    assert day.actual_calories_exact == pytest.approx(1.5 * 165 + 2.75 * 111 + 0.1 * 884)
+    assert day.actual_fiber == pytest.approx(2.75 * 1.8)
+    assert day.actual_sodium == pytest.approx(1.5 * 74 + 2.75 * 5)
+    assert day.actual_cholesterol == pytest.approx(1.5 * 85)
+
+
+def test_template_totals_match_orm(db, ingredients):
+    template = MealTemplate(name="Bowl", category="lunch")
+    template.template_ingredients.append(MealTemplateIngredient(ingredient=ingredients["rice"], quantity=120))
+    template.template_ingredients.append(MealTemplateIngredient(ingredient=ingredients["oil"], quantity=5))
+    db.add(template)
+    db.commit()
+
+    expected = sum(item.total_calories for item in template.template_ingredients)
+    template.calculate_nutrition(IngredientMatrix.from_session(db))
+    assert template.calories == pytest.approx(expected)
+
+
+def test_group_totals_of_unsaved_rows(ingredients, db):
+    matrix = IngredientMatrix.from_session(db)
+    ids = [ingredients["chicken"].id, ingredients["rice"].id, ingredients["oil"].id]
+
+    totals = matrix.group_totals([0, 0, 1], ids, [100, 200, 10], n_groups=3)
+
+    np.testing.assert_allclose(totals[:, NUTRIENT_INDEX["calories"]], [165 + 222, 88.4, 0])
+    with pytest.raises(KeyError):
+        matrix.positions([max(ids) + 1])
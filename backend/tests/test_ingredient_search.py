@@ -0,0 +1,86 @@
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from models import Ingredient
+from services.ingredient_search import PgTrgmSearchBackend, escape_like, get_search_index, invalidate_search_index
+from services.import_data import import_ciqual
+
+
+def _names(db, query: str, user_id: int | None = None) -> list[str]:
+    return [hit.name for hit in get_search_index(db).search(query, user_id)]
+
+
+def test_index_follows_committed_ingredient_changes(db, user, ingredients):
+    invalidate_search_index()
+    assert _names(db, "chick") == ["Chicken breast"]
+
+    db.add(Ingredient(name="Chickpeas", category=ingredients["rice"].category, user_id=user.id))
+    ingredients["chicken"].name = "Turkey breast"
+    db.delete(ingredients["oil"])
+    db.commit()
+
+    assert _names(db, "chick") == []
+    assert _names(db, "chick", user.id) == ["Chickpeas"]
+    assert _names(db, "turk") == ["Turkey breast"]
+    assert _names(db, "olive") == []
+
+
+def test_rolled_back_changes_are_not_applied(db, ingredients):
+    invalidate_search_index()
+    get_search_index(db)
+
+    ingredients["rice"].name = "Wild rice"
+    db.flush()
+    db.rollback()
+
+    assert _names(db, "brown") == ["Brown rice"]
+    assert _names(db, "wild") == []
+
+
+def test_ciqual_import_rebuilds_index(db, tmp_path):
+    invalidate_search_index()
+    assert _names(db, "lentil") == []
+
+    csv = tmp_path / "ciqual.csv"
+    csv.write_text(
+        "alim_code;alim_nom_eng;alim_ssgrp_nom_eng;Energy, N x Jones' factor, with fibres (kcal/100g);"
+        "Protein (g/100g);Fat (g/100g);Carbohydrate (g/100g);Fibres (g/100g);Sugars (g/100g);"
+        "Sodium (mg/100g);Cholesterol (mg/100g)\n"
+        "20500;Lentils, boiled;legumes;116;9;0,4;20;7,9;1,8;2;0\n",
+        encoding="utf-8",
+    )
+    import_ciqual(db, str(csv), use_copy=False)
+
+    assert _names(db, "lentil") == ["Lentils, boiled"]
+
+
+def test_like_wildcards_in_query_match_literally(db, ingredients):
+    category = ingredients["rice"].category
+    db.add_all([
+        Ingredient(name="Milk 2% fat", category=category),
+        Ingredient(name="Milk 25 fat", category=category),
+        Ingredient(name="snake_case", category=category),
+        Ingredient(name="snakecase", category=category),
+    ])
+    db.commit()
+
+    def like(query: str) -> list[str]:
+        stmt = select(Ingredient.name).where(Ingredient.name.ilike(f"%{escape_like(query)}%", escape="\\"))
+        return sorted(db.execute(stmt).scalars())
+
+    assert like("2%") == ["Milk 2% fat"]
+    assert like("e_c") == ["snake_case"]
+    assert like("\\") == []
+
+
+def test_pg_trgm_backend_escapes_patterns():
+    class CapturingSession:
+        def execute(self, stmt):
+            self.stmt = stmt
+            return []
+
+    session = CapturingSession()
+    PgTrgmSearchBackend(session).search("50%_off", None)
+
+    params = session.stmt.compile(dialect=postgresql.dialect()).params.values()
+    assert {"50\\%\\_off%", "%50\\%\\_off%"} <= set(params)
@@ -0,0 +1,93 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from services.macro_calculator import (
+    ACTIVITY_LEVELS, DIET_TYPES, GOALS, Macronutrients, calculate_cohort, encode_activity, encode_sex,
+)
+
+
+# Skalarne wzory sprzed wektoryzacji (Macronutrients liczone wartość po wartości)
+BASELINE_MULTIPLIERS = {"sedentary": 1.2, "light": 1.375, "moderate": 1.55, "very": 1.725, "super": 1.9}
+BASELINE_GOALS = {"maintain": (0, 2.2, 0.25), "lose": (-500, 2.5, 0.30), "gain": (500, 2.0, 0.20)}
+BASELINE_DIETS = {
+    "keto": (0.20, 0.70, 0.10),
+    "paleo": (0.35, 0.35, 0.30),
+    "vegan": (0.20, 0.30, 0.50),
+    "vegetarian": (0.25, 0.30, 0.45),
+}
+
+# (płeć, waga, wzrost, wiek) - w tym wagi z połówką kg
+PEOPLE = [("male", 80, 180, 30), ("female", 62, 165, 41), ("F", 72.5, 170, 25), ("m", 95.5, 191, 58)]
+
+
+def _baseline_bmr(sex, weight, height, age, activity_level):
+    bmr = 10 * weight + 6.25 * height - 5 * age + (5 if sex.lower() in ("male", "m") else -161)
+    if activity_level:
+        return round(bmr * BASELINE_MULTIPLIERS[activity_level.lower()], 2)
+    return round(bmr, 2)
+
+
+def _baseline_macros(person, activity_level, goal):
+    weight = person[1]
+    surplus, protein_per_kg, fat_share = BASELINE_GOALS[goal]
+    calories = _baseline_bmr(*person, activity_level) + surplus
+    protein = weight * protein_per_kg
+    fat = (fat_share * calories) / 9
+    carbs = (calories - (protein * 4 + fat * 9)) / 4
+    return {
+        "calories": round(calories, 2),
+        "protein_g": round(protein, 2),
+        "fat_g": round(fat, 2),
+        "carbs_g": round(carbs, 2),
+    }
+
+
+def _baseline_diet(diet_type, macros):
+    protein_share, fat_share, carbs_share = BASELINE_DIETS[diet_type]
+    total_calories = macros["calories"]
+    return {
+        "calories": round(total_calories, 2),
+        "protein_g": round((protein_share * total_calories) / 4, 2),
+        "fat_g": round((fat_share * total_calories) / 9, 2),
+        "carbs_g": round((carbs_share * total_calories) / 4, 2),
+    }
+
+
+@pytest.mark.parametrize("activity_level", [None, *ACTIVITY_LEVELS])
+@pytest.mark.parametrize("goal", GOALS)
+def test_single_user_matches_baseline(activity_level, goal):
+    for person in PEOPLE:
+        calculator = Macronutrients(*person, activity_level=activity_level)
+        expected = _baseline_macros(person, activity_level, goal)
+
+        assert calculator.calculate_bmr() == _baseline_bmr(*person, activity_level)
+        macros = calculator.calculate_macros(goal)
+        assert macros == expected
+        for diet_type in DIET_TYPES:
+            assert calculator.adjust_macros_for_diet(diet_type, macros) == _baseline_diet(diet_type, expected)
+
+
+def test_cohort_matches_baseline_for_every_combination():
+    rows = list(itertools.product(PEOPLE, [None, *ACTIVITY_LEVELS], GOALS, [None, *DIET_TYPES]))
+    people, activity, goal, diet = zip(*rows)
+    sex, weight, height, age = zip(*people)
+
+    cohort = calculate_cohort(sex, weight, height, age, list(activity), goal=list(goal), diet_type=list(diet))
+
+    for i, (person, activity_level, goal_name, diet_type) in enumerate(rows):
+        expected = _baseline_macros(person, activity_level, goal_name)
+        if diet_type is not None:
+            expected = _baseline_diet(diet_type, expected)
+        assert cohort.macros(i) == expected, rows[i]
+
+
+def test_encoding_is_case_insensitive_and_rejects_unknown_values():
+    np.testing.assert_array_equal(encode_sex(["Male", "f", "M", "FEMALE"]), [0, 1, 0, 1])
+    np.testing.assert_array_equal(encode_activity([None, "Super", "light"]), [len(ACTIVITY_LEVELS), 4, 1])
+
+    with pytest.raises(ValueError):
+        encode_sex(["male", None])
+    with pytest.raises(ValueError):
+        encode_activity(["moderate", "extreme"])
@@ -0,0 +1,77 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import PhysicalData, UserMacroProfile
+from services.diet_planner import DietManager
+from services.macro_profiles import MacroProfileCache, compute_profiles, macro_profile_cache, next_birthday
+from services.plan_unit_of_work import PlanUnitOfWork
+
+
+class PlanUser:
+    """Minimal user object DietManager works on."""
+
+    def __init__(self, id: int) -> None:
+        self.id = id
+        self.diet_plan = None
+        self.finished_diet_plans = None
+
+
+@pytest.fixture
+def measured(db, user):
+    db.add(PhysicalData(user_id=user.id, weight=60, activity_level="moderate"))
+    db.commit()
+    macro_profile_cache.clear()
+    return user
+
+
+def test_next_birthday():
+    assert next_birthday(date(1990, 1, 1), date(2026, 6, 1)) == date(2027, 1, 1)
+    assert next_birthday(date(1990, 6, 2), date(2026, 6, 1)) == date(2026, 6, 2)
+    assert next_birthday(date(1990, 6, 1), date(2026, 6, 1)) == date(2027, 6, 1)
+    assert next_birthday(date(2000, 2, 29), date(2026, 2, 28)) == date(2026, 3, 1)
+    assert next_birthday(date(2000, 2, 29), date(2027, 12, 31)) == date(2028, 2, 29)
+
+
+def test_profile_is_recomputed_on_birthday(db, measured):
+    cache = MacroProfileCache(10)
+    before = cache.get(measured.id, today=date(2026, 12, 31))
+    assert before.valid_until == date(2027, 1, 1)
+    assert cache.get(measured.id, today=date(2026, 12, 31)) is before
+
+    after = cache.get(measured.id, today=date(2027, 1, 1))
+    assert after.valid_until == date(2028, 1, 1)
+    # One year older - a lower BMR (Mifflin-St Jeor: -5 kcal per year)
+    assert after.bmr == pytest.approx(before.bmr - 5)
+    assert cache.stats.computed == 2
+    assert db.scalars(select(UserMacroProfile.valid_until)).one() == date(2028, 1, 1)
+
+
+def test_plan_written_by_unit_of_work_invalidates_profile(db, measured):
+    assert macro_profile_cache.get(measured.id).goal == "maintain"
+    assert db.scalar(select(UserMacroProfile.goal)) == "maintain"
+
+    manager = DietManager(PlanUser(measured.id))
+    with PlanUnitOfWork(manager):
+        manager.create_diet("lose", "2026-03-01", 2, 4)
+
+    assert db.scalar(select(UserMacroProfile.goal)) is None
+    profile = macro_profile_cache.get(measured.id)
+    assert (profile.goal, profile.meals_per_day) == ("lose", 4)
+
+
+def test_stale_persisted_profile_is_not_loaded(db, measured):
+    stale = compute_profiles(db, [measured.id])[measured.id]
+    # New measurement committed after the profile was computed, before it was stored
+    db.add(PhysicalData(user_id=measured.id, weight=70, activity_level="moderate"))
+    db.commit()
+    with SessionLocal() as session:
+        session.execute(UserMacroProfile.__table__.insert(), [stale.to_row()])
+        session.commit()
+
+    profile = MacroProfileCache(10).get(measured.id)
+
+    assert profile.physical_data_id != stale.physical_data_id
+    assert profile.tdee > stale.tdee
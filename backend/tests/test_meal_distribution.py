@@ -0,0 +1,91 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from models import DietGoal, DietPlan
+from services.meal_distribution import ATWATER, default_slots, distribute, ratio_matrix, rebalance, strategies
+from services.plan_solver import slot_shares
+
+
+DAILY = np.array([150.0, 250.0, 70.0, 150 * 4 + 250 * 4 + 70 * 9])
+
+
+@pytest.mark.parametrize("strategy", [name for name in strategies() if name != "custom"])
+@pytest.mark.parametrize("meals_per_day", [2, 4, 5])
+def test_meal_calories_follow_macros(strategy, meals_per_day):
+    per_meal = distribute(DAILY, strategy, meals_per_day)
+
+    np.testing.assert_allclose(per_meal[:, :3] @ ATWATER, per_meal[:, 3])
+    np.testing.assert_allclose(per_meal.sum(axis=0), DAILY)
+
+
+def test_solver_slot_shares_follow_macros():
+    shares = slot_shares([[1, 2, 1, 1], [1, 1, 2, 1], [1, 1, 1, 1]], 3, DAILY)
+
+    slot_targets = shares * DAILY
+    np.testing.assert_allclose(slot_targets[:, :3] @ ATWATER, slot_targets[:, 3])
+
+
+def test_ratio_matrix_is_cached_and_read_only():
+    matrix = ratio_matrix("protein_priority", 4)
+
+    assert ratio_matrix("protein_priority", 4) is matrix
+    np.testing.assert_allclose(matrix.sum(axis=0), 1.0)
+    with pytest.raises(ValueError):
+        matrix[0, 0] = 1.0
+    with pytest.raises(ValueError, match="Unknown distribution strategy"):
+        ratio_matrix("keto", 4)
+
+
+def test_rebalance_spreads_miss_over_later_meals():
+    ratios = ratio_matrix("equal", 3)
+    targets = distribute(DAILY, "equal", 3)
+
+    # Pierwszy posiłek przekroczył białko o 30 g i nie miał tłuszczu
+    actual = targets[0] + [30.0, 0.0, -targets[0, 2], 0.0]
+    rebalance(targets, ratios, 0, actual)
+
+    np.testing.assert_allclose(targets.sum(axis=0), DAILY)
+    np.testing.assert_allclose(targets[1:, 0], targets[1, 0])
+    assert targets[1, 0] == pytest.approx(50.0 - 15.0)
+
+
+def test_default_slots_outside_layouts():
+    assert default_slots(3) == ("breakfast", "lunch", "dinner")
+    with pytest.raises(ValueError):
+        default_slots(7)
+
+
+def test_generate_with_unsupported_meal_count_is_400(client, db, user):
+    plan = DietPlan(
+        user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=date(2026, 3, 1),
+        date_to=date(2026, 3, 7), meals_per_day=7, target_calories=2000,
+    )
+    db.add(plan)
+    db.commit()
+
+    response = client.post(
+        f"/diet-plans/{plan.id}/generate",
+        json={"target_protein": 120, "target_carbs": 200, "target_fats": 60},
+    )
+
+    assert response.status_code == 400
+    assert "7 meals per day" in response.json()["detail"]
+
+
+def test_generate_with_unknown_distribution_is_400(client, db, user):
+    plan = DietPlan(
+        user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=date(2026, 3, 1),
+        date_to=date(2026, 3, 7), meals_per_day=3, target_calories=2000,
+    )
+    db.add(plan)
+    db.commit()
+
+    response = client.post(
+        f"/diet-plans/{plan.id}/generate",
+        json={"target_protein": 120, "target_carbs": 200, "target_fats": 60, "distribution": "keto"},
+    )
+
+    assert response.status_code == 400
+    assert "Unknown distribution strategy" in response.json()["detail"]
@@ -0,0 +1,68 @@
+from datetime import date
+
+import pytest
+
+from models import DailyPlan, DietGoal, DietPlan, IngredientUnit, Meal, MealTemplate, MealTemplateIngredient
+from services.meal_templates import instantiate_templates
+
+
+@pytest.fixture
+def day(db, user) -> DailyPlan:
+    plan = DietPlan(
+        user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=date(2026, 3, 1),
+        date_to=date(2026, 3, 1), meals_per_day=3, target_calories=2000,
+    )
+    day = DailyPlan(date=date(2026, 3, 1), target_calories=2000, target_protein=100, target_carbs=200, target_fats=60)
+    plan.daily_plans.append(day)
+    db.add(plan)
+    db.commit()
+    return day
+
+
+@pytest.fixture
+def templates(db, ingredients) -> list[MealTemplate]:
+    """Szablon z ryżem w szklankach (przeliczenie jednostek) i szablon w gramach."""
+    ingredients["rice"].units.append(IngredientUnit(unit_name="cup", gram_equivalent=195))
+    bowl = MealTemplate(name="Chicken bowl", category="lunch")
+    for name, quantity, unit in (("chicken", 150, "g"), ("rice", 1, "cup"), ("oil", 10, "g")):
+        bowl.template_ingredients.append(
+            MealTemplateIngredient(ingredient=ingredients[name], quantity=quantity, unit=unit)
+        )
+    rice = MealTemplate(name="Rice", category="dinner")
+    rice.template_ingredients.append(MealTemplateIngredient(ingredient=ingredients["rice"], quantity=200))
+    db.add_all([bowl, rice])
+    db.commit()
+    for template in (bowl, rice):
+        template.calculate_nutrition()
+    db.commit()
+    return [bowl, rice]
+
+
+def test_instances_match_orm_totals(db, day, templates):
+    bowl, rice = templates
+    meal_ids = instantiate_templates(db, [(bowl.id, day.id, 0, 1.5), (rice.id, day.id, 1), (bowl.id, day.id, 2, 0.5)])
+    db.commit()
+    db.expire_all()
+
+    meals = [db.get(Meal, meal_id) for meal_id in meal_ids]
+    assert [meal.meal_order for meal in meals] == [0, 1, 2]
+    assert [meal.template_id for meal in meals] == [bowl.id, rice.id, bowl.id]
+    for meal, template, scale in zip(meals, [bowl, rice, bowl], [1.5, 1.0, 0.5]):
+        assert [item.quantity for item in meal.meal_ingredients] == pytest.approx(
+            [item.quantity * scale for item in template.template_ingredients]
+        )
+        cached = {"calories": meal.calories, "protein": meal.protein, "carbs": meal.carbs, "fats": meal.fats}
+        meal.calculate_nutrition()
+        assert cached == pytest.approx({"calories": meal.calories, "protein": meal.protein,
+                                        "carbs": meal.carbs, "fats": meal.fats})
+    # Szklanka ryżu przeliczona na gramy także w skopiowanych wierszach
+    assert meals[0].meal_ingredients[1].quantity_base == pytest.approx(1.5 * 195)
+
+    expected = sum(meal.calories for meal in meals)
+    assert day.actual_calories_exact == pytest.approx(expected)
+    assert day.actual_calories == round(expected)
+
+
+def test_unknown_template_is_rejected(db, day):
+    with pytest.raises(ValueError):
+        instantiate_templates(db, [(999, day.id, 0)])
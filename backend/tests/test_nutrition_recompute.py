@@ -0,0 +1,125 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import update
+
+from models import (
+    DailyPlan, DietGoal, DietPlan, IngredientUnit, Meal, MealIngredient, MealTemplate, MealTemplateIngredient,
+)
+from services.nutrition_recompute import find_drifted_meals, recompute_diet_plan, recompute_meals, recompute_templates
+
+
+NUTRITION = ("calories", "protein", "carbs", "fats", "fiber")
+
+
+def _orm_totals(items) -> dict[str, float]:
+    """Sumy liczone przez właściwości ORM (multiplier -> quantity_in_base_units)."""
+    items = list(items)
+    return {
+        "calories": sum(item.total_calories for item in items),
+        "protein": sum(item.total_protein for item in items),
+        "carbs": sum(item.total_carbs for item in items),
+        "fats": sum(item.total_fat for item in items),
+        "fiber": sum(item.total_fiber for item in items),
+    }
+
+
+def _cached(obj) -> dict[str, float]:
+    return {name: getattr(obj, name) for name in NUTRITION}
+
+
+@pytest.fixture
+def cup(db, ingredients) -> None:
+    ingredients["rice"].units.append(IngredientUnit(unit_name="cup", gram_equivalent=195))
+    db.commit()
+
+
+def test_recomputed_templates_match_orm(db, ingredients, cup):
+    template = MealTemplate(name="Bowl", category="lunch")
+    for name, quantity, unit in (("chicken", 150, "g"), ("rice", 1.5, "cup"), ("oil", 10, "g")):
+        template.template_ingredients.append(
+            MealTemplateIngredient(ingredient=ingredients[name], quantity=quantity, unit=unit)
+        )
+    db.add(template)
+    db.commit()
+    db.execute(update(MealTemplate).values({name: 0.0 for name in NUTRITION}))
+
+    recompute_templates(db, [template.id])
+    db.commit()
+
+    assert _cached(template) == pytest.approx(_orm_totals(template.template_ingredients))
+    # 1.5 szklanki = 292.5 g ryżu
+    assert template.carbs == pytest.approx(2.925 * 23)
+
+
+def test_recomputed_diet_plan_matches_orm(db, user, ingredients, cup):
+    plan = DietPlan(
+        user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=date(2026, 3, 1),
+        date_to=date(2026, 3, 2), meals_per_day=2, target_calories=2000,
+    )
+    for offset, rice in enumerate(((1, "cup"), (120, "g"))):
+        day = DailyPlan(date=date(2026, 3, 1 + offset), target_calories=2000, target_protein=100,
+                        target_carbs=200, target_fats=60)
+        lunch = Meal(name="Lunch", meal_order=0)
+        lunch.meal_ingredients.append(MealIngredient(ingredient=ingredients["chicken"], quantity=150))
+        lunch.meal_ingredients.append(MealIngredient(ingredient=ingredients["rice"], quantity=rice[0], unit=rice[1]))
+        dinner = Meal(name="Dinner", meal_order=1)
+        dinner.meal_ingredients.append(MealIngredient(ingredient=ingredients["oil"], quantity=5))
+        day.meals.extend([lunch, dinner])
+        plan.daily_plans.append(day)
+    db.add(plan)
+    db.commit()
+    db.execute(update(Meal).values({name: 0.0 for name in NUTRITION}))
+    db.execute(update(DailyPlan).values(actual_calories=0, actual_protein=0.0, actual_sodium=None))
+
+    recompute_diet_plan(db, plan.id)
+    db.commit()
+
+    for day in plan.daily_plans:
+        for meal in day.meals:
+            assert _cached(meal) == pytest.approx(_orm_totals(meal.meal_ingredients))
+        items = [item for meal in day.meals for item in meal.meal_ingredients]
+        expected = _orm_totals(items)
+        assert day.actual_calories_exact == pytest.approx(expected["calories"])
+        assert day.actual_calories == round(expected["calories"])
+        assert day.actual_protein == pytest.approx(expected["protein"])
+        assert day.actual_sodium == pytest.approx(sum(i.ingredient.sodium * i.multiplier for i in items))
+        assert day.actual_cholesterol == pytest.approx(sum(i.ingredient.cholesterol * i.multiplier for i in items))
+
+
+def test_rows_without_stored_base_quantity_fall_back_to_ratio(db, ingredients):
+    template = MealTemplate(name="Rice", category="lunch")
+    template.template_ingredients.append(MealTemplateIngredient(ingredient=ingredients["rice"], quantity=250))
+    db.add(template)
+    db.commit()
+    # Wiersz sprzed zapisu bazowych ilości
+    db.execute(update(MealTemplateIngredient).values(quantity_base=None, base_multiplier=None))
+
+    recompute_templates(db, [template.id])
+    db.commit()
+
+    assert template.calories == pytest.approx(2.5 * 111)
+
+
+def test_emptied_meal_is_zeroed_but_macros_only_meal_is_kept(db, user, ingredients):
+    plan = DietPlan(user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=date(2026, 3, 1),
+                    date_to=date(2026, 3, 1), meals_per_day=2, target_calories=2000)
+    day = DailyPlan(date=plan.date_from, target_calories=2000, target_protein=100, target_carbs=200,
+                    target_fats=60)
+    emptied = Meal(name="Lunch", meal_order=0, calories=300.0, protein=30.0)
+    macros_only = Meal(name="Dinner", meal_order=1, calories=500.0, protein=40.0, macros_only=True)
+    day.meals.extend([emptied, macros_only])
+    plan.daily_plans.append(day)
+    db.add(plan)
+    db.commit()
+
+    # Ostatni składnik usunięty, zapisane sumy zostały
+    assert find_drifted_meals(db) == [emptied.id]
+
+    recompute_meals(db, [emptied.id, macros_only.id])
+    db.commit()
+
+    assert _cached(emptied) == dict.fromkeys(NUTRITION, 0.0)
+    assert (macros_only.calories, macros_only.protein) == (500.0, 40.0)
+    assert day.actual_calories == 500
+    assert find_drifted_meals(db) == []
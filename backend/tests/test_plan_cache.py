@@ -0,0 +1,89 @@
+from dataclasses import replace
+
+from services.plan_cache import CHOICE_BYTES, SOLUTION_BYTES, PlanCache
+from services.plan_solver import DaySolution, SlotChoice
+
+
+def _solution(template_id: int = 1, truncated: bool = False) -> DaySolution:
+    return DaySolution(
+        choices=[SlotChoice("lunch", template_id, 1.0)],
+        totals={"protein": 30.0, "carbs": 60.0, "fats": 15.0, "calories": 495.0},
+        deviation=0.0,
+        method="branch_and_bound",
+        truncated=truncated,
+    )
+
+
+def test_truncated_results_are_not_stored():
+    cache = PlanCache(2**20)
+
+    cache.put("key", 1, [_solution(), _solution(truncated=True)])
+    assert cache.get("key", 1) is None
+
+    cache.put("key", 1, [_solution(), replace(_solution(), deviation=1.0)])
+    assert len(cache.get("key", 1)) == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    # Jeden wpis to SOLUTION_BYTES + CHOICE_BYTES - mieszczą się dwa
+    cache = PlanCache(2 * (SOLUTION_BYTES + CHOICE_BYTES))
+    cache.put("a", 1, [_solution(1)])
+    cache.put("b", 1, [_solution(2)])
+    assert cache.get("a", 1) is not None
+
+    cache.put("c", 1, [_solution(3)])
+
+    assert cache.get("b", 1) is None
+    assert [s.choices[0].template_id for key in ("a", "c") for s in cache.get(key, 1)] == [1, 3]
+    assert cache.stats.evictions == 1
+    assert cache.stats.bytes == 2 * (SOLUTION_BYTES + CHOICE_BYTES) and cache.stats.entries == 2
+
+
+def test_entry_larger_than_the_cache_is_not_stored():
+    cache = PlanCache(SOLUTION_BYTES)
+    cache.put("a", 1, [_solution()])
+    assert len(cache) == 0
+
+
+def test_version_change_drops_all_entries():
+    cache = PlanCache(2**20)
+    cache.put("a", 1, [_solution()])
+    cache.put("b", 1, [_solution()])
+
+    assert cache.get("a", 2) is None
+    assert len(cache) == 0
+    assert cache.stats.invalidations == 1
+    cache.put("a", 2, [_solution()])
+    assert cache.get("a", 2) is not None
+
+
+def test_hit_and_miss_counters():
+    cache = PlanCache(2**20)
+    calls = []
+
+    def solve():
+        calls.append(1)
+        return [_solution()]
+
+    for _ in range(3):
+        cache.get_or_solve("a", 1, solve)
+    cache.get_or_solve("b", 1, solve)
+
+    assert len(calls) == 2
+    assert (cache.stats.hits, cache.stats.misses) == (2, 2)
+    assert cache.stats.hit_rate == 0.5
+
+
+def test_callers_do_not_share_cached_solutions():
+    cache = PlanCache(2**20)
+    stored = [_solution()]
+    cache.put("a", 1, stored)
+    stored[0].choices[0].scale = 2.0
+
+    first = cache.get("a", 1)
+    first[0].choices[0].scale = 3.0
+    first[0].totals["calories"] = 0.0
+
+    again = cache.get("a", 1)
+    assert again[0].choices[0].scale == 1.0
+    assert again[0].totals["calories"] == 495.0
@@ -0,0 +1,225 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import DailyPlan, DietGoal, DietPlan, Meal, MealTemplate, MealTemplateIngredient
+from services.dish_index import DishIndex, invalidate_dish_index
+from services.plan_solver import SolverConfig
+from services.plan_generation import (
+    _get_pool,
+    _sampler,
+    generate_daily_plans,
+    iter_plan_days,
+    shutdown_pool,
+    solve_plan_days,
+    stream_daily_plans,
+)
+
+
+TARGET = (120.0, 220.0, 60.0, 1900.0)
+CATEGORIES = ("breakfast", "lunch", "dinner")
+
+
+def _catalog(n: int = 60, seed: int = 0, weights: np.ndarray | None = None) -> DishIndex:
+    """Global templates with random macros; ids 1..n per category block."""
+    rng = np.random.default_rng(seed)
+    index = DishIndex() if weights is None else DishIndex(weights)
+    template_id = 1
+    for category in CATEGORIES:
+        for _ in range(n):
+            protein, carbs, fats = rng.uniform([5, 10, 3], [60, 120, 40])
+            index.upsert(template_id, category, None, (protein, carbs, fats, 4 * protein + 4 * carbs + 9 * fats))
+            template_id += 1
+    return index
+
+
+def _picks(solutions) -> list[list[int]]:
+    return [[choice.template_id for choice in solution.choices] for solution in solutions]
+
+
+def test_sampled_days_follow_removed_templates():
+    index = _catalog()
+    first = solve_plan_days(index, TARGET, 5, CATEGORIES, workers=1, candidate_source="sampled")
+
+    removed = {template_id for day in _picks(first) for template_id in day}
+    for template_id in removed:
+        index.remove(template_id)
+    second = solve_plan_days(index, TARGET, 5, CATEGORIES, workers=1, candidate_source="sampled")
+
+    assert len(second) == 5
+    assert not {template_id for day in _picks(second) for template_id in day} & removed
+
+
+def test_stream_is_unaffected_by_concurrent_removal():
+    index = _catalog()
+    days = iter_plan_days(index, TARGET, 6, CATEGORIES, candidate_source="sampled")
+    solved = [next(days)]
+    for template_id in range(1, 181, 2):
+        index.remove(template_id)
+    solved.extend(days)
+
+    assert [offset for offset, _ in solved] == list(range(6))
+
+
+def test_sampler_is_rebuilt_after_index_changes():
+    index = _catalog()
+    sampler = _sampler(index)
+    assert _sampler(index) is sampler
+
+    index.remove(1)
+    rebuilt = _sampler(index)
+    assert rebuilt is not sampler
+    rng = np.random.default_rng(0)
+    assert 1 not in rebuilt.sample_many("breakfast", 600.0, 50, rng)
+
+
+@pytest.mark.parametrize("weights", [None, np.array([1.0, 1.0, 1.0, 20.0])])
+def test_pool_matches_in_process(weights):
+    index = _catalog(weights=weights)
+    # No wall-clock budget - a busy worker must not change the result
+    config = SolverConfig(time_budget=None)
+    serial = solve_plan_days(index, TARGET, 21, CATEGORIES, config=config, workers=1)
+    try:
+        pooled = solve_plan_days(index, TARGET, 21, CATEGORIES, config=config, workers=2)
+        again = solve_plan_days(index, TARGET, 21, CATEGORIES, config=config, workers=2)
+    finally:
+        shutdown_pool()
+
+    assert _picks(pooled) == _picks(serial) == _picks(again)
+
+
+def test_pool_has_the_requested_size():
+    try:
+        assert _get_pool(1)._max_workers == 1
+        assert _get_pool(2)._max_workers == 2
+        assert _get_pool(1) is _get_pool(1)
+    finally:
+        shutdown_pool()
+
+
+def test_variety_window_spans_chunk_boundaries():
+    solutions = solve_plan_days(_catalog(), TARGET, 21, CATEGORIES, workers=1, chunk_days=4)
+
+    picks = _picks(solutions)
+    for previous, day in zip(picks, picks[1:]):
+        assert not set(previous) & set(day)
+
+
+def test_concurrent_plans_only_use_own_templates():
+    index = _catalog(20)
+    # Private templates that fit the target far better than any global one
+    for user_id, first_id in ((1, 1000), (2, 2000)):
+        for offset, category in enumerate(CATEGORIES):
+            index.upsert(first_id + offset, category, user_id, (40.0, 73.0, 20.0, 632.0))
+
+    def plan(user_id):
+        return solve_plan_days(index, TARGET, 14, CATEGORIES, user_id=user_id, workers=1, variety_window=0)
+
+    with ThreadPoolExecutor(4) as threads:
+        plans = list(threads.map(plan, [1, 2] * 8))
+
+    for user_id, solutions in zip([1, 2] * 8, plans):
+        private = {choice.template_id for solution in solutions for choice in solution.choices} - set(range(1, 61))
+        assert private == {user_id * 1000 + offset for offset in range(len(CATEGORIES))}
+
+
+@pytest.fixture
+def plan(db, user, ingredients) -> DietPlan:
+    """Plan na 3 dni i kilka szablonów w każdej kategorii."""
+    invalidate_dish_index()
+    for category in CATEGORIES:
+        for name, grams in (("rice", 150), ("chicken", 120), ("oil", 10)):
+            template = MealTemplate(name=f"{category} {name}", category=category)
+            template.template_ingredients.append(
+                MealTemplateIngredient(ingredient=ingredients[name], quantity=grams)
+            )
+            template.calculate_nutrition()
+            db.add(template)
+    plan = DietPlan(
+        user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=date(2026, 3, 1),
+        date_to=date(2026, 3, 3), meals_per_day=3, target_calories=1900,
+    )
+    db.add(plan)
+    db.commit()
+    yield plan
+    invalidate_dish_index()
+
+
+def test_generate_fills_every_day(db, plan):
+    ids = generate_daily_plans(db, plan, *TARGET[:3], categories=CATEGORIES, workers=1)
+
+    dates = db.execute(select(DailyPlan.date).where(DailyPlan.id.in_(ids))).scalars().all()
+    assert dates == [date(2026, 3, 1), date(2026, 3, 2), date(2026, 3, 3)]
+    meals = db.scalar(select(func.count()).select_from(Meal).where(Meal.daily_plan_id.in_(ids)))
+    assert meals == 3 * len(CATEGORIES)
+
+
+def _stream(session, plan_id):
+    return stream_daily_plans(
+        session, session.get(DietPlan, plan_id), *TARGET[:3], categories=CATEGORIES, variety_window=0, batch_days=1,
+    )
+
+
+def test_concurrent_stream_stops_on_saved_days(db, plan):
+    first = _stream(db, plan.id)
+    while next(first)["event"] != "saved":
+        pass
+
+    # Drugi strumień kontynuuje od dnia 1 i zapisuje resztę
+    with SessionLocal() as other:
+        events = [event["event"] for event in _stream(other, plan.id)]
+    assert events == ["start", "day", "saved", "day", "saved", "done"]
+
+    assert [event["event"] for event in first] == ["day", "conflict"]
+    dates = db.execute(select(DailyPlan.date).where(DailyPlan.diet_plan_id == plan.id)).scalars().all()
+    assert sorted(dates) == [date(2026, 3, 1), date(2026, 3, 2), date(2026, 3, 3)]
+
+
+def test_generate_refuses_plan_with_days(db, plan):
+    generate_daily_plans(db, plan, *TARGET[:3], categories=CATEGORIES, workers=1)
+
+    with pytest.raises(ValueError, match="already has days"):
+        generate_daily_plans(db, plan, *TARGET[:3], categories=CATEGORIES, workers=1)
+    assert db.scalar(select(func.count()).select_from(DailyPlan)) == 3
+
+
+def test_day_date_is_unique_per_plan(db, plan):
+    for _ in range(2):
+        db.add(DailyPlan(
+            diet_plan_id=plan.id, date=date(2026, 3, 1), target_calories=1900, target_protein=120,
+            target_carbs=220, target_fats=60,
+        ))
+    with pytest.raises(IntegrityError):
+        db.commit()
+
+
+def test_generate_endpoint_streams_ndjson(client, plan):
+    response = client.post(
+        f"/diet-plans/{plan.id}/generate",
+        json={"target_protein": 120, "target_carbs": 220, "target_fats": 60, "categories": list(CATEGORIES)},
+    )
+
+    assert response.status_code == 200
+    events = [json.loads(line)["event"] for line in response.text.splitlines()]
+    assert events == ["start", "day", "day", "day", "saved", "done"]
+
+
+@pytest.mark.parametrize("shares, detail", [
+    ([0.5, 0.5], "Expected 3 shares"),
+    ([0.5, 0.7, -0.2], "non-negative"),
+    ([0, 0, 0], "not all zero"),
+])
+def test_generate_with_invalid_shares_is_400(client, db, plan, shares, detail):
+    response = client.post(
+        f"/diet-plans/{plan.id}/generate",
+        json={"target_protein": 120, "target_carbs": 200, "target_fats": 60, "shares": shares},
+    )
+
+    assert response.status_code == 400
+    assert detail in response.json()["detail"]
@@ -0,0 +1,55 @@
+import itertools
+import time
+
+import numpy as np
+
+from services.plan_solver import SlotCandidates, SolverConfig, solve_day
+
+
+TARGET = (120.0, 220.0, 60.0, 1900.0)
+
+
+def _slots(n: int = 40, seed: int = 0) -> list[SlotCandidates]:
+    rng = np.random.default_rng(seed)
+    slots = []
+    for i, category in enumerate(("breakfast", "lunch", "dinner", "snack")):
+        macros = rng.uniform([5, 10, 3], [60, 120, 40], size=(n, 3))
+        calories = macros @ np.array([4.0, 4.0, 9.0])
+        slots.append(SlotCandidates(category, np.arange(n) + i * n, np.column_stack([macros, calories])))
+    return slots
+
+
+def _slow_clock(monkeypatch) -> None:
+    # Every clock read 100 s later - any budget runs out at the first check
+    clock = itertools.count(step=100.0)
+    monkeypatch.setattr(time, "perf_counter", lambda: next(clock))
+
+
+def test_exhausted_budget_marks_solution_truncated(monkeypatch):
+    config = SolverConfig(good_enough=0.0, time_budget=10.0)
+    fast = solve_day(TARGET, _slots(), config, seed=3)
+    assert not fast.truncated and fast.nodes > 0
+
+    _slow_clock(monkeypatch)
+    slow = solve_day(TARGET, _slots(), config, seed=3)
+
+    assert slow.truncated
+    assert slow.nodes < fast.nodes
+
+
+def test_without_budget_result_does_not_depend_on_machine_speed(monkeypatch):
+    config = SolverConfig(time_budget=None)
+    fast = solve_day(TARGET, _slots(), config, seed=3)
+
+    _slow_clock(monkeypatch)
+    slow = solve_day(TARGET, _slots(), config, seed=3)
+
+    assert slow == fast
+    assert slow.method == "branch_and_bound" and not slow.truncated
+
+
+def test_node_limit_zero_keeps_greedy():
+    solution = solve_day(TARGET, _slots(), SolverConfig(node_limit=0, polish_rounds=0))
+
+    assert solution.method == "greedy"
+    assert solution.nodes == 0
@@ -0,0 +1,87 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import SessionLocal, engine
+from models import DailyPlan, Meal
+from services.diet_planner import DietManager
+from services.nutrition_recompute import verify_nutrition
+from services.plan_unit_of_work import PlanUnitOfWork
+
+
+class PlanUser:
+    """Minimal user object DietManager works on."""
+
+    def __init__(self, id: int) -> None:
+        self.id = id
+        self.diet_plan = None
+        self.finished_diet_plans = None
+
+
+MEAL = {"name": "lunch", "calories": 500, "macros": {"protein": 40, "carbohydrates": 50, "total fat": 15}}
+
+
+def _create_plan(user) -> PlanUnitOfWork:
+    manager = DietManager(PlanUser(user.id))
+    with PlanUnitOfWork(manager) as uow:
+        manager.create_diet("lose", "2026-03-01", 2, 3)
+        manager.add_day_plan("2026-03-01", 1800, {"protein": 120, "carbohydrates": 180, "total fat": 60})
+        manager.add_meal("2026-03-01", MEAL)
+    return uow
+
+
+def test_flushed_plan_passes_verifier(db, user):
+    uow = _create_plan(user)
+
+    report = verify_nutrition(db, fix=True)
+    db.commit()
+
+    assert not report.has_drift
+    day = db.get(DailyPlan, uow.day_ids["2026-03-01"])
+    assert day.actual_calories == 500
+    assert day.actual_protein == 40
+    assert [meal.calories for meal in day.meals] == [500]
+
+
+def test_reload_keeps_stored_sodium_and_cholesterol(db, user):
+    uow = _create_plan(user)
+    day = db.get(DailyPlan, uow.day_ids["2026-03-01"])
+    day.actual_sodium, day.actual_cholesterol = 300.0, 320.0
+    db.commit()
+
+    manager = DietManager(PlanUser(user.id))
+    reloaded = PlanUnitOfWork.load(manager, uow.plan_id)
+    manager.update_meal("2026-03-01", "lunch", {"calories": 450})
+    reloaded.commit()
+
+    db.expire_all()
+    day = db.get(DailyPlan, uow.day_ids["2026-03-01"])
+    assert day.actual_calories == 450
+    assert (day.actual_sodium, day.actual_cholesterol) == (300.0, 320.0)
+
+
+class FailingCommitSession(Session):
+    def commit(self) -> None:
+        raise RuntimeError("commit failed")
+
+
+def test_failed_commit_keeps_changes_pending(db, user):
+    manager = DietManager(PlanUser(user.id))
+    uow = PlanUnitOfWork(manager, session_factory=sessionmaker(bind=engine, class_=FailingCommitSession))
+    manager.create_diet("maintain", "2026-03-01", 1, 3)
+    manager.add_day_plan("2026-03-01", 2000)
+    manager.add_meal("2026-03-01", MEAL)
+
+    with pytest.raises(RuntimeError):
+        uow.flush()
+    assert uow.plan_id is None
+    assert not uow.day_ids and not uow.meal_ids
+    assert uow.pending == 3
+
+    uow.session_factory = SessionLocal
+    uow.flush()
+    meal_id = uow.meal_ids[("2026-03-01", 0)]
+    assert db.scalar(select(Meal.daily_plan_id).where(Meal.id == meal_id)) == uow.day_ids["2026-03-01"]
+    assert db.get(DailyPlan, uow.day_ids["2026-03-01"]).date == date(2026, 3, 1)
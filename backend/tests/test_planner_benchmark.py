@@ -0,0 +1,15 @@
+from services.planner_benchmark import STRATEGIES, run_benchmark
+
+
+def test_benchmark_reports_every_strategy():
+    report = run_benchmark([200], users=3, days=2, profiles=1, memory_users=1)
+
+    strategies = report["catalogs"][0]["strategies"]
+    assert set(strategies) == set(STRATEGIES)
+    for result in strategies.values():
+        assert result["days"] == 6
+        assert result["truncated_days"] == 0
+    # Trzech użytkowników z jednego profilu - przynajmniej jeden plan z cache
+    cache = strategies["cached"]["cache"]
+    assert cache["hits"] + cache["misses"] == 3
+    assert cache["hits"] > 0
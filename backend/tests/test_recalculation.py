@@ -0,0 +1,153 @@
+import importlib
+import threading
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from config import settings
+from models import DailyPlan, DietGoal, DietPlan, Meal, MealIngredient, PhysicalData
+from services import recalculation
+from services.nutrition_recompute import recompute_diet_plan
+from services.recalculation import DONE, RecalculationQueue, daily_targets, recalculate_user, refit_days
+
+
+def _meal(ingredients, order: int, items, eaten: bool = False) -> Meal:
+    meal = Meal(name=f"Meal {order}", meal_order=order, is_eaten=eaten)
+    for name, quantity in items:
+        meal.meal_ingredients.append(MealIngredient(ingredient=ingredients[name], quantity=quantity))
+    return meal
+
+
+@pytest.fixture
+def plan(db, user, ingredients) -> DietPlan:
+    """Plan od wczoraj na 4 dni; w każdym dniu jeden zjedzony i dwa niezjedzone posiłki."""
+    today = date.today()
+    plan = DietPlan(
+        user_id=user.id, name="Plan", goal=DietGoal.MAINTENANCE, date_from=today - timedelta(days=1),
+        date_to=today + timedelta(days=2), meals_per_day=3, target_calories=1500,
+    )
+    for offset in range(4):
+        day = DailyPlan(date=plan.date_from + timedelta(days=offset), target_calories=1500, target_protein=80,
+                        target_carbs=150, target_fats=50, is_completed=offset == 2)
+        day.meals.extend([
+            _meal(ingredients, 0, [("rice", 100)], eaten=True),
+            _meal(ingredients, 1, [("chicken", 150), ("rice", 150)]),
+            _meal(ingredients, 2, [("chicken", 100), ("oil", 10)]),
+        ])
+        plan.daily_plans.append(day)
+    db.add(plan)
+    db.commit()
+    recompute_diet_plan(db, plan.id)
+    db.commit()
+    return plan
+
+
+def _quantities(db, day: DailyPlan) -> list[list[float]]:
+    db.expire_all()
+    return [[item.quantity for item in meal.meal_ingredients] for meal in day.meals]
+
+
+def test_refit_days_rescales_only_uneaten_meals(db, plan):
+    day = plan.daily_plans[1]
+    before = _quantities(db, day)
+    calories_before = day.actual_calories_exact
+    target = (150.0, 250.0, 70.0, 2230.0)
+
+    meals = refit_days(db, {day.id: target})
+    db.commit()
+
+    after = _quantities(db, day)
+    assert meals == 2
+    assert after[0] == before[0]
+    for meal, old, new in zip(day.meals[1:], before[1:], after[1:]):
+        ratio = new[0] / old[0]
+        assert ratio > 1.0
+        assert new == pytest.approx([quantity * ratio for quantity in old])
+        assert meal.scale_factor == pytest.approx(ratio)
+    assert (day.target_protein, day.target_carbs, day.target_fats, day.target_calories) == (150, 250, 70, 2230)
+    # Dzień bliżej celu, sumy przeliczone z nowych ilości
+    assert abs(day.actual_calories_exact - 2230) < abs(calories_before - 2230)
+    assert day.actual_calories_exact == pytest.approx(sum(meal.calories for meal in day.meals))
+
+
+def test_recalculate_user_updates_future_open_days(db, user, plan):
+    db.add(PhysicalData(user_id=user.id, weight=90, activity_level="very"))
+    db.commit()
+    before = {day.id: _quantities(db, day) for day in plan.daily_plans}
+
+    recalculate_user(user.id, batch_days=1)
+
+    db.expire_all()
+    protein, carbs, fats, calories = daily_targets(user, db.scalars(select(PhysicalData)).one(), plan.goal)
+    past, today, completed, tomorrow = plan.daily_plans
+    assert plan.target_calories == round(calories)
+    for day in (today, tomorrow):
+        assert (day.target_protein, day.target_carbs, day.target_fats) == pytest.approx((protein, carbs, fats))
+        assert _quantities(db, day)[1:] != before[day.id][1:]
+        assert _quantities(db, day)[0] == before[day.id][0]
+    for day in (past, completed):
+        assert day.target_calories == 1500
+        assert _quantities(db, day) == before[day.id]
+
+
+def test_queue_coalesces_queued_jobs():
+    queue = RecalculationQueue()
+
+    first = queue.submit(1)
+    assert queue.submit(1) is first
+    queue.submit(2)
+
+    assert first.requests == 2
+    assert len(queue) == 2
+    assert queue.status(1) is first
+
+
+def test_one_user_is_never_processed_twice_at_once(monkeypatch):
+    queue = RecalculationQueue()
+    running: dict[int, int] = {}
+    overlaps: list[int] = []
+    started = threading.Event()
+    release = threading.Event()
+    lock = threading.Lock()
+
+    def fake_recalculate(user_id, batch_days, job):
+        with lock:
+            running[user_id] = running.get(user_id, 0) + 1
+            if running[user_id] > 1:
+                overlaps.append(user_id)
+        started.set()
+        release.wait(5)
+        with lock:
+            running[user_id] -= 1
+
+    monkeypatch.setattr(recalculation, "recalculate_user", fake_recalculate)
+    stop = queue.start_workers(3, interval=0.01)
+    try:
+        first = queue.submit(1)
+        assert started.wait(5)
+        # The running job is not joined - a new one waits for it
+        second = queue.submit(1)
+        assert second is not first and second.status == recalculation.QUEUED
+        other = queue.submit(2)
+        release.set()
+        assert queue.join(5)
+    finally:
+        stop.set()
+
+    assert overlaps == []
+    assert [first.status, second.status, other.status] == [DONE, DONE, DONE]
+    assert second.started_at >= first.finished_at
+
+
+def test_workers_start_with_the_app(db):
+    before = set(threading.enumerate())
+
+    def started() -> list[threading.Thread]:
+        return [thread for thread in set(threading.enumerate()) - before if thread.name.startswith("recalculation-")]
+
+    main = importlib.reload(importlib.import_module("main"))
+    assert started() == []
+    with TestClient(main.app):
+        assert len(started()) == settings.recalculation_workers
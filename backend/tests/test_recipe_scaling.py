@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from models import IngredientUnit, MealTemplate, MealTemplateIngredient
+from services.dish_index import FEATURE_WEIGHTS
+from services.plan_solver import bounded_lstsq
+from services.recipe_scaling import RecipeBook, scale_recipes
+
+
+def _book(seed: int = 0, sizes: tuple[int, ...] = (4, 2, 3, 1)) -> RecipeBook:
+    """Losowe szablony o różnej liczbie składników, dopełnione do najdłuższego."""
+    rng = np.random.default_rng(seed)
+    T, J = len(sizes), max(sizes)
+    ingredient_ids = np.zeros((T, J), dtype=np.int64)
+    contributions = np.zeros((T, J, 4))
+    lo, hi = np.ones((T, J)), np.ones((T, J))
+    for t, n in enumerate(sizes):
+        ingredient_ids[t, :n] = np.arange(1, n + 1) + 10 * t
+        macros = rng.uniform([0, 0, 0], [30, 60, 20], size=(n, 3))
+        contributions[t, :n] = np.column_stack([macros, macros @ [4.0, 4.0, 9.0]])
+        lo[t, :n], hi[t, :n] = 0.5, 2.0
+    return RecipeBook(
+        np.arange(1, T + 1), ["lunch"] * T, ingredient_ids, ingredient_ids * 10.0,
+        [["g"] * n for n in sizes], contributions, lo, hi,
+    )
+
+
+def _reference(book: RecipeBook, targets: np.ndarray, shape_penalty: float = 100.0) -> np.ndarray:
+    """bounded_lstsq osobno dla każdej pary (użytkownik, szablon)."""
+    A = (book.contributions * FEATURE_WEIGHTS).transpose(0, 2, 1)
+    return np.array([
+        [
+            bounded_lstsq(A[t], target * FEATURE_WEIGHTS, book.min_scale[t], book.max_scale[t], shape_penalty)
+            for t in range(len(book))
+        ]
+        for target in targets
+    ])
+
+
+@pytest.fixture
+def templates(db, ingredients) -> list[MealTemplate]:
+    """Dwa szablony o różnej liczbie składników (drugi dopełniany zerami)."""
+    ingredients["rice"].units.append(IngredientUnit(unit_name="cup", gram_equivalent=195))
+    bowl = MealTemplate(name="Chicken bowl", category="lunch")
+    for name, quantity, unit in (("chicken", 150, "g"), ("rice", 1, "cup"), ("oil", 10, "g")):
+        bowl.template_ingredients.append(
+            MealTemplateIngredient(ingredient=ingredients[name], quantity=quantity, unit=unit)
+        )
+    rice = MealTemplate(name="Rice", category="dinner")
+    rice.template_ingredients.append(MealTemplateIngredient(ingredient=ingredients["rice"], quantity=200))
+    db.add_all([bowl, rice])
+    db.commit()
+    return [bowl, rice]
+
+
+def test_contributions_match_ingredient_totals(db, templates):
+    book = RecipeBook.from_session(db)
+
+    assert book.contributions.shape == (2, 3, 4)
+    for t, template in enumerate(templates):
+        for j, item in enumerate(template.template_ingredients):
+            np.testing.assert_allclose(
+                book.contributions[t, j],
+                [item.total_protein, item.total_carbs, item.total_fat, item.total_calories],
+            )
+    # Dopełnienie: zerowy wkład, skala przypięta do 1
+    np.testing.assert_array_equal(book.contributions[1, 1:], 0)
+    assert book.ingredient_ids[1, 1:].tolist() == [0, 0]
+    assert book.min_scale[1, 1:].tolist() == book.max_scale[1, 1:].tolist() == [1.0, 1.0]
+
+
+def test_batched_inverse_matches_bounded_lstsq():
+    book = _book()
+    # Od połowy do trzykrotności typowego posiłku - część par poza przedziałem skal
+    targets = np.array([30.0, 60.0, 15.0, 495.0]) * np.linspace(0.5, 3.0, 9)[:, None]
+
+    scaled = scale_recipes(book, np.arange(9), targets, user_chunk=4)
+
+    expected = _reference(book, targets)
+    np.testing.assert_allclose(scaled.scales, expected, atol=1e-4)
+    padding = book.ingredient_ids == 0
+    at_bounds = (np.isclose(expected, book.min_scale) | np.isclose(expected, book.max_scale)) & ~padding
+    # Obie ścieżki: optimum bez ograniczeń i poprawka bounded_lstsq
+    assert at_bounds.any(axis=2).any() and not at_bounds.any(axis=2).all()
+    # Kolumny dopełnienia zawsze przypięte do 1
+    np.testing.assert_array_equal(scaled.scales[:, padding], 1.0)
+    np.testing.assert_allclose(
+        scaled.totals, np.einsum("utj,tjm->utm", expected, book.contributions), rtol=1e-4, atol=1e-3
+    )
+
+
+def test_targets_per_category():
+    book = _book()
+    book.categories = ["breakfast", "lunch", "lunch", "breakfast"]
+    breakfast, lunch = np.array([[20.0, 40.0, 10.0, 330.0]]), np.array([[40.0, 80.0, 20.0, 660.0]])
+
+    scaled = scale_recipes(book, [7], {"breakfast": breakfast, "lunch": lunch})
+
+    expected = _reference(book, np.array([lunch[0]]))
+    np.testing.assert_allclose(scaled.scales[0, 1:3], expected[0, 1:3], atol=1e-4)
+    expected = _reference(book, np.array([breakfast[0]]))
+    np.testing.assert_allclose(scaled.scales[0, [0, 3]], expected[0, [0, 3]], atol=1e-4)
+
+
+def test_fixed_ingredient_keeps_its_quantity(db, ingredients, templates):
+    bowl = templates[0]
+    book = RecipeBook.from_session(db, limits={(bowl.id, ingredients["oil"].id): (1.0, 1.0)})
+
+    scaled = scale_recipes(book, [1], np.array([[60.0, 70.0, 15.0, 650.0]]))
+
+    recipe = dict((ingredient_id, quantity) for ingredient_id, quantity, _ in scaled.recipe(1, bowl.id))
+    assert recipe[ingredients["oil"].id] == pytest.approx(10.0)
+    assert recipe[ingredients["chicken"].id] != pytest.approx(150.0)
+    assert [unit for _, _, unit in scaled.recipe(1, bowl.id)] == ["g", "cup", "g"]
+    assert scaled.nutrition(1, bowl.id)["calories"] == pytest.approx(float(scaled.totals[0, 0, 3]))
+    with pytest.raises(KeyError):
+        scaled.recipe(2, bowl.id)
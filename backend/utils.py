@@ -14,6 +14,11 @@ def log_info(message: str):
     print(f"[INFO {now}]: {message}")
 
 
+def log_error(message: str):
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    print(f"[ERROR {now}]: {message}")
+
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 